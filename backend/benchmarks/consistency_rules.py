@@ -0,0 +1,78 @@
+"""
+Evaluate drafts against a generated rule set, comparing the indexed engine with checking every rule.
+
+    python -m backend.benchmarks.consistency_rules [--rules 5000] [--answers 40] [--iterations 2000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from backend import models
+from backend.services.consistency_rules import RuleContext, RuleEngine
+
+
+def generate_rules(count: int, fields: int):
+    rules = []
+    for idx in range(count):
+        first, second = f"field_{idx % fields}", f"field_{(idx * 7 + 3) % fields}"
+        rules.append(
+            {
+                "id": f"rule-{idx}",
+                "message": f"Inconsistent {first} / {second}",
+                "when": [
+                    {"field": first, "in": ["absent", "not seen"]},
+                    {"field": second, "not_in": ["no", "none", "normal"]},
+                ],
+            }
+        )
+    return {"version": 1, "modalities": {"*": rules}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=5000)
+    parser.add_argument("--fields", type=int, default=2000)
+    parser.add_argument("--answers", type=int, default=40)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rules.json")
+        with open(path, "w") as f:
+            json.dump(generate_rules(args.rules, args.fields), f)
+        started = time.perf_counter()
+        engine = RuleEngine(path, reload_interval=0)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(7)
+    drafts = [
+        {f"field_{rng.randrange(args.fields)}": rng.choice(["absent", "normal", "present"]) for _ in range(args.answers)}
+        for _ in range(100)
+    ]
+    patient = models.Patient(full_name="Bench", sex="Female")
+    index = engine.index_for(models.ModalityEnum.ABDOMINAL_ULTRASOUND)
+
+    def linear(answers):
+        ctx = RuleContext(answers, "female")
+        return [rule.message for rule in index.rules if rule.matches(ctx)]
+
+    def indexed(answers):
+        return engine.evaluate(answers, patient, models.ModalityEnum.ABDOMINAL_ULTRASOUND)
+
+    for draft in drafts:
+        assert linear(draft) == indexed(draft)
+
+    print(f"{args.rules} rules compiled in {compile_ms:.1f} ms")
+    for name, fn in (("all rules", linear), ("indexed", indexed)):
+        started = time.perf_counter()
+        for i in range(args.iterations):
+            fn(drafts[i % len(drafts)])
+        per_draft_us = (time.perf_counter() - started) / args.iterations * 1e6
+        print(f"{name:10} {per_draft_us:10.1f} us/draft")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Time a cold `import backend.main` in fresh interpreters and fail if start-up regresses.
+
+    python -m backend.benchmarks.import_time [--runs 5] [--budget-ms 1200]
+
+Exits non-zero when the median import time exceeds the budget or when a module that should
+only load on first use (OpenAI SDK, reportlab, qrcode, passlib, jose) is imported eagerly.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+LAZY_MODULES = ("openai", "reportlab", "qrcode", "passlib", "jose")
+
+PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import backend.main\n"
+    "elapsed = time.perf_counter() - started\n"
+    "print(json.dumps({'ms': elapsed * 1000, 'modules': sorted(m for m in sys.modules if '.' not in m)}))\n"
+)
+
+
+def measure_once() -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def eager_lazy_modules(modules) -> list:
+    return [name for name in LAZY_MODULES if name in modules]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1200.0)
+    args = parser.parse_args(argv)
+
+    samples = [measure_once() for _ in range(args.runs)]
+    timings = [sample["ms"] for sample in samples]
+    median = statistics.median(timings)
+    eager = eager_lazy_modules(samples[-1]["modules"])
+
+    print(f"import backend.main: median {median:.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms")
+    print(f"budget {args.budget_ms:.0f} ms")
+    failed = False
+    if eager:
+        print(f"FAIL: imported at start-up but should load lazily: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Compare rows/bytes fetched per request for the full-entity queries the read endpoints used to run
+against the lean projections in backend.queries.
+
+    python -m backend.benchmarks.read_projections [--studies 500] [--images 200]
+"""
+import argparse
+import sqlite3
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker, undefer
+from sqlalchemy.pool import StaticPool
+
+from backend import models, queries
+from backend.database import Base
+
+
+class FetchMeter:
+    """
+    Counts rows and approximate payload bytes as SQLAlchemy fetches them from the sqlite3 cursor,
+    so every statement runs exactly once. Use connect as the engine's creator.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rows = self.bytes = self.statements = 0
+
+    def _record(self, rows):
+        self.rows += len(rows)
+        self.bytes += sum(len(str(value)) for row in rows for value in row if value is not None)
+
+    def connect(self) -> sqlite3.Connection:
+        meter = self
+
+        class MeteredCursor(sqlite3.Cursor):
+            def execute(self, *args):
+                if args[0].lstrip().upper().startswith("SELECT"):
+                    meter.statements += 1
+                return super().execute(*args)
+
+            def fetchone(self):
+                row = super().fetchone()
+                if row is not None:
+                    meter._record([row])
+                return row
+
+            def fetchmany(self, *args):
+                rows = super().fetchmany(*args)
+                meter._record(rows)
+                return rows
+
+            def fetchall(self):
+                rows = super().fetchall()
+                meter._record(rows)
+                return rows
+
+        class MeteredConnection(sqlite3.Connection):
+            def cursor(self, factory=MeteredCursor):
+                return super().cursor(factory)
+
+        return sqlite3.connect(":memory:", factory=MeteredConnection, check_same_thread=False)
+
+
+def seed(db: Session, studies: int, images: int) -> None:
+    user = models.User(email="bench@example.com", full_name="Bench", hashed_password="x")
+    patient = models.Patient(full_name="Bench Patient", nhi="BENCH01", dob=date(1970, 1, 1), sex="Female")
+    db.add_all([user, patient])
+    db.flush()
+    for idx in range(studies):
+        study = models.Study(
+            patient_id=patient.id,
+            radiologist_id=user.id,
+            modality=models.ModalityEnum.CHEST_XRAY,
+            study_datetime=datetime.utcnow(),
+        )
+        db.add(study)
+        db.flush()
+        db.add_all(
+            models.StudyFile(study_id=study.id, filename=f"image_{n:05d}.dcm", location=f"./uploads/{idx}/image_{n:05d}.dcm")
+            for n in range(images)
+        )
+        db.add(
+            models.Report(
+                study_id=study.id,
+                findings="Clear lungs.",
+                impression="Normal chest.",
+                internal_checks=[f"check {n}" for n in range(50)],
+            )
+        )
+    db.commit()
+
+
+def scenarios(db: Session, study_id: int, patient_id: int):
+    # (name, baseline full-entity access, lean access)
+    return [
+        (
+            "study existence check",
+            lambda: db.query(models.Study).options(undefer("*")).filter(models.Study.id == study_id).first(),
+            lambda: queries.row_exists(db, models.Study.id, study_id),
+        ),
+        (
+            "patient existence check",
+            lambda: db.query(models.Patient).filter(models.Patient.id == patient_id).first(),
+            lambda: queries.row_exists(db, models.Patient.id, patient_id),
+        ),
+        (
+            "report study lookup (draft)",
+            lambda: db.query(models.Study).options(undefer("*")).filter(models.Study.id == study_id).first(),
+            lambda: queries.get_study(db, study_id, queries.STUDY_DRAFT_COLUMNS),
+        ),
+        (
+            "report row for draft overwrite",
+            lambda: db.query(models.Report).options(undefer("*")).filter(models.Report.study_id == study_id).first(),
+            lambda: queries.get_report_for_update(db, study_id),
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--studies", type=int, default=500)
+    parser.add_argument("--images", type=int, default=200)
+    args = parser.parse_args()
+
+    meter = FetchMeter()
+    engine = create_engine("sqlite://", creator=meter.connect, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+    with SessionLocal() as db:
+        seed(db, args.studies, args.images)
+        study_id = args.studies // 2
+        patient_id = db.query(models.Patient.id).scalar()
+
+    print(f"{'scenario':40} {'rows':>11} {'bytes before':>13} {'bytes after':>12}")
+    with SessionLocal() as db:
+        for name, baseline, lean in scenarios(db, study_id, patient_id):
+            results = []
+            for fn in (baseline, lean):
+                db.expunge_all()
+                meter.reset()
+                fn()
+                results.append((meter.rows, meter.bytes))
+            (rows_before, bytes_before), (rows_after, bytes_after) = results
+            print(f"{name:40} {rows_before:>5}->{rows_after:<5} {bytes_before:>13} {bytes_after:>12}")
+
+
+if __name__ == "__main__":
+    main()
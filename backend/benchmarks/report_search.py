@@ -0,0 +1,112 @@
+"""
+Compare the FTS5 report search against an ILIKE scan over findings and impressions.
+
+    python -m backend.benchmarks.report_search [--reports 200000] [--queries 50]
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+from backend.database import Base
+from backend.services import report_search
+
+VOCABULARY = (
+    "liver spleen kidney pancreas gallbladder lung pleura heart mediastinum effusion consolidation nodule "
+    "cyst calculus lesion enhancement attenuation echogenic hypoechoic normal unremarkable mild moderate "
+    "severe right left upper lower lobe segment focal diffuse stable interval"
+).split()
+RARE_TERMS = ["pneumothorax", "intussusception", "volvulus", "sarcoidosis", "hamartoma"]
+
+
+def seed(engine, reports: int) -> None:
+    rng = random.Random(3)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.User.__table__),
+            [{"id": 1, "email": "b@x", "full_name": "B", "hashed_password": "x", "role": "radiologist"}],
+        )
+        conn.execute(insert(models.Patient.__table__), [{"id": 1, "full_name": "Bench", "nhi": "BENCH01"}])
+        for start in range(0, reports, 10000):
+            ids = range(start + 1, min(start + 10000, reports) + 1)
+            conn.execute(
+                insert(models.Study.__table__),
+                [
+                    {
+                        "id": i,
+                        "patient_id": 1,
+                        "radiologist_id": 1,
+                        "modality": rng.choice(list(models.ModalityEnum)).name,
+                        "study_datetime": datetime(2020, 1, 1),
+                        "version": 1,
+                    }
+                    for i in ids
+                ],
+            )
+            rows = []
+            for i in ids:
+                words = rng.choices(VOCABULARY, k=60)
+                if rng.random() < 0.001:
+                    words.append(rng.choice(RARE_TERMS))
+                rows.append(
+                    {
+                        "id": i,
+                        "study_id": i,
+                        "findings": " ".join(words[:50]),
+                        "impression": " ".join(words[50:]),
+                        "is_finalized": True,
+                        "version": 1,
+                    }
+                )
+            conn.execute(insert(models.Report.__table__), rows)
+
+
+def timed(fn, queries):
+    started = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - started) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    seed(engine, args.reports)
+    started = time.perf_counter()
+    report_search.rebuild_index(engine)
+    print(f"indexed {args.reports} reports in {time.perf_counter() - started:.1f} s")
+
+    rng = random.Random(5)
+    queries = [rng.choice(RARE_TERMS) for _ in range(args.queries)]
+    filters = report_search.SearchFilters()
+    with Session(engine) as db:
+
+        def fts(q):
+            return report_search.search_reports(db, q, filters)
+
+        def scan(q):
+            like = f"%{q}%"
+            return (
+                db.query(models.Report.id)
+                .filter(models.Report.is_finalized.is_(True))
+                .filter(or_(models.Report.findings.ilike(like), models.Report.impression.ilike(like)))
+                .limit(21)
+                .all()
+            )
+
+        print(f"{'rare term, FTS5 ranked page':32} {timed(fts, queries):8.2f} ms/query")
+        print(f"{'rare term, ILIKE scan (unranked)':32} {timed(scan, queries):8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare list-endpoint throughput for the ORM + orm_mode schema + JSONResponse path the list endpoints
+used to take against the lean column queries rendered with ORJSONResponse.
+
+    python -m backend.benchmarks.serialization [--items 1000] [--runs 50]
+"""
+import argparse
+import time
+from datetime import date, datetime
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models, queries, schemas
+from backend.database import Base
+
+
+def seed(engine, items: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            insert(models.User.__table__),
+            [{"id": 1, "email": "b@x", "full_name": "B", "hashed_password": "x", "role": "radiologist"}],
+        )
+        conn.execute(
+            insert(models.Patient.__table__),
+            [
+                {
+                    "id": n,
+                    "full_name": f"Patient {n}",
+                    "nhi": f"BEN{n:05d}",
+                    "local_patient_id": f"L-{n}",
+                    "dob": date(1970, 1, 1),
+                    "sex": "Female",
+                    "contact_email": f"p{n}@example.com",
+                    "created_at": datetime(2024, 1, 1),
+                }
+                for n in range(1, items + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.Study.__table__),
+            [
+                {
+                    "id": n,
+                    "patient_id": n,
+                    "radiologist_id": 1,
+                    "modality": models.ModalityEnum.CHEST_XRAY,
+                    "region": "Chest",
+                    "clinical_indication": "Cough for two weeks, smoker.",
+                    "study_datetime": datetime(2024, 1, 1, 9, 30),
+                    "status": models.StudyStatus.draft,
+                    "created_at": datetime(2024, 1, 1, 9, 30),
+                }
+                for n in range(1, items + 1)
+            ],
+        )
+        conn.execute(
+            insert(models.StudyFile.__table__),
+            [
+                {"study_id": n, "filename": f"{k}.dcm", "location": f"ab/cd/{n}/{k}.dcm", "file_type": "dicom"}
+                for n in range(1, items + 1)
+                for k in range(2)
+            ],
+        )
+
+
+def scenarios(db: Session):
+    # (name, baseline: ORM rows through the response_model, lean: column rows through orjson)
+    return [
+        (
+            "GET /api/patients",
+            lambda: JSONResponse(
+                jsonable_encoder([schemas.PatientRead.from_orm(p) for p in db.query(models.Patient).all()])
+            ).body,
+            lambda: ORJSONResponse(queries.as_dicts(db.query(*queries.PATIENT_READ_COLUMNS))).body,
+        ),
+        (
+            "GET /api/studies",
+            lambda: JSONResponse(
+                jsonable_encoder([schemas.StudyRead.from_orm(s) for s in queries.study_read_query(db).all()])
+            ).body,
+            lambda: ORJSONResponse(
+                queries.attach_image_paths(db, queries.as_dicts(db.query(*queries.STUDY_READ_COLUMNS)))
+            ).body,
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    seed(engine, args.items)
+
+    print(f"{'endpoint':20} {'before resp/s':>14} {'after resp/s':>13} {'speedup':>8}")
+    with sessionmaker(bind=engine)() as db:
+        for name, baseline, lean in scenarios(db):
+            rates = []
+            for fn in (baseline, lean):
+                fn()
+                start = time.perf_counter()
+                for _ in range(args.runs):
+                    db.expunge_all()
+                    fn()
+                rates.append(args.runs / (time.perf_counter() - start))
+            print(f"{name:20} {rates[0]:>14.1f} {rates[1]:>13.1f} {rates[1] / rates[0]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Operational commands.
+
+    python -m backend.cli migrate
+    python -m backend.cli import-patients patients.csv --batch-size 5000 --errors errors.csv
+    python -m backend.cli migrate-uploads [--dry-run]
+    python -m backend.cli reindex-reports
+    python -m backend.cli rebuild-analytics
+    python -m backend.cli export-reports reports.jsonl.gz --watermark export-state.json [--deid nhi=keep]
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import sys
+
+from backend.database import Base, SessionLocal, engine
+from backend.migrate import migrate
+from backend.services import analytics, patient_import, report_export, report_search, upload_store
+
+logger = logging.getLogger("backend.cli")
+
+
+def _migrate(args) -> int:
+    migrate()
+    return 0
+
+
+def _import_patients(args) -> int:
+    source_format = args.format or ("hl7" if args.path.lower().endswith((".hl7", ".adt")) else "csv")
+    Base.metadata.create_all(bind=engine)
+    error_stream = open(args.errors, "w", newline="", encoding="utf-8") if args.errors else None
+    try:
+        with open(args.path, "r", encoding="utf-8-sig", newline="") as stream, engine.connect() as conn:
+            result = patient_import.import_patients(
+                conn,
+                patient_import.open_reader(source_format, stream),
+                batch_size=args.batch_size,
+                error_stream=error_stream,
+                on_progress=lambda progress: print(
+                    f"\r{progress.processed} processed, {progress.upserted} upserted, {progress.failed} failed",
+                    end="",
+                    file=sys.stderr,
+                    flush=True,
+                ),
+            )
+    finally:
+        if error_stream:
+            error_stream.close()
+    print(file=sys.stderr)
+    print(result.json())
+    return 1 if result.failed else 0
+
+
+def _migrate_uploads(args) -> int:
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        result = asyncio.run(upload_store.migrate_legacy_uploads(db, upload_store.get_upload_store(), dry_run=args.dry_run))
+    print(json.dumps(dataclasses.asdict(result)))
+    return 1 if result.missing else 0
+
+
+def _reindex_reports(args) -> int:
+    Base.metadata.create_all(bind=engine)
+    print(json.dumps({"indexed": report_search.rebuild_index(engine)}))
+    return 0
+
+
+def _rebuild_analytics(args) -> int:
+    Base.metadata.create_all(bind=engine)
+    print(json.dumps({"rows": analytics.rebuild(engine)}))
+    return 0
+
+
+def _export_reports(args) -> int:
+    fmt = args.format or ("parquet" if args.path.endswith(".parquet") else "jsonl")
+    since = None
+    if args.watermark and os.path.exists(args.watermark):
+        with open(args.watermark, "r", encoding="utf-8") as f:
+            since = report_export.Watermark.from_json(json.load(f))
+    try:
+        deidentifier = report_export.Deidentifier(report_export.parse_deid(args.deid))
+    except (ValueError, report_export.ExportUnavailable) as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    Base.metadata.create_all(bind=engine)
+    partial = f"{args.path}.partial"
+    with engine.connect() as conn, open(partial, "wb") as out:
+        result = report_export.export(conn, fmt, deidentifier, since=since, chunk_size=args.chunk_size)
+        for data in result.body:
+            out.write(data)
+    os.replace(partial, args.path)
+    # The watermark only moves once the file is complete, so a failed run is simply repeated.
+    if args.watermark and result.watermark is not None:
+        with open(f"{args.watermark}.partial", "w", encoding="utf-8") as f:
+            json.dump(result.watermark.to_json(), f)
+        os.replace(f"{args.watermark}.partial", args.watermark)
+    watermark = result.watermark.to_json() if result.watermark else None
+    print(json.dumps({"rows": result.rows, "path": args.path, "watermark": watermark}))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.cli")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    schema_cmd = subcommands.add_parser("migrate", help="Create tables, run schema migrations and backfill indexes")
+    schema_cmd.set_defaults(handler=_migrate)
+
+    import_cmd = subcommands.add_parser("import-patients", help="Bulk upsert patients from a CSV or HL7 ADT feed")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--format", choices=["csv", "hl7"], help="defaults to hl7 for .hl7/.adt files, else csv")
+    import_cmd.add_argument("--batch-size", type=int, default=1000)
+    import_cmd.add_argument("--errors", help="write rejected rows to this CSV file")
+    import_cmd.set_defaults(handler=_import_patients)
+
+    migrate_cmd = subcommands.add_parser(
+        "migrate-uploads", help="Move files from the flat upload_dir/<study_id>/ layout into the configured upload store"
+    )
+    migrate_cmd.add_argument("--dry-run", action="store_true", help="report what would move without changing anything")
+    migrate_cmd.set_defaults(handler=_migrate_uploads)
+
+    reindex_cmd = subcommands.add_parser("reindex-reports", help="Rebuild the full-text index of finalized reports")
+    reindex_cmd.set_defaults(handler=_reindex_reports)
+
+    analytics_cmd = subcommands.add_parser(
+        "rebuild-analytics", help="Recompute the turnaround/volume aggregates from studies and reports"
+    )
+    analytics_cmd.set_defaults(handler=_rebuild_analytics)
+
+    export_cmd = subcommands.add_parser(
+        "export-reports", help="Stream finalized reports with study and de-identified patient fields to a file"
+    )
+    export_cmd.add_argument("path", help=".jsonl.gz or .parquet (Parquet needs pyarrow)")
+    export_cmd.add_argument("--format", choices=report_export.FORMATS, help="defaults to parquet for .parquet files")
+    export_cmd.add_argument("--watermark", help="JSON state file: export only reports finalized since, then advance it")
+    export_cmd.add_argument("--deid", help='per-field overrides, e.g. "nhi=keep,dob=drop"; "none" keeps every field')
+    export_cmd.add_argument("--chunk-size", type=int, help="rows per fetch and Parquet row group")
+    export_cmd.set_defaults(handler=_export_reports)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,13 @@
 from functools import lru_cache
-from pydantic import BaseSettings, Field
+from typing import List, Optional
+
+from pydantic import BaseModel, BaseSettings, Field
+
+
+class LLMEndpoint(BaseModel):
+    model: str
+    base_url: Optional[str] = None  # None means the OpenAI API
+    api_key: Optional[str] = None  # defaults to OPENAI_API_KEY
 
 
 class Settings(BaseSettings):
@@ -10,6 +18,42 @@ class Settings(BaseSettings):
     database_url: str = Field("sqlite:///./radiomed.db", env="DATABASE_URL")
     upload_dir: str = Field("./uploads", env="UPLOAD_DIR")
     frontend_origin: str = Field("http://localhost:3000", env="FRONTEND_ORIGIN")
+    qr_cache_size: int = Field(256, env="QR_CACHE_SIZE")
+    qr_cache_dir: str = Field("", env="QR_CACHE_DIR")
+    pdf_sendfile_mode: str = Field("", env="PDF_SENDFILE_MODE")  # "", "x-accel-redirect" or "x-sendfile"
+    pdf_sendfile_prefix: str = Field("/protected-uploads", env="PDF_SENDFILE_PREFIX")
+    consistency_rules_path: str = Field("", env="CONSISTENCY_RULES_PATH")  # file or directory; defaults to backend/rules
+    consistency_rules_reload_seconds: float = Field(5.0, env="CONSISTENCY_RULES_RELOAD_SECONDS")  # 0 disables hot-reload
+    llm_max_prompt_tokens: int = Field(8000, env="LLM_MAX_PROMPT_TOKENS")  # 0 disables the budget
+    # Tried in order; JSON list in the environment, e.g. [{"model": "gpt-4o-mini"}, {"model": "gpt-4o"}]
+    llm_endpoints: List[LLMEndpoint] = Field([LLMEndpoint(model="gpt-4o-mini")], env="LLM_ENDPOINTS")
+    llm_timeout_seconds: float = Field(30.0, env="LLM_TIMEOUT_SECONDS")
+    llm_max_retries: int = Field(2, env="LLM_MAX_RETRIES")
+    llm_retry_base_delay: float = Field(0.5, env="LLM_RETRY_BASE_DELAY")
+    llm_hedge_enabled: bool = Field(True, env="LLM_HEDGE_ENABLED")
+    llm_hedge_min_delay: float = Field(2.0, env="LLM_HEDGE_MIN_DELAY")  # floor for the p95-derived hedge delay
+    llm_breaker_failure_threshold: int = Field(5, env="LLM_BREAKER_FAILURE_THRESHOLD")
+    llm_breaker_reset_seconds: float = Field(30.0, env="LLM_BREAKER_RESET_SECONDS")
+    batch_draft_concurrency: int = Field(4, env="BATCH_DRAFT_CONCURRENCY")
+    # memory:// (single worker), sqlite:///path (one host) or redis://host:port/db
+    shared_state_url: str = Field("memory://", env="SHARED_STATE_URL")
+    draft_rate_limit_per_minute: int = Field(0, env="DRAFT_RATE_LIMIT_PER_MINUTE")  # per user; 0 disables
+    draft_lock_seconds: float = Field(180.0, env="DRAFT_LOCK_SECONDS")
+    idempotency_ttl_seconds: float = Field(86400.0, env="IDEMPOTENCY_TTL_SECONDS")
+    prior_reports_limit: int = Field(3, env="PRIOR_REPORTS_LIMIT")  # prior reports given to the LLM; 0 disables
+    prior_cache_seconds: float = Field(300.0, env="PRIOR_CACHE_SECONDS")
+    prior_cache_depth: int = Field(20, env="PRIOR_CACHE_DEPTH")  # reports cached per patient and modality
+    prior_summary_chars: int = Field(1200, env="PRIOR_SUMMARY_CHARS")
+    # "" stores uploads under UPLOAD_DIR; "s3://bucket/prefix" uses an S3-compatible service (AWS, MinIO, ...)
+    upload_store_url: str = Field("", env="UPLOAD_STORE_URL")
+    s3_endpoint_url: str = Field("https://s3.amazonaws.com", env="S3_ENDPOINT_URL")
+    s3_region: str = Field("us-east-1", env="S3_REGION")
+    s3_access_key: str = Field("", env="S3_ACCESS_KEY")
+    s3_secret_key: str = Field("", env="S3_SECRET_KEY")
+    export_pseudonym_key: str = Field("", env="EXPORT_PSEUDONYM_KEY")  # HMAC key for hashed patient fields
+    export_chunk_size: int = Field(5000, env="EXPORT_CHUNK_SIZE")
+    # Reports finalized more recently are left for the next export; must exceed the longest finalize commit.
+    export_watermark_lag_seconds: float = Field(60.0, env="EXPORT_WATERMARK_LAG_SECONDS")
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,23 @@
+"""
+gunicorn -c backend/gunicorn.conf.py backend.main:app
+
+Needs SHARED_STATE_URL set to sqlite:// or redis:// whenever more than one worker runs.
+"""
+import os
+
+from backend.migrate import migrate
+from backend.serve import check_shared_state, default_workers
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = default_workers()
+worker_class = "uvicorn.workers.UvicornWorker"
+# Drafts wait on the LLM; keep the worker timeout above the gateway's worst case.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    check_shared_state(server.cfg.workers)
+    # Once in the master, not in every worker's lifespan.
+    migrate()
@@ -1,23 +1,44 @@
 import logging
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import text
 
 from backend.config import get_settings
-from backend.database import Base, engine
+from backend.database import engine
 from backend import auth
-from backend.routers import patients, studies, uploads, reports, seed
+from backend.routers import analytics, patients, studies, uploads, reports, seed
+from backend.services import metrics
+from backend.services.consistency_rules import get_rule_engine
+from backend.services.shared_state import get_shared_state
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-# Create tables on startup (ok for SQLite/local dev)
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="AlloyDX Radiomed API")
+def startup() -> None:
+    """Per-worker setup only; schema work runs once beforehand (see backend/migrate.py)."""
+    # Compile consistency rules up front so a broken rule file fails startup rather than a draft.
+    get_rule_engine()
+    os.makedirs(settings.upload_dir, exist_ok=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+
+
+app = FastAPI(title="AlloyDX Radiomed API", lifespan=lifespan, default_response_class=ORJSONResponse)
+app.state.ready = False
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,14 +48,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-if not os.path.exists(settings.upload_dir):
-    os.makedirs(settings.upload_dir, exist_ok=True)
-
 app.include_router(auth.router)
 app.include_router(patients.router)
 app.include_router(studies.router)
 app.include_router(uploads.router)
 app.include_router(reports.router)
+app.include_router(analytics.router)
 app.include_router(seed.router)
 
 app.mount("/static", StaticFiles(directory="backend/static"), name="static")
@@ -43,3 +62,35 @@ app.mount("/static", StaticFiles(directory="backend/static"), name="static")
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/api/health/live")
+async def liveness():
+    """The process is up and serving requests; restart it if this fails."""
+    return {"status": "ok"}
+
+
+@app.get("/api/health/ready")
+def readiness():
+    """Startup has finished and the database and shared state answer; route traffic only when this passes."""
+    checks = {"startup": bool(app.state.ready)}
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["database"] = True
+    except Exception as exc:
+        logger.warning("Readiness: database check failed: %s", exc)
+        checks["database"] = False
+    try:
+        get_shared_state().get("health:ready")
+        checks["shared_state"] = True
+    except Exception as exc:
+        logger.warning("Readiness: shared state check failed: %s", exc)
+        checks["shared_state"] = False
+    ready = all(checks.values())
+    return JSONResponse(status_code=200 if ready else 503, content={"status": "ok" if ready else "unavailable", "checks": checks})
+
+
+@app.get("/api/metrics")
+def read_metrics():
+    return {"counters": metrics.snapshot(), "drafts": metrics.draft_source_ratio()}
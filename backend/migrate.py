@@ -0,0 +1,40 @@
+"""
+One-time schema migrations, index creation and backfills.
+
+Run once per deploy, before any worker starts: `python -m backend.serve` and gunicorn's
+on_starting hook call it themselves; otherwise run `python -m backend.cli migrate`.
+"""
+import logging
+
+from backend.database import Base, engine
+from backend.services import (
+    llm_audit,
+    patient_import,
+    prior_studies,
+    report_export,
+    report_search,
+    study_files,
+    versioning,
+)
+from backend.services.analytics import add_first_finalized_column, rebuild as rebuild_analytics
+
+logger = logging.getLogger(__name__)
+
+
+def migrate() -> None:
+    # Create tables (ok for SQLite/local dev)
+    Base.metadata.create_all(bind=engine)
+    versioning.add_version_columns(engine)
+    add_first_finalized_column(engine)
+    llm_audit.migrate_inline_responses(engine)
+    study_files.migrate_image_paths_column(engine)
+    patient_import.ensure_local_id_index(engine)
+    prior_studies.ensure_index(engine)
+    report_export.ensure_index(engine)
+    # Backfills the search index once for databases that predate it.
+    report_search.rebuild_index(engine, only_if_empty=True)
+    # Likewise backfills the analytics aggregates (see services/analytics.py).
+    rebuild_analytics(engine, only_if_empty=True)
+    # Workers may be forked from this process; don't hand them its pooled connections.
+    engine.dispose()
+    logger.info("Migrations complete")
@@ -3,18 +3,24 @@ from datetime import datetime
 from typing import List, Optional
 
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     Boolean,
     Column,
     Date,
     DateTime,
     Enum,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     JSON,
+    LargeBinary,
     String,
     Text,
+    event,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 
 from backend.database import Base
 
@@ -57,6 +63,17 @@ class Patient(Base):
 
     studies = relationship("Study", back_populates="patient")
 
+    # Patients without an NHI are identified by their local id (the upsert key in services/patient_import.py).
+    __table_args__ = (
+        Index(
+            "uq_patients_local_patient_id_without_nhi",
+            "local_patient_id",
+            unique=True,
+            sqlite_where=nhi.is_(None),
+            postgresql_where=nhi.is_(None),
+        ),
+    )
+
 
 class Study(Base):
     __tablename__ = "studies"
@@ -69,12 +86,43 @@ class Study(Base):
     clinical_indication = Column(Text, nullable=True)
     study_datetime = Column(DateTime, default=datetime.utcnow)
     status = Column(Enum(StudyStatus), default=StudyStatus.draft)
-    image_paths = Column(JSON, default=list)
     created_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     patient = relationship("Patient", back_populates="studies")
     radiologist = relationship("User", back_populates="studies")
     report = relationship("Report", back_populates="study", uselist=False)
+    files = relationship("StudyFile", back_populates="study", order_by="StudyFile.id")
+
+    # Serves the prior-study lookup (services/prior_studies.py).
+    __table_args__ = (Index("ix_studies_patient_modality_datetime", "patient_id", "modality", "study_datetime"),)
+
+    # Updates become compare-and-swap on version (see services/versioning.py).
+    __mapper_args__ = {"version_id_col": version}
+
+    @property
+    def image_paths(self) -> List[str]:
+        """File locations in upload order; kept for StudyRead now that files live in study_files."""
+        return [f.location for f in self.files]
+
+
+class StudyFile(Base):
+    """One uploaded file. Rows are only ever inserted, so concurrent uploads cannot overwrite each other."""
+
+    __tablename__ = "study_files"
+    __table_args__ = (Index("ix_study_files_study_id_id", "study_id", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    study_id = Column(Integer, ForeignKey("studies.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    location = Column(String, nullable=False)
+    file_type = Column(String, nullable=True)
+    content_type = Column(String, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    study = relationship("Study", back_populates="files")
 
 
 class Report(Base):
@@ -85,11 +133,73 @@ class Report(Base):
     technique = Column(Text, nullable=True)
     findings = Column(Text, nullable=True)
     impression = Column(Text, nullable=True)
-    internal_checks = Column(JSON, default=list)
-    raw_llm_response = Column(JSON, nullable=True)
+    internal_checks = deferred(Column(JSON, default=list))
     is_finalized = Column(Boolean, default=False)
     finalized_at = Column(DateTime, nullable=True)
+    # Set by the first finalize and kept through reopen and re-finalize; turnaround analytics count it.
+    first_finalized_at = Column(DateTime, nullable=True)
     pdf_path = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     study = relationship("Study", back_populates="report")
+    llm_responses = relationship("ReportLLMResponse", back_populates="report", lazy="noload")
+
+    # Keyset order for incremental exports (services/report_export.py).
+    __table_args__ = (Index("ix_reports_finalized_at_id", "finalized_at", "id"),)
+    __mapper_args__ = {"version_id_col": version}
+
+
+class ReportLLMResponse(Base):
+    """Compressed raw LLM completions, kept out of the reports table and read only for audit."""
+
+    __tablename__ = "report_llm_responses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, ForeignKey("reports.id"), nullable=False, index=True)
+    codec = Column(String, nullable=False, default="gzip")
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    report = relationship("Report", back_populates="llm_responses")
+
+
+class AnalyticsDaily(Base):
+    """
+    Study volume and turnaround sums per day, modality and radiologist, maintained incrementally by
+    services/analytics.py. Each event lands on the day it happened (creation, first draft, finalize).
+    """
+
+    __tablename__ = "analytics_daily"
+
+    day = Column(Date, primary_key=True)
+    modality = Column(Enum(ModalityEnum), primary_key=True)
+    radiologist_id = Column(Integer, primary_key=True)
+    studies_created = Column(Integer, nullable=False, default=0, server_default="0")
+    drafted = Column(Integer, nullable=False, default=0, server_default="0")
+    finalized = Column(Integer, nullable=False, default=0, server_default="0")
+    # Sums over the drafted / finalized studies counted above; averages are sum / count.
+    create_to_draft_seconds = Column(Float, nullable=False, default=0, server_default="0")
+    draft_to_final_seconds = Column(Float, nullable=False, default=0, server_default="0")
+    create_to_final_seconds = Column(Float, nullable=False, default=0, server_default="0")
+    max_create_to_final_seconds = Column(Float, nullable=False, default=0, server_default="0")
+
+
+# Full-text index over finalized reports, maintained by services/report_search.py.
+# SQLite keeps it in an FTS5 table keyed by report id; Postgres in a GIN-indexed tsvector column on reports.
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS report_search "
+        "USING fts5(findings, impression, tokenize='porter unicode61')"
+    ).execute_if(dialect="sqlite"),
+)
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        "ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector; "
+        "CREATE INDEX IF NOT EXISTS ix_reports_search_vector ON reports USING GIN (search_vector)"
+    ).execute_if(dialect="postgresql"),
+)
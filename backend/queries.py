@@ -0,0 +1,132 @@
+"""
+Lean per-endpoint query projections.
+
+Large JSON columns (Report.internal_checks) are deferred on the models and study files live in their
+own table; endpoints that return them load them explicitly, everything else only fetches what it reads.
+List endpoints skip the ORM and Pydantic entirely: they select plain columns and return the rows as dicts.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Query, Session, load_only, selectinload, undefer
+
+from backend import models
+
+# Columns used to build LLM prompts and report PDFs.
+PATIENT_REPORT_COLUMNS = (
+    models.Patient.id,
+    models.Patient.full_name,
+    models.Patient.nhi,
+    models.Patient.local_patient_id,
+    models.Patient.dob,
+    models.Patient.sex,
+)
+
+# Fields of the *Read schemas, in schema order.
+PATIENT_READ_COLUMNS = (
+    models.Patient.id,
+    models.Patient.full_name,
+    models.Patient.nhi,
+    models.Patient.local_patient_id,
+    models.Patient.dob,
+    models.Patient.sex,
+    models.Patient.contact_email,
+    models.Patient.created_at,
+)
+STUDY_READ_COLUMNS = (
+    models.Study.id,
+    models.Study.patient_id,
+    models.Study.radiologist_id,
+    models.Study.modality,
+    models.Study.region,
+    models.Study.clinical_indication,
+    models.Study.study_datetime,
+    models.Study.status,
+    models.Study.created_at,
+)
+STUDY_FILE_READ_COLUMNS = (
+    models.StudyFile.id,
+    models.StudyFile.filename,
+    models.StudyFile.location,
+    models.StudyFile.file_type,
+    models.StudyFile.content_type,
+    models.StudyFile.size_bytes,
+    models.StudyFile.sha256,
+    models.StudyFile.created_at,
+)
+# Study columns the draft path reads (prompt, prior lookup, analytics); finalize also renders and updates the study.
+STUDY_DRAFT_COLUMNS = (
+    models.Study.id,
+    models.Study.patient_id,
+    models.Study.radiologist_id,
+    models.Study.modality,
+    models.Study.clinical_indication,
+    models.Study.study_datetime,
+    models.Study.created_at,
+)
+STUDY_FINALIZE_COLUMNS = STUDY_DRAFT_COLUMNS + (models.Study.region, models.Study.status, models.Study.version)
+IN_CHUNK_SIZE = 500
+
+
+def row_exists(db: Session, pk_column, value) -> bool:
+    """Existence check that selects only the primary key."""
+    return db.query(pk_column).filter(pk_column == value).first() is not None
+
+
+def study_read_query(db: Session) -> Query:
+    # One extra IN query for the whole page fills StudyRead.image_paths.
+    return db.query(models.Study).options(
+        selectinload(models.Study.files).load_only(models.StudyFile.study_id, models.StudyFile.location)
+    )
+
+
+def report_read_query(db: Session) -> Query:
+    return db.query(models.Report).options(undefer(models.Report.internal_checks))
+
+
+def get_study(db: Session, study_id: int, columns) -> Optional[models.Study]:
+    return db.query(models.Study).options(load_only(*columns)).filter(models.Study.id == study_id).first()
+
+
+def get_report_patient(db: Session, patient_id: int) -> Optional[models.Patient]:
+    return (
+        db.query(models.Patient)
+        .options(load_only(*PATIENT_REPORT_COLUMNS))
+        .filter(models.Patient.id == patient_id)
+        .first()
+    )
+
+
+def get_report_for_update(db: Session, study_id: int) -> Optional[models.Report]:
+    """Load a report for overwriting its content: text columns are not fetched since they are about to change."""
+    return (
+        db.query(models.Report)
+        .options(load_only(models.Report.id, models.Report.study_id, models.Report.is_finalized, models.Report.version))
+        .filter(models.Report.study_id == study_id)
+        .first()
+    )
+
+
+def as_dicts(query: Query) -> List[Dict[str, Any]]:
+    """Rows of a column query as dicts keyed by column name."""
+    rows = query.all()
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def attach_image_paths(db: Session, studies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fill image_paths on study dicts with one IN query per chunk, like study_read_query's selectinload."""
+    by_id = {study["id"]: study for study in studies}
+    for study in studies:
+        study["image_paths"] = []
+    ids = list(by_id)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        rows = (
+            db.query(models.StudyFile.study_id, models.StudyFile.location)
+            .filter(models.StudyFile.study_id.in_(ids[start : start + IN_CHUNK_SIZE]))
+            .order_by(models.StudyFile.id)
+        )
+        for study_id, location in rows:
+            by_id[study_id]["image_paths"].append(location)
+    return studies
@@ -0,0 +1,33 @@
+from datetime import date
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from backend import models, schemas
+from backend.auth import get_current_user
+from backend.database import get_db
+from backend.services import analytics
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+@router.get("/turnaround", response_model=List[schemas.TurnaroundRow])
+def turnaround(
+    group_by: List[Literal["day", "modality", "radiologist_id"]] = Query(["modality"]),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    modality: Optional[models.ModalityEnum] = Query(None),
+    radiologist_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    # Reads the pre-aggregated daily rows only, so the cost depends on the date range, not on history size.
+    return analytics.turnaround(
+        db,
+        list(dict.fromkeys(group_by)),
+        date_from=date_from,
+        date_to=date_to,
+        modality=modality,
+        radiologist_id=radiologist_id,
+    )
@@ -1,15 +1,23 @@
+from datetime import datetime
 from typing import List, Optional
+import io
 import logging
+import os
+import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, HTTPException, Path, Query, UploadFile
+from fastapi.responses import FileResponse, ORJSONResponse
 from sqlalchemy.orm import Session
 
-from backend import models, schemas
+from backend import models, queries, schemas
 from backend.auth import get_current_user
+from backend.config import get_settings
 from backend.database import get_db
+from backend.services import patient_import
 
 router = APIRouter(prefix="/api/patients", tags=["patients"])
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 @router.get("", response_model=List[schemas.PatientRead])
@@ -20,7 +28,7 @@ def list_patients(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    query = db.query(models.Patient)
+    query = db.query(*queries.PATIENT_READ_COLUMNS)
     if search:
         like = f"%{search}%"
         query = query.filter(
@@ -28,8 +36,8 @@ def list_patients(
             | (models.Patient.nhi.ilike(like))
             | (models.Patient.local_patient_id.ilike(like))
         )
-    patients = query.offset((page - 1) * page_size).limit(page_size).all()
-    return patients
+    # Returning a response skips re-validating each row against response_model, which stays for the docs.
+    return ORJSONResponse(queries.as_dicts(query.offset((page - 1) * page_size).limit(page_size)))
 
 
 @router.post("", response_model=schemas.PatientRead, status_code=201)
@@ -42,9 +50,69 @@ def create_patient(
         existing = db.query(models.Patient).filter(models.Patient.nhi == patient_in.nhi).first()
         if existing:
             return existing
+    elif patient_in.local_patient_id:
+        existing = (
+            db.query(models.Patient)
+            .filter(models.Patient.nhi.is_(None), models.Patient.local_patient_id == patient_in.local_patient_id)
+            .first()
+        )
+        if existing:
+            return existing
     patient = models.Patient(**patient_in.dict())
     db.add(patient)
     db.commit()
     db.refresh(patient)
     logger.info("Created patient %s", patient.id)
     return patient
+
+
+def _error_file_path(error_id: str) -> str:
+    return os.path.join(settings.upload_dir, "imports", f"patients-{error_id}-errors.csv")
+
+
+@router.post("/import", response_model=schemas.PatientImportResult)
+def import_patients(
+    file: UploadFile = File(...),
+    source_format: Optional[str] = Query(None, pattern="^(csv|hl7)$"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if source_format is None:
+        source_format = "hl7" if (file.filename or "").lower().endswith((".hl7", ".adt")) else "csv"
+
+    error_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:12]}"
+    error_path = _error_file_path(error_id)
+    os.makedirs(os.path.dirname(error_path), exist_ok=True)
+
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    with open(error_path, "w", newline="", encoding="utf-8") as error_stream, db.get_bind().connect() as conn:
+        result = patient_import.import_patients(
+            conn,
+            patient_import.open_reader(source_format, stream),
+            batch_size=batch_size,
+            error_stream=error_stream,
+            on_progress=lambda progress: logger.info(
+                "Patient import progress: %s processed, %s upserted, %s failed",
+                progress.processed,
+                progress.upserted,
+                progress.failed,
+            ),
+        )
+    if result.failed:
+        result.error_file = f"/api/patients/import/errors/{error_id}"
+    else:
+        os.remove(error_path)
+    logger.info("Imported patients from %s: %s", file.filename, result.dict())
+    return result
+
+
+@router.get("/import/errors/{error_id}")
+def download_import_errors(
+    error_id: str = Path(..., pattern=r"^\d{8}T\d{6}-[0-9a-f]{12}$"),
+    current_user: models.User = Depends(get_current_user),
+):
+    path = _error_file_path(error_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Error file not found")
+    return FileResponse(path, media_type="text/csv", filename=os.path.basename(path))
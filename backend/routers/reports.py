@@ -1,16 +1,36 @@
+import asyncio
+import json
 import logging
-import os
-from datetime import datetime
-from typing import Optional
+import uuid
+from datetime import date, datetime, time
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+import anyio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.orm.exc import StaleDataError
 
-from backend import models, schemas
+from backend import models, queries, schemas
 from backend.auth import get_current_user
 from backend.database import get_db
-from backend.services import report_builder, pdf_generator
+from backend.services import (
+    analytics,
+    file_serving,
+    idempotency,
+    llm_audit,
+    llm_gateway,
+    pdf_generator,
+    prior_studies,
+    report_builder,
+    report_export,
+    report_search,
+    token_budget,
+    versioning,
+)
+from backend.services.shared_state import get_shared_state
+from backend.services.upload_store import get_upload_store, shard_key
 from backend.config import get_settings
 
 router = APIRouter(prefix="/api", tags=["reports"])
@@ -18,88 +38,306 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
-def _get_study(db: Session, study_id: int) -> models.Study:
-    study = db.query(models.Study).filter(models.Study.id == study_id).first()
+DRAFT_ERRORS = (
+    report_builder.LocalDraftUnavailable,
+    token_budget.PromptBudgetExceeded,
+    llm_gateway.LLMUnavailable,
+    llm_gateway.LLMRequestRejected,
+)
+
+
+def _get_study(db: Session, study_id: int, columns=queries.STUDY_DRAFT_COLUMNS) -> models.Study:
+    study = queries.get_study(db, study_id, columns)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
     return study
 
 
-@router.post("/studies/{study_id}/report/draft", response_model=schemas.ReportDraftResponse)
-async def generate_draft_report(
-    study_id: int,
-    draft: schemas.ReportDraftRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-):
-    study = _get_study(db, study_id)
-    patient = db.query(models.Patient).filter(models.Patient.id == study.patient_id).first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
+def limit_draft_rate(current_user: models.User = Depends(get_current_user)) -> models.User:
+    limit = settings.draft_rate_limit_per_minute
+    if limit and not get_shared_state().hit(f"drafts:{current_user.id}", limit, 60):
+        raise HTTPException(status_code=429, detail="Too many draft requests, try again shortly")
+    return current_user
 
-    logger.info("Generating draft report for study %s", study_id)
-    llm_output = await report_builder.build_and_call_llm(study, patient, draft.structured_answers)
 
-    report = db.query(models.Report).filter(models.Report.study_id == study_id).first()
+def _draft_error_status(exc: Exception) -> int:
+    if isinstance(exc, report_builder.LocalDraftUnavailable):
+        return 422
+    if isinstance(exc, token_budget.PromptBudgetExceeded):
+        return 413
+    if isinstance(exc, llm_gateway.LLMRequestRejected):
+        return 502
+    return 503
+
+
+def _save_draft(db: Session, study_id: int, report: Optional[models.Report], output: dict) -> models.Report:
     if not report:
         report = models.Report(
           study_id=study_id,
-          technique=llm_output["technique"],
-          findings=llm_output["findings"],
-          impression=llm_output["impression"],
-          internal_checks=llm_output.get("internal_checks", []),
-          raw_llm_response=llm_output.get("raw_llm_response"),
+          technique=output["technique"],
+          findings=output["findings"],
+          impression=output["impression"],
+          internal_checks=output.get("internal_checks", []),
           is_finalized=False,
         )
         db.add(report)
+        db.flush()
     else:
-        report.technique = llm_output["technique"]
-        report.findings = llm_output["findings"]
-        report.impression = llm_output["impression"]
-        report.internal_checks = llm_output.get("internal_checks", [])
-        report.raw_llm_response = llm_output.get("raw_llm_response")
+        report.technique = output["technique"]
+        report.findings = output["findings"]
+        report.impression = output["impression"]
+        report.internal_checks = output.get("internal_checks", [])
         report.is_finalized = False
         report.finalized_at = None
-    db.commit()
+    llm_audit.store_raw_response(db, report.id, output.get("raw_llm_response"))
+    return report
 
+
+def _draft_response(study_id: int, output: dict, version: Optional[int] = None) -> schemas.ReportDraftResponse:
     return schemas.ReportDraftResponse(
         study_id=study_id,
-        technique=report.technique or "",
-        findings=report.findings or "",
-        impression=report.impression or "",
-        internal_checks=report.internal_checks or [],
+        technique=output["technique"] or "",
+        findings=output["findings"] or "",
+        impression=output["impression"] or "",
+        internal_checks=output.get("internal_checks") or [],
+        source=output["source"],
+        version=version,
     )
 
 
+@router.post("/studies/{study_id}/report/draft", response_model=schemas.ReportDraftResponse)
+async def generate_draft_report(
+    study_id: int,
+    draft: schemas.ReportDraftRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(limit_draft_rate),
+    idempotency_key: Optional[str] = Header(None),
+):
+    study = _get_study(db, study_id)
+    patient = queries.get_report_patient(db, study.patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    # Shared state may be a SQLite file or a Redis server, so its calls stay off the event loop.
+    claim = await run_in_threadpool(idempotency.claim, idempotency_key, f"draft:{study_id}:{current_user.id}", draft)
+    if claim.replay is not None:
+        return claim.replay
+    # Single-flight across workers: a second draft for the same study would only race the first.
+    state = get_shared_state()
+    token = await run_in_threadpool(state.acquire, f"draft:{study_id}", settings.draft_lock_seconds)
+    if token is None:
+        await run_in_threadpool(claim.release)
+        raise HTTPException(status_code=409, detail="Draft already in progress for this study")
+    logger.info("Generating draft report for study %s", study_id)
+    try:
+        report = queries.get_report_for_update(db, study_id)
+        if report is not None:
+            versioning.expect_version(report, draft.version)
+        was_finalized = report is not None and report.is_finalized
+        priors = await run_in_threadpool(prior_studies.get_priors, db, study) if draft.mode != "local" else []
+        try:
+            llm_output = await report_builder.build_draft(
+                study, patient, draft.structured_answers, mode=draft.mode, priors=priors
+            )
+        except DRAFT_ERRORS as exc:
+            raise HTTPException(status_code=_draft_error_status(exc), detail=str(exc))
+
+        first_draft = report is None
+        report = _save_draft(db, study_id, report, llm_output)
+        if first_draft:
+            analytics.record_drafted(db, study, report.created_at)
+        try:
+            db.commit()
+        except StaleDataError:
+            db.rollback()
+            raise versioning.conflict("Report")
+        if was_finalized:
+            await run_in_threadpool(prior_studies.invalidate, study.patient_id, study.modality)
+        response = _draft_response(study_id, llm_output, report.version)
+        await run_in_threadpool(claim.save, response)
+        return response
+    finally:
+        await run_in_threadpool(state.release, f"draft:{study_id}", token)
+        await run_in_threadpool(claim.release)
+
+
+def _save_batch_draft(bind, study: models.Study, output: dict) -> int:
+    """
+    Persist one batch draft in its own transaction and return the report version; raises StaleDataError.
+
+    Batches commit per study rather than in one transaction: each study's "ok" line is streamed
+    only once its report is durable, a conflict on one study doesn't roll back the others, and the
+    study's draft lock is released as soon as its own save lands instead of after the whole batch.
+    """
+    with Session(bind=bind) as session:
+        report = (
+            session.query(models.Report)
+            .options(load_only(models.Report.id, models.Report.study_id, models.Report.is_finalized, models.Report.version))
+            .filter(models.Report.study_id == study.id)
+            .first()
+        )
+        reopened = report is not None and report.is_finalized
+        first_draft = report is None
+        report = _save_draft(session, study.id, report, output)
+        if first_draft:
+            analytics.record_drafted(session, study, report.created_at)
+        session.commit()
+        version = report.version
+    if reopened:
+        prior_studies.invalidate(study.patient_id, study.modality)
+    return version
+
+
+@router.post("/reports/drafts/batch")
+async def generate_draft_reports_batch(
+    batch: schemas.BatchDraftRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(limit_draft_rate),
+):
+    study_ids = [item.study_id for item in batch.items]
+    if len(set(study_ids)) != len(study_ids):
+        raise HTTPException(status_code=400, detail="Each study may appear only once per batch")
+    rows = (
+        db.query(models.Study, models.Patient)
+        .join(models.Patient, models.Patient.id == models.Study.patient_id)
+        .options(load_only(*queries.STUDY_DRAFT_COLUMNS), load_only(*queries.PATIENT_REPORT_COLUMNS))
+        .filter(models.Study.id.in_(study_ids))
+        .all()
+    )
+    loaded = {study.id: (study, patient) for study, patient in rows}
+    # Studies of one patient and modality share a cache entry, so this is at most one query per group.
+    priors = {}
+    if batch.mode != "local":
+        for study, _ in rows:
+            priors[study.id] = await run_in_threadpool(prior_studies.get_priors, db, study)
+    bind = db.get_bind()
+    state = get_shared_state()
+    logger.info("Generating %s draft reports (%s found)", len(study_ids), len(loaded))
+
+    # Local drafts finish almost at once; saving them one at a time keeps this request to a single
+    # pooled connection instead of draining the pool. It bounds this request only, not other workers.
+    save_lock = asyncio.Lock()
+
+    async def draft_one(item: schemas.BatchDraftItem, semaphore: asyncio.Semaphore):
+        if item.study_id not in loaded:
+            return item.study_id, None, "Study not found"
+        study, patient = loaded[item.study_id]
+        token = await run_in_threadpool(state.acquire, f"draft:{item.study_id}", settings.draft_lock_seconds)
+        if token is None:
+            return item.study_id, None, "Draft already in progress for this study"
+        # The lock is held until the draft is committed, so a concurrent single draft cannot interleave.
+        try:
+            async with semaphore:
+                output = await report_builder.build_draft(
+                    study, patient, item.structured_answers, mode=batch.mode, priors=priors.get(study.id, ())
+                )
+            async with save_lock:
+                version = await run_in_threadpool(_save_batch_draft, bind, study, output)
+        except DRAFT_ERRORS as exc:
+            return item.study_id, None, str(exc)
+        except StaleDataError:
+            return item.study_id, None, "Report was modified concurrently; draft not saved"
+        except Exception as exc:
+            logger.exception("Batch draft failed for study %s", item.study_id)
+            return item.study_id, None, f"Draft failed: {exc}"
+        finally:
+            await run_in_threadpool(state.release, f"draft:{item.study_id}", token)
+        return item.study_id, _draft_response(item.study_id, output, version), None
+
+    async def stream():
+        semaphore = asyncio.Semaphore(settings.batch_draft_concurrency)
+        saved = failed = 0
+        for next_done in asyncio.as_completed([draft_one(item, semaphore) for item in batch.items]):
+            study_id, response, error = await next_done
+            if error:
+                failed += 1
+                line = {"study_id": study_id, "status": "error", "detail": error}
+            else:
+                saved += 1
+                line = {"study_id": study_id, "status": "ok", "draft": response.dict()}
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"status": "complete", "saved": saved, "failed": failed}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.post("/studies/{study_id}/report/finalize")
 def finalize_report(
     study_id: int,
     payload: schemas.ReportFinalizeRequest,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
 ):
-    study = _get_study(db, study_id)
+    study = _get_study(db, study_id, queries.STUDY_FINALIZE_COLUMNS)
     report = db.query(models.Report).filter(models.Report.study_id == study_id).first()
     if not report:
         raise HTTPException(status_code=404, detail="Report not found. Generate draft first.")
 
-    report.technique = payload.technique or report.technique
+    claim = idempotency.claim(idempotency_key, f"finalize:{study_id}:{current_user.id}", payload)
+    if claim.replay is not None:
+        return claim.replay
+    try:
+        result = _finalize(db, study, report, payload, current_user)
+        claim.save(result)
+        return result
+    finally:
+        claim.release()
+
+
+def _finalize(
+    db: Session,
+    study: models.Study,
+    report: models.Report,
+    payload: schemas.ReportFinalizeRequest,
+    current_user: models.User,
+) -> dict:
+    versioning.expect_version(report, payload.version)
+    technique = payload.technique or report.technique
+    if report.is_finalized and report.pdf_path and (report.technique, report.findings, report.impression) == (
+        technique,
+        payload.findings,
+        payload.impression,
+    ):
+        # Nothing changed since the last finalize, so the rendered PDF is still current.
+        return {"report_id": report.id, "pdf_url": f"/api/reports/{report.id}/download", "version": report.version}
+
+    previous_pdf = report.pdf_path
+    patient = queries.get_report_patient(db, study.patient_id)
+    report.technique = technique
     report.findings = payload.findings
     report.impression = payload.impression
     report.is_finalized = True
+    # Provisional, for the PDF footer; nothing is flushed until the final stamp below.
     report.finalized_at = datetime.utcnow()
-    db.add(report)
+    pdf_bytes = pdf_generator.render_report_pdf(patient, study, report, current_user, None)
+    # Every render gets its own object, so a writer that loses the version check cannot clobber the winner's PDF.
+    # This runs in the threadpool; the store's coroutines are handed back to the event loop.
+    store = get_upload_store()
+    pdf_key = shard_key(study.id, f"report_{report.id}_{uuid.uuid4().hex[:12]}.pdf")
+    pdf_path = anyio.from_thread.run(store.save, pdf_key, pdf_bytes)
+    report.pdf_path = pdf_path
 
+    # Stamped just before the commit so exports, which page on finalized_at, see reports commit in
+    # nearly stamp order (report_export leaves a lag for the rest).
+    report.finalized_at = datetime.utcnow()
+    db.add(report)
     study.status = models.StudyStatus.finalized
     db.add(study)
-
-    patient = db.query(models.Patient).filter(models.Patient.id == study.patient_id).first()
-    pdf_path = pdf_generator.generate_report_pdf(patient, study, report, current_user, qr_url=None)
-    report.pdf_path = pdf_path
-    db.commit()
+    analytics.record_finalized(db, study, report)
+    report_search.index_report(db, report.id, report.findings, report.impression)
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        anyio.from_thread.run(store.delete, pdf_path)
+        raise versioning.conflict("Report")
+    if previous_pdf and previous_pdf != pdf_path:
+        anyio.from_thread.run(store.delete, previous_pdf)
+    prior_studies.invalidate(study.patient_id, study.modality)
 
     pdf_url = f"/api/reports/{report.id}/download" if pdf_path else None
-    return {"report_id": report.id, "pdf_url": pdf_url}
+    return {"report_id": report.id, "pdf_url": pdf_url, "version": report.version}
 
 
 @router.get("/studies/{study_id}/report", response_model=schemas.ReportRead)
@@ -108,21 +346,138 @@ def get_report(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    report = db.query(models.Report).filter(models.Report.study_id == study_id).first()
+    report = queries.report_read_query(db).filter(models.Report.study_id == study_id).first()
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     return report
 
 
+@router.get("/reports/search", response_model=schemas.ReportSearchPage)
+def search_reports(
+    q: str = Query(..., min_length=1, max_length=500),
+    modality: Optional[models.ModalityEnum] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    radiologist_id: Optional[int] = Query(None),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    filters = report_search.SearchFilters(modality, date_from, date_to, radiologist_id)
+    try:
+        items, has_more = report_search.search_reports(db, q, filters, page=page, page_size=page_size)
+    except report_search.SearchUnavailable as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    return schemas.ReportSearchPage(items=items, page=page, page_size=page_size, has_more=has_more)
+
+
+@router.get("/reports/export")
+def export_reports(
+    request: Request,
+    format: Literal["jsonl", "parquet"] = Query("jsonl"),
+    since: Optional[datetime] = Query(None, description="finalized_at of the last exported report"),
+    since_report_id: int = Query(0, ge=0, description="id of the last exported report"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    # Any signed-in user may export, so the API always applies the default de-identification;
+    # per-field overrides are only available to operators through `python -m backend.cli export-reports`.
+    if "deid" in request.query_params:
+        raise HTTPException(status_code=403, detail="De-identification overrides are only available through the CLI")
+    try:
+        deidentifier = report_export.Deidentifier(report_export.DEFAULT_DEID)
+    except report_export.ExportUnavailable as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+
+    # The export streams from its own connection, read chunk by chunk after this handler returns.
+    conn = db.get_bind().connect()
+    try:
+        watermark = report_export.Watermark(since, since_report_id) if since else None
+        result = report_export.export(conn, format, deidentifier, since=watermark)
+    except report_export.ExportUnavailable as exc:
+        conn.close()
+        raise HTTPException(status_code=501, detail=str(exc))
+    except Exception:
+        conn.close()
+        raise
+
+    def body():
+        try:
+            yield from result.body
+        finally:
+            conn.close()
+
+    filename = f"reports-{datetime.utcnow():%Y%m%dT%H%M%S}.{report_export.EXTENSIONS[format]}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if result.watermark is not None:
+        # Pass these back as since / since_report_id to fetch only reports finalized afterwards.
+        headers["X-Export-Watermark"] = result.watermark.finalized_at.isoformat()
+        headers["X-Export-Watermark-Report-Id"] = str(result.watermark.report_id)
+    logger.info("Exporting finalized reports as %s since %s", format, watermark)
+    return StreamingResponse(body(), media_type=report_export.MEDIA_TYPES[format], headers=headers)
+
+
+@router.get("/reports/{report_id}/llm-response")
+def get_raw_llm_response(
+    report_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    raw = llm_audit.load_latest_raw_response(db, report_id)
+    if raw is None:
+        raise HTTPException(status_code=404, detail="No LLM response stored for this report")
+    return raw
+
+
 @router.get("/reports/{report_id}/download")
-def download_report(
+async def download_report(
     report_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    report = db.query(models.Report).filter(models.Report.id == report_id).first()
-    if not report or not report.pdf_path:
+    pdf_path = await run_in_threadpool(
+        lambda: db.query(models.Report.pdf_path).filter(models.Report.id == report_id).scalar()
+    )
+    if not pdf_path:
         raise HTTPException(status_code=404, detail="PDF not available")
-    if not os.path.exists(report.pdf_path):
-        raise HTTPException(status_code=404, detail="PDF file missing on disk")
-    return FileResponse(report.pdf_path, media_type="application/pdf", filename=os.path.basename(report.pdf_path))
+    return await file_serving.serve_stored(request, get_upload_store(), pdf_path, media_type="application/pdf")
+
+
+@router.get("/reports/archive")
+def download_reports_archive(
+    patient_id: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if patient_id is None and date_from is None and date_to is None:
+        raise HTTPException(status_code=400, detail="Provide patient_id and/or a date range")
+
+    query = (
+        db.query(models.Report.id, models.Report.pdf_path, models.Study.id, models.Study.patient_id)
+        .join(models.Study, models.Study.id == models.Report.study_id)
+        .filter(models.Report.pdf_path.isnot(None))
+    )
+    if patient_id is not None:
+        query = query.filter(models.Study.patient_id == patient_id)
+    if date_from is not None:
+        query = query.filter(models.Study.study_datetime >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        query = query.filter(models.Study.study_datetime <= datetime.combine(date_to, time.max))
+    # Only the paths are kept; file contents are streamed into the archive one chunk at a time.
+    entries = [
+        (f"patient_{row_patient_id}/study_{study_id}_report_{report_id}.pdf", pdf_path)
+        for report_id, pdf_path, study_id, row_patient_id in query.order_by(models.Report.id)
+    ]
+    if not entries:
+        raise HTTPException(status_code=404, detail="No PDFs match the given filters")
+
+    logger.info("Streaming archive of %s report PDFs", len(entries))
+    return StreamingResponse(
+        file_serving.iter_zip(entries, get_upload_store()),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="reports.zip"'},
+    )
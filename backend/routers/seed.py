@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from backend import models
 from backend.auth import get_password_hash
 from backend.database import get_db
+from backend.services import analytics
 
 router = APIRouter(prefix="/api/seed", tags=["seed"])
 logger = logging.getLogger(__name__)
@@ -52,6 +53,8 @@ def seed(db: Session = Depends(get_db)):
             study_datetime=datetime.utcnow(),
         )
         db.add(study)
+        db.flush()
+        analytics.record_study_created(db, study)
         db.commit()
         db.refresh(study)
 
@@ -2,12 +2,14 @@ from datetime import datetime
 import logging
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 
-from backend import models, schemas
+from backend import models, queries, schemas
 from backend.auth import get_current_user
 from backend.database import get_db
+from backend.services import analytics, prior_studies
 
 router = APIRouter(prefix="/api/studies", tags=["studies"])
 logger = logging.getLogger(__name__)
@@ -19,8 +21,7 @@ def create_study(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    patient = db.query(models.Patient).filter(models.Patient.id == study_in.patient_id).first()
-    if not patient:
+    if not queries.row_exists(db, models.Patient.id, study_in.patient_id):
         raise HTTPException(status_code=404, detail="Patient not found")
     study = models.Study(
         patient_id=study_in.patient_id,
@@ -31,6 +32,8 @@ def create_study(
         study_datetime=study_in.study_datetime or datetime.utcnow(),
     )
     db.add(study)
+    db.flush()
+    analytics.record_study_created(db, study)
     db.commit()
     db.refresh(study)
     logger.info("Created study %s", study.id)
@@ -40,12 +43,15 @@ def create_study(
 @router.get("/{study_id}", response_model=schemas.StudyRead)
 def get_study(
     study_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    study = db.query(models.Study).filter(models.Study.id == study_id).first()
+    study = queries.study_read_query(db).filter(models.Study.id == study_id).first()
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
+    # Opening a study usually precedes drafting it; warm the comparison context while the user fills the form.
+    background_tasks.add_task(prior_studies.prefetch, db.get_bind(), study_id)
     return study
 
 
@@ -55,7 +61,8 @@ def list_studies(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    query = db.query(models.Study)
+    query = db.query(*queries.STUDY_READ_COLUMNS)
     if patient_id:
         query = query.filter(models.Study.patient_id == patient_id)
-    return query.order_by(models.Study.created_at.desc()).all()
+    studies = queries.as_dicts(query.order_by(models.Study.created_at.desc()))
+    return ORJSONResponse(queries.attach_image_paths(db, studies))
@@ -1,18 +1,18 @@
-import os
 import logging
 from typing import List
 
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 
-from backend import models
+from backend import models, queries, schemas
 from backend.auth import get_current_user
-from backend.config import get_settings
 from backend.database import get_db
+from backend.services import study_files
+from backend.services.upload_store import get_upload_store
 
 router = APIRouter(prefix="/api/uploads", tags=["uploads"])
 logger = logging.getLogger(__name__)
-settings = get_settings()
 
 
 @router.post("/{study_id}")
@@ -22,28 +22,48 @@ async def upload_files(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    study = db.query(models.Study).filter(models.Study.id == study_id).first()
-    if not study:
+    if not queries.row_exists(db, models.Study.id, study_id):
         raise HTTPException(status_code=404, detail="Study not found")
 
-    dest_dir = os.path.join(settings.upload_dir, str(study_id))
-    os.makedirs(dest_dir, exist_ok=True)
-
+    # Each file is a new study_files row: no read-modify-write of the study, whatever the series size.
+    store = get_upload_store()
     stored_files = []
     for file in files:
-        dest_path = os.path.join(dest_dir, file.filename)
-        with open(dest_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        file_type = "dicom" if file.filename.lower().endswith((".dcm", ".dicom")) else os.path.splitext(file.filename)[1].lstrip(".")
-        stored_files.append({"filename": file.filename, "stored_path": dest_path, "type": file_type})
-
-    # Update study image paths
-    current_paths = study.image_paths or []
-    current_paths.extend([f["stored_path"] for f in stored_files])
-    study.image_paths = current_paths
-    db.add(study)
+        try:
+            entry = await study_files.store_upload(db, store, study_id, file)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        stored_files.append(entry)
     db.commit()
     logger.info("Uploaded %s files for study %s", len(stored_files), study_id)
 
-    return {"study_id": study_id, "files": stored_files}
+    return {
+        "study_id": study_id,
+        "files": [
+            {
+                "id": entry.id,
+                "filename": entry.filename,
+                "stored_path": entry.location,
+                "type": entry.file_type,
+                "size_bytes": entry.size_bytes,
+                "sha256": entry.sha256,
+            }
+            for entry in stored_files
+        ],
+    }
+
+
+@router.get("/{study_id}", response_model=List[schemas.StudyFileRead])
+def list_files(
+    study_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if not queries.row_exists(db, models.Study.id, study_id):
+        raise HTTPException(status_code=404, detail="Study not found")
+    query = (
+        db.query(*queries.STUDY_FILE_READ_COLUMNS)
+        .filter(models.StudyFile.study_id == study_id)
+        .order_by(models.StudyFile.id)
+    )
+    return ORJSONResponse(queries.as_dicts(query))
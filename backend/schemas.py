@@ -1,5 +1,5 @@
 from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -61,6 +61,13 @@ class PatientRead(PatientBase):
         orm_mode = True
 
 
+class PatientImportResult(BaseModel):
+    processed: int = 0
+    upserted: int = 0
+    failed: int = 0
+    error_file: Optional[str] = None  # download URL of the rejected rows CSV
+
+
 # Studies
 class StudyCreate(BaseModel):
     patient_id: int
@@ -86,9 +93,27 @@ class StudyRead(BaseModel):
         orm_mode = True
 
 
+class StudyFileRead(BaseModel):
+    id: int
+    filename: str
+    location: str
+    file_type: Optional[str] = None
+    content_type: Optional[str] = None
+    size_bytes: Optional[int] = None
+    sha256: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
 # Reports
 class ReportDraftRequest(BaseModel):
     structured_answers: Dict[str, Any]
+    # auto: render normal studies from templates and call the LLM otherwise; local/llm force one path.
+    mode: Literal["auto", "local", "llm"] = "auto"
+    # Report version the client last read; the draft is rejected with 409 if the report has changed since.
+    version: Optional[int] = None
 
 
 class ReportDraftResponse(BaseModel):
@@ -97,12 +122,25 @@ class ReportDraftResponse(BaseModel):
     findings: str
     impression: str
     internal_checks: List[str]
+    source: str = "llm"
+    version: Optional[int] = None
+
+
+class BatchDraftItem(BaseModel):
+    study_id: int
+    structured_answers: Dict[str, Any]
+
+
+class BatchDraftRequest(BaseModel):
+    items: List[BatchDraftItem] = Field(..., min_items=1, max_items=500)
+    mode: Literal["auto", "local", "llm"] = "auto"
 
 
 class ReportFinalizeRequest(BaseModel):
     technique: Optional[str] = None
     findings: str
     impression: str
+    version: Optional[int] = None  # as for ReportDraftRequest.version
 
 
 class ReportRead(BaseModel):
@@ -116,6 +154,41 @@ class ReportRead(BaseModel):
     finalized_at: Optional[datetime] = None
     pdf_path: Optional[str] = None
     created_at: datetime
+    version: int
 
     class Config:
         orm_mode = True
+
+
+class ReportSearchHit(BaseModel):
+    report_id: int
+    study_id: int
+    patient_id: int
+    modality: ModalityEnum
+    study_datetime: Optional[datetime] = None
+    radiologist_id: int
+    finalized_at: Optional[datetime] = None
+    rank: float
+    snippet: str  # matched terms wrapped in <mark></mark>; the surrounding report text is not HTML-escaped
+
+
+class ReportSearchPage(BaseModel):
+    items: List[ReportSearchHit]
+    page: int
+    page_size: int
+    has_more: bool
+
+
+# Analytics
+class TurnaroundRow(BaseModel):
+    # Set only for the dimensions named in group_by.
+    day: Optional[date] = None
+    modality: Optional[ModalityEnum] = None
+    radiologist_id: Optional[int] = None
+    studies_created: int
+    drafted: int
+    finalized: int
+    avg_create_to_draft_minutes: Optional[float] = None
+    avg_draft_to_final_minutes: Optional[float] = None
+    avg_turnaround_minutes: Optional[float] = None
+    max_turnaround_minutes: Optional[float] = None
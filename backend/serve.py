@@ -0,0 +1,47 @@
+"""
+Run the API with several worker processes.
+
+    WEB_CONCURRENCY=4 SHARED_STATE_URL=sqlite:///./shared_state.db python -m backend.serve --port 8000
+
+Caches, counters, draft locks and rate limits go through SHARED_STATE_URL; the in-process
+memory:// backend cannot be shared, so more than one worker requires sqlite:// or redis://.
+Migrations run once here, before the workers start. For gunicorn, use backend/gunicorn.conf.py instead.
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+from backend.config import get_settings
+from backend.migrate import migrate
+from backend.services.shared_state import create_state
+
+
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+
+def check_shared_state(workers: int) -> None:
+    url = get_settings().shared_state_url
+    if workers > 1 and not create_state(url).shared_across_processes:
+        raise SystemExit(
+            f"SHARED_STATE_URL={url} is per-process; set it to sqlite:///path or redis://host to run {workers} workers"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.serve")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    args = parser.parse_args(argv)
+
+    check_shared_state(args.workers)
+    migrate()
+    uvicorn.run("backend.main:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
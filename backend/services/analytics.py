@@ -0,0 +1,219 @@
+"""
+Volume and turnaround analytics.
+
+Study creation, the first draft and the first finalize each add to one analytics_daily row (day,
+modality, radiologist) in the same transaction as the write, via an upsert that increments counters and
+turnaround sums. Dashboards then aggregate a few rows per day instead of scanning studies and reports.
+The first finalize is stamped on reports.first_finalized_at, which reopening and re-finalizing leave
+alone, so the incremental counts and rebuild() agree on when a report was finalized.
+
+rebuild() recomputes the table from studies and reports. It backfills databases that predate the table,
+repairs drift, and is the only upkeep on databases without upsert support (anything but SQLite and
+Postgres); schedule `python -m backend.cli rebuild-analytics` there, ideally outside working hours.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, inspect, select, text
+from sqlalchemy.orm import Session
+
+from backend import models
+
+logger = logging.getLogger(__name__)
+
+GROUP_COLUMNS = ("day", "modality", "radiologist_id")
+COUNTERS = (
+    "studies_created",
+    "drafted",
+    "finalized",
+    "create_to_draft_seconds",
+    "draft_to_final_seconds",
+    "create_to_final_seconds",
+)
+MAX_COLUMN = "max_create_to_final_seconds"
+REBUILD_BATCH_SIZE = 5000
+
+
+def _seconds(start: Optional[datetime], end: Optional[datetime]) -> float:
+    if start is None or end is None:
+        return 0.0
+    return max((end - start).total_seconds(), 0.0)
+
+
+def _empty_row() -> dict:
+    return {**dict.fromkeys(COUNTERS, 0), MAX_COLUMN: 0.0}
+
+
+def _upsert(dialect: str, row: dict):
+    """INSERT ... ON CONFLICT that adds row's counters to an existing row; None when the dialect has no upsert."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+        greatest = func.greatest
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        greatest = func.max  # two-argument max() is scalar in SQLite
+    else:
+        return None
+    table = models.AnalyticsDaily.__table__
+    stmt = dialect_insert(table).values(row)
+    update = {name: table.c[name] + stmt.excluded[name] for name in COUNTERS}
+    update[MAX_COLUMN] = greatest(table.c[MAX_COLUMN], stmt.excluded[MAX_COLUMN])
+    return stmt.on_conflict_do_update(index_elements=list(GROUP_COLUMNS), set_=update)
+
+
+def _bump(db: Session, when: Optional[datetime], study: models.Study, **values) -> None:
+    row = {
+        "day": (when or datetime.utcnow()).date(),
+        "modality": study.modality,
+        "radiologist_id": study.radiologist_id,
+        **_empty_row(),
+        **values,
+    }
+    stmt = _upsert(db.get_bind().dialect.name, row)
+    if stmt is not None:
+        db.execute(stmt)
+
+
+def record_study_created(db: Session, study: models.Study) -> None:
+    """Count a new study. Call after the study is flushed so created_at is set; the caller owns the transaction."""
+    _bump(db, study.created_at, study, studies_created=1)
+
+
+def record_drafted(db: Session, study: models.Study, drafted_at: Optional[datetime]) -> None:
+    """Count a study's first draft."""
+    _bump(db, drafted_at, study, drafted=1, create_to_draft_seconds=_seconds(study.created_at, drafted_at))
+
+
+def record_finalized(db: Session, study: models.Study, report: models.Report) -> bool:
+    """
+    Count a report's first finalize and stamp it on first_finalized_at; call after setting finalized_at.
+    Re-finalizes of a reopened report are not counted again. Returns whether this was the first finalize.
+    """
+    if report.first_finalized_at is not None:
+        return False
+    report.first_finalized_at = finalized_at = report.finalized_at
+    drafted_at = report.created_at
+    total = _seconds(study.created_at, finalized_at)
+    _bump(
+        db,
+        finalized_at,
+        study,
+        finalized=1,
+        draft_to_final_seconds=_seconds(drafted_at, finalized_at),
+        create_to_final_seconds=total,
+        **{MAX_COLUMN: total},
+    )
+    return True
+
+
+def add_first_finalized_column(engine) -> bool:
+    """
+    Add reports.first_finalized_at to databases that predate it, backfilled from finalized_at. Reports
+    reopened before the upgrade have no finalized_at left and stay uncounted until finalized again.
+    """
+    if "first_finalized_at" in {col["name"] for col in inspect(engine).get_columns("reports")}:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE reports ADD COLUMN first_finalized_at TIMESTAMP"))
+        conn.execute(text("UPDATE reports SET first_finalized_at = finalized_at WHERE finalized_at IS NOT NULL"))
+    logger.info("Added reports.first_finalized_at")
+    return True
+
+
+def rebuild(engine, only_if_empty: bool = False) -> int:
+    """Recompute analytics_daily from scratch. Returns the number of aggregate rows written."""
+    table = models.AnalyticsDaily.__table__
+    with engine.begin() as conn:
+        if only_if_empty and conn.execute(select(1).select_from(table).limit(1)).first():
+            return 0
+        totals: Dict[Tuple[date, models.ModalityEnum, int], dict] = defaultdict(_empty_row)
+        rows = conn.execution_options(yield_per=REBUILD_BATCH_SIZE).execute(
+            select(
+                models.Study.modality,
+                models.Study.radiologist_id,
+                models.Study.created_at,
+                models.Report.created_at,
+                models.Report.first_finalized_at,
+            )
+            .select_from(models.Study)
+            .outerjoin(models.Report, models.Report.study_id == models.Study.id)
+        )
+        for modality, radiologist_id, created_at, drafted_at, finalized_at in rows:
+            if created_at is not None:
+                totals[(created_at.date(), modality, radiologist_id)]["studies_created"] += 1
+            if drafted_at is not None:
+                row = totals[(drafted_at.date(), modality, radiologist_id)]
+                row["drafted"] += 1
+                row["create_to_draft_seconds"] += _seconds(created_at, drafted_at)
+            if finalized_at is not None:
+                row = totals[(finalized_at.date(), modality, radiologist_id)]
+                total = _seconds(created_at, finalized_at)
+                row["finalized"] += 1
+                row["draft_to_final_seconds"] += _seconds(drafted_at, finalized_at)
+                row["create_to_final_seconds"] += total
+                row[MAX_COLUMN] = max(row[MAX_COLUMN], total)
+
+        conn.execute(delete(table))
+        entries = [dict(zip(GROUP_COLUMNS, key), **values) for key, values in totals.items()]
+        for start in range(0, len(entries), REBUILD_BATCH_SIZE):
+            conn.execute(insert(table), entries[start : start + REBUILD_BATCH_SIZE])
+    if entries:
+        logger.info("Rebuilt %s analytics rows", len(entries))
+    return len(entries)
+
+
+def _minutes(seconds: Optional[float], count: int) -> Optional[float]:
+    if not count or seconds is None:
+        return None
+    return round(seconds / count / 60, 1)
+
+
+def turnaround(
+    db: Session,
+    group_by: Sequence[str],
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    modality: Optional[models.ModalityEnum] = None,
+    radiologist_id: Optional[int] = None,
+) -> List[dict]:
+    """Volumes and average turnaround in minutes, grouped by any of GROUP_COLUMNS."""
+    daily = models.AnalyticsDaily
+    keys = [getattr(daily, name) for name in group_by]
+    query = db.query(
+        *keys,
+        *(func.sum(getattr(daily, name)).label(name) for name in COUNTERS),
+        func.max(getattr(daily, MAX_COLUMN)).label(MAX_COLUMN),
+    )
+    if date_from is not None:
+        query = query.filter(daily.day >= date_from)
+    if date_to is not None:
+        query = query.filter(daily.day <= date_to)
+    if modality is not None:
+        query = query.filter(daily.modality == modality)
+    if radiologist_id is not None:
+        query = query.filter(daily.radiologist_id == radiologist_id)
+    if keys:
+        query = query.group_by(*keys).order_by(*keys)
+
+    results = []
+    for row in query:
+        values = row._mapping
+        if values["studies_created"] is None:
+            continue  # no rows matched an ungrouped query
+        results.append(
+            {
+                **{name: values[name] for name in group_by},
+                "studies_created": values["studies_created"],
+                "drafted": values["drafted"],
+                "finalized": values["finalized"],
+                "avg_create_to_draft_minutes": _minutes(values["create_to_draft_seconds"], values["drafted"]),
+                "avg_draft_to_final_minutes": _minutes(values["draft_to_final_seconds"], values["finalized"]),
+                "avg_turnaround_minutes": _minutes(values["create_to_final_seconds"], values["finalized"]),
+                "max_turnaround_minutes": _minutes(values[MAX_COLUMN], 1) if values["finalized"] else None,
+            }
+        )
+    return results
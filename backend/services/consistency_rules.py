@@ -0,0 +1,282 @@
+"""
+Declarative consistency rules for structured answers.
+
+Rules live in JSON (or YAML, when PyYAML is installed) files grouped by modality, with "*"
+applying to every modality. Each rule is a list of AND-ed conditions:
+
+    {"field": "gallstones", "in" | "not_in": [...]}       answer value (case-insensitive)
+    {"field": "impression_hint", "contains": "..."}         substring of the answer value
+    {"field": "cbd_diameter_mm", "present": true}           answer is provided
+    {"key_contains": ["ovary", "uterus"]}                   any answer key contains a substring
+    {"patient_sex": ["male"]}                               patient attribute
+
+Rules are compiled once into per-modality indexes keyed by answer field (or key substring),
+so a draft only evaluates rules whose trigger field is present in its answers.
+"""
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import get_settings
+from backend.models import ModalityEnum, Patient
+
+logger = logging.getLogger(__name__)
+
+ALL_MODALITIES = "*"
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rules")
+
+
+class RuleContext:
+    """Per-evaluation view of the answers that lowercases each value at most once."""
+
+    def __init__(self, answers: Dict[str, Any], patient_sex: str):
+        self.answers = answers
+        self.patient_sex = patient_sex
+        self._lowered: Dict[str, str] = {}
+
+    def lowered(self, key: str) -> str:
+        value = self._lowered.get(key)
+        if value is None:
+            value = str(self.answers[key]).lower()
+            self._lowered[key] = value
+        return value
+
+
+Condition = Callable[[RuleContext], bool]
+
+
+@dataclass
+class CompiledRule:
+    ordinal: int
+    rule_id: str
+    message: str
+    conditions: List[Condition]
+    fields: Tuple[str, ...]
+    key_substrings: Tuple[str, ...] = ()
+
+    def matches(self, ctx: RuleContext) -> bool:
+        return all(condition(ctx) for condition in self.conditions)
+
+
+@dataclass
+class RuleIndex:
+    """Compiled rules for one modality."""
+
+    by_field: Dict[str, List[CompiledRule]] = field(default_factory=dict)
+    by_key_substring: Dict[str, List[CompiledRule]] = field(default_factory=dict)
+    key_pattern: Optional["re.Pattern[str]"] = None
+    unindexed: List[CompiledRule] = field(default_factory=list)
+    rules: List[CompiledRule] = field(default_factory=list)
+
+    def candidates(self, answers: Dict[str, Any]) -> List[CompiledRule]:
+        found: Dict[int, CompiledRule] = {rule.ordinal: rule for rule in self.unindexed}
+        for key in answers:
+            for rule in self.by_field.get(key, ()):
+                found[rule.ordinal] = rule
+            if self.key_pattern is not None:
+                for match in self.key_pattern.finditer(key.lower()):
+                    for rule in self.by_key_substring[match.group(0)]:
+                        found[rule.ordinal] = rule
+        return [found[ordinal] for ordinal in sorted(found)]
+
+
+def _field_present(name: str) -> Condition:
+    def check(ctx: RuleContext) -> bool:
+        return bool(ctx.answers.get(name))
+
+    return check
+
+
+def _compile_condition(rule_id: str, spec: Dict[str, Any]) -> Tuple[Condition, Optional[str], Tuple[str, ...]]:
+    """Return (condition, indexed field or None, key substrings)."""
+    if "key_contains" in spec:
+        substrings = tuple(str(s).lower() for s in spec["key_contains"])
+
+        def key_contains(ctx: RuleContext) -> bool:
+            return any(sub in key.lower() for key in ctx.answers for sub in substrings)
+
+        return key_contains, None, substrings
+
+    if "patient_sex" in spec:
+        allowed = frozenset(str(s).lower() for s in spec["patient_sex"])
+        return (lambda ctx: ctx.patient_sex in allowed), None, ()
+
+    name = spec.get("field")
+    if not name:
+        raise ValueError(f"Rule {rule_id}: condition {spec!r} needs 'field', 'key_contains' or 'patient_sex'")
+    present = _field_present(name)
+
+    if "in" in spec:
+        values = frozenset(str(v).lower() for v in spec["in"])
+        return (lambda ctx: present(ctx) and ctx.lowered(name) in values), name, ()
+    if "not_in" in spec:
+        values = frozenset(str(v).lower() for v in spec["not_in"])
+        return (lambda ctx: present(ctx) and ctx.lowered(name) not in values), name, ()
+    if "contains" in spec:
+        needle = str(spec["contains"]).lower()
+        return (lambda ctx: present(ctx) and needle in ctx.lowered(name)), name, ()
+    if spec.get("present"):
+        return present, name, ()
+    raise ValueError(f"Rule {rule_id}: condition on {name!r} needs one of in, not_in, contains, present")
+
+
+def compile_rule(ordinal: int, spec: Dict[str, Any]) -> CompiledRule:
+    rule_id = str(spec.get("id") or f"rule-{ordinal}")
+    if not spec.get("message"):
+        raise ValueError(f"Rule {rule_id}: missing message")
+    conditions: List[Condition] = []
+    fields: List[str] = []
+    key_substrings: List[str] = []
+    for condition_spec in spec.get("when") or []:
+        condition, field_name, substrings = _compile_condition(rule_id, condition_spec)
+        conditions.append(condition)
+        if field_name:
+            fields.append(field_name)
+        key_substrings.extend(substrings)
+    if not conditions:
+        raise ValueError(f"Rule {rule_id}: no conditions")
+    return CompiledRule(ordinal, rule_id, spec["message"], conditions, tuple(fields), tuple(key_substrings))
+
+
+def build_index(rules: Iterable[CompiledRule]) -> RuleIndex:
+    index = RuleIndex()
+    for rule in rules:
+        index.rules.append(rule)
+        if rule.fields:
+            # Every field condition requires its field, so one of them is enough to trigger the rule.
+            index.by_field.setdefault(rule.fields[0], []).append(rule)
+        elif rule.key_substrings:
+            for substring in rule.key_substrings:
+                index.by_key_substring.setdefault(substring, []).append(rule)
+        else:
+            index.unindexed.append(rule)
+    if index.by_key_substring:
+        alternatives = sorted(index.by_key_substring, key=len, reverse=True)
+        index.key_pattern = re.compile("|".join(re.escape(s) for s in alternatives))
+    return index
+
+
+def _load_file(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as exc:
+                raise RuntimeError(f"PyYAML is required to load {path}") from exc
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+
+def rule_files(path: str) -> List[str]:
+    if os.path.isdir(path):
+        return sorted(
+            p for pattern in ("*.json", "*.yaml", "*.yml") for p in glob.glob(os.path.join(path, pattern))
+        )
+    return [path]
+
+
+def compile_rule_files(paths: List[str]) -> Dict[Optional[ModalityEnum], RuleIndex]:
+    """Compile rule files into one index per modality ("*" rules are merged into each); None holds only "*" rules."""
+    declared: Dict[str, List[Dict[str, Any]]] = {}
+    for path in paths:
+        document = _load_file(path)
+        for modality, specs in (document.get("modalities") or {}).items():
+            if modality != ALL_MODALITIES and modality not in ModalityEnum.__members__:
+                raise ValueError(f"{path}: unknown modality {modality!r}")
+            declared.setdefault(modality, []).extend(specs or [])
+
+    ordinal = 0
+    compiled: Dict[str, List[CompiledRule]] = {}
+    for modality, specs in declared.items():
+        for spec in specs:
+            compiled.setdefault(modality, []).append(compile_rule(ordinal, spec))
+            ordinal += 1
+
+    shared = compiled.get(ALL_MODALITIES, [])
+    indexes: Dict[Optional[ModalityEnum], RuleIndex] = {None: build_index(shared)}
+    for modality in ModalityEnum:
+        merged = sorted(shared + compiled.get(modality.value, []), key=lambda rule: rule.ordinal)
+        indexes[modality] = build_index(merged)
+    return indexes
+
+
+class RuleEngine:
+    """
+    Holds the compiled rule indexes and swaps in a recompiled set when a rule file changes.
+    A file that fails to compile is logged and the previous rules stay active.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._signature: Tuple[Tuple[str, int], ...] = ()
+        self._next_check = 0.0
+        self._indexes: Dict[Optional[ModalityEnum], RuleIndex] = {}
+        self.reload(force=True)
+
+    def _current_signature(self) -> Tuple[Tuple[str, int], ...]:
+        signature = []
+        for path in rule_files(self.path):
+            try:
+                signature.append((path, os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                continue
+        return tuple(signature)
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            signature = self._current_signature()
+            if not force and signature == self._signature:
+                return False
+            try:
+                indexes = compile_rule_files([path for path, _ in signature])
+            except Exception as exc:
+                if force and not self._indexes:
+                    raise
+                logger.error("Failed to reload consistency rules from %s: %s", self.path, exc)
+                self._signature = signature
+                return False
+            self._indexes = indexes
+            self._signature = signature
+            logger.info("Loaded %s consistency rules from %s", len(indexes[None].rules), self.path)
+            return True
+
+    def maybe_reload(self) -> None:
+        if self.reload_interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        self.reload()
+
+    def index_for(self, modality: Optional[ModalityEnum]) -> RuleIndex:
+        return self._indexes[modality]
+
+    def evaluate(
+        self,
+        structured_answers: Dict[str, Any],
+        patient: Optional[Patient],
+        modality: Optional[ModalityEnum] = None,
+    ) -> List[str]:
+        self.maybe_reload()
+        ctx = RuleContext(structured_answers, (patient.sex or "").lower() if patient else "")
+        index = self._indexes[modality]
+        return [rule.message for rule in index.candidates(structured_answers) if rule.matches(ctx)]
+
+
+@lru_cache
+def get_rule_engine() -> RuleEngine:
+    settings = get_settings()
+    return RuleEngine(
+        settings.consistency_rules_path or DEFAULT_RULES_PATH,
+        reload_interval=settings.consistency_rules_reload_seconds,
+    )
@@ -0,0 +1,229 @@
+import io
+import logging
+import os
+import zipfile
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Iterable, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from backend.config import get_settings
+from backend.services.upload_store import S3UploadStore, UploadStore
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHUNK_SIZE = 64 * 1024
+# Request and response headers relayed between the client and the object store for remote downloads.
+FORWARDED_REQUEST_HEADERS = ("if-none-match", "if-modified-since", "if-match", "if-unmodified-since", "range", "if-range")
+RELAYED_RESPONSE_HEADERS = ("etag", "last-modified", "accept-ranges", "content-range", "content-length")
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _not_modified(request: Request, etag: str, stat: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates or "*" in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat.st_mtime) <= since
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" range into an inclusive (start, end) pair.
+    Returns None for multi-range or malformed headers so the caller falls back to a full response,
+    and raises 416 when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_str, sep, end_str = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            suffix = int(end_str)
+            if suffix <= 0:
+                raise ValueError
+            start = max(size - suffix, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _sendfile_headers(path: str) -> dict:
+    if settings.pdf_sendfile_mode == "x-accel-redirect":
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.upload_dir))
+        uri = "/" + "/".join([settings.pdf_sendfile_prefix.strip("/"), relative.replace(os.sep, "/")])
+        return {"X-Accel-Redirect": uri}
+    if settings.pdf_sendfile_mode == "x-sendfile":
+        return {"X-Sendfile": os.path.abspath(path)}
+    return {}
+
+
+def serve_file(request: Request, path: str, media_type: str, filename: Optional[str] = None) -> Response:
+    """
+    Serve a file from disk with ETag/Last-Modified validation and single byte-range support.
+    When PDF_SENDFILE_MODE is set the body is left to the front proxy.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="PDF file missing on disk")
+
+    etag = file_etag(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename or os.path.basename(path)}"',
+    }
+    if _not_modified(request, etag, stat):
+        return Response(status_code=304, headers={k: headers[k] for k in ("ETag", "Last-Modified")})
+
+    sendfile_headers = _sendfile_headers(path)
+    if sendfile_headers:
+        headers.update(sendfile_headers)
+        return Response(media_type=media_type, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = _parse_range(range_header, stat.st_size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(stat.st_size)
+        return StreamingResponse(_iter_file(path, 0, stat.st_size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target for ZipFile that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+async def serve_stored(
+    request: Request, store: UploadStore, location: str, media_type: str, filename: Optional[str] = None
+) -> Response:
+    """
+    Serve an uploaded object: local files via serve_file, S3 objects streamed through the API. Conditional
+    and Range headers are passed on to S3, so remote downloads get the same ETag, 304 and 206 handling.
+    """
+    path = store.local_path(location)
+    if path is not None:
+        return serve_file(request, path, media_type, filename)
+    name = filename or location.rsplit("/", 1)[-1]
+    if isinstance(store, S3UploadStore):
+        return await _serve_remote(request, store, location, media_type, name)
+    chunks = store.iter_chunks(location)
+    try:
+        first = await anext(chunks, b"")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File missing from the upload store")
+
+    async def body() -> AsyncIterator[bytes]:
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        body(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{name}"'}
+    )
+
+
+async def _serve_remote(request: Request, store: S3UploadStore, location: str, media_type: str, name: str) -> Response:
+    forwarded = {header: request.headers[header] for header in FORWARDED_REQUEST_HEADERS if header in request.headers}
+    try:
+        stored = await store.get_object(location, forwarded)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File missing from the upload store")
+    headers = {header: stored.headers[header] for header in RELAYED_RESPONSE_HEADERS if header in stored.headers}
+    if stored.status_code == 416:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers=headers)
+    if stored.status_code in (304, 412):
+        headers.pop("content-length", None)
+        return Response(status_code=stored.status_code, headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    return StreamingResponse(stored.body, status_code=stored.status_code, media_type=media_type, headers=headers)
+
+
+async def iter_zip(entries: Iterable[Tuple[str, str]], store: UploadStore) -> AsyncIterator[bytes]:
+    """
+    Stream a ZIP archive of (arcname, location) entries read from store, holding at most one chunk in memory.
+    Missing files are skipped.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, location in entries:
+            chunks = store.iter_chunks(location)
+            try:
+                first = await anext(chunks, b"")
+            except FileNotFoundError:
+                logger.warning("Skipping missing file %s in archive", location)
+                continue
+            with archive.open(arcname, mode="w", force_zip64=True) as dest:
+                dest.write(first)
+                for data in sink.drain():
+                    yield data
+                async for chunk in chunks:
+                    dest.write(chunk)
+                    for data in sink.drain():
+                        yield data
+            for data in sink.drain():
+                yield data
+    for data in sink.drain():
+        yield data
@@ -0,0 +1,90 @@
+"""
+Idempotency-Key support for expensive writes.
+
+The first request with a key claims it, does the work and stores its response in the shared state;
+a retry with the same key and body gets the stored response back without redoing the work. A retry
+that arrives while the first is still running gets 409, and reusing a key for a different body gets 422.
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.config import get_settings
+from backend.services.shared_state import SharedState, get_shared_state
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(payload: Any) -> str:
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class IdempotencyClaim:
+    """Holds a claimed key until the response is saved (or the work fails and the key is released)."""
+
+    def __init__(self, state: Optional[SharedState], name: str, digest: str, token: Optional[str]):
+        self._state = state
+        self._name = name
+        self._digest = digest
+        self._token = token
+        self.replay: Optional[JSONResponse] = None
+
+    def save(self, body: Any, status_code: int = 200) -> None:
+        if self._state is None:
+            return
+        self._state.set(
+            f"idempotency:{self._name}",
+            {"fingerprint": self._digest, "status_code": status_code, "body": jsonable_encoder(body)},
+            ttl=get_settings().idempotency_ttl_seconds,
+        )
+
+    def release(self) -> None:
+        if self._state is not None and self._token is not None:
+            self._state.release(f"idempotency:{self._name}", self._token)
+            self._token = None
+
+
+def claim(key: Optional[str], scope: str, payload: Any) -> IdempotencyClaim:
+    """
+    Claim key for scope (endpoint, resource and user). Without a key the claim does nothing.
+    When the response for this key is already stored, claim.replay holds it and nothing is locked.
+    """
+    if not key:
+        return IdempotencyClaim(None, "", "", None)
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail=f"{HEADER} must be at most 255 characters")
+    state = get_shared_state()
+    name = f"{scope}:{key}"
+    digest = fingerprint(payload)
+
+    def replay_if_stored() -> Optional[JSONResponse]:
+        stored = state.get(f"idempotency:{name}")
+        if stored is None:
+            return None
+        if stored["fingerprint"] != digest:
+            raise HTTPException(status_code=422, detail=f"{HEADER} was already used with a different request body")
+        logger.info("Replaying stored response for %s", name)
+        return JSONResponse(stored["body"], status_code=stored["status_code"], headers={REPLAY_HEADER: "true"})
+
+    replay = replay_if_stored()
+    if replay is None:
+        token = state.acquire(f"idempotency:{name}", get_settings().draft_lock_seconds)
+        if token is None:
+            raise HTTPException(status_code=409, detail=f"A request with this {HEADER} is still in progress")
+        # The first request may have finished between the lookup and the lock.
+        replay = replay_if_stored()
+        if replay is None:
+            return IdempotencyClaim(state, name, digest, token)
+        state.release(f"idempotency:{name}", token)
+    result = IdempotencyClaim(None, name, digest, None)
+    result.replay = replay
+    return result
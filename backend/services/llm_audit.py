@@ -0,0 +1,79 @@
+import gzip
+import json
+import logging
+from typing import Any, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from backend import models
+
+logger = logging.getLogger(__name__)
+
+
+def compress_payload(raw: Any) -> bytes:
+    return gzip.compress(json.dumps(raw, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def decompress_payload(codec: str, payload: bytes) -> Any:
+    if codec != "gzip":
+        raise ValueError(f"Unsupported LLM response codec: {codec}")
+    return json.loads(gzip.decompress(payload).decode("utf-8"))
+
+
+def store_raw_response(db: Session, report_id: int, raw: Any) -> Optional[models.ReportLLMResponse]:
+    """
+    Append a compressed raw completion for a report. The caller owns the transaction.
+    """
+    if raw is None:
+        return None
+    entry = models.ReportLLMResponse(report_id=report_id, codec="gzip", payload=compress_payload(raw))
+    db.add(entry)
+    return entry
+
+
+def load_latest_raw_response(db: Session, report_id: int) -> Optional[Any]:
+    row = (
+        db.query(models.ReportLLMResponse.codec, models.ReportLLMResponse.payload)
+        .filter(models.ReportLLMResponse.report_id == report_id)
+        .order_by(models.ReportLLMResponse.id.desc())
+        .first()
+    )
+    if row is None:
+        return None
+    return decompress_payload(row.codec, row.payload)
+
+
+def migrate_inline_responses(engine, batch_size: int = 500) -> int:
+    """
+    Copy raw responses left in the legacy reports.raw_llm_response column into the side table
+    and clear them. Returns the number of rows moved; a no-op once the column is empty or gone.
+    """
+    columns = {col["name"] for col in inspect(engine).get_columns("reports")}
+    if "raw_llm_response" not in columns:
+        return 0
+    moved = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(
+                text("SELECT id, raw_llm_response FROM reports WHERE raw_llm_response IS NOT NULL LIMIT :limit"),
+                {"limit": batch_size},
+            ).all()
+            if not rows:
+                break
+            for report_id, raw in rows:
+                value = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+                if value is None:
+                    continue
+                conn.execute(
+                    models.ReportLLMResponse.__table__.insert().values(
+                        report_id=report_id, codec="gzip", payload=compress_payload(value)
+                    )
+                )
+            conn.execute(
+                text("UPDATE reports SET raw_llm_response = NULL WHERE id IN ({})".format(",".join(str(r[0]) for r in rows)))
+            )
+            moved += len(rows)
+    if moved:
+        logger.info("Moved %s inline raw LLM responses into report_llm_responses", moved)
+    return moved
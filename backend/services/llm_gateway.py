@@ -0,0 +1,242 @@
+"""
+Resilient access to OpenAI-compatible chat completion endpoints.
+
+Endpoints from Settings.llm_endpoints are tried in order. Each endpoint has its own circuit breaker
+and latency history; a call to an endpoint is retried with jittered exponential backoff, and an
+attempt that runs longer than the endpoint's recent p95 latency is hedged with a second request.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from backend.config import LLMEndpoint, Settings, get_settings
+from backend.services import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429}
+# Not worth retrying on the same endpoint, but each endpoint has its own key, base_url and model.
+FAILOVER_STATUS = {401, 403, 404}
+
+
+class LLMUnavailable(RuntimeError):
+    pass
+
+
+class LLMRequestRejected(RuntimeError):
+    """The provider rejected the request itself (4xx); another endpoint would reject it too."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    import openai
+
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+def should_fail_over(exc: BaseException) -> bool:
+    import openai
+
+    return isinstance(exc, openai.APIStatusError) and exc.status_code in FAILOVER_STATUS
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; after reset_seconds one trial call is let through (half-open)."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+
+    def end_trial(self) -> None:
+        """Let the next caller try again when a trial ended without an outcome (cancelled, misconfigured)."""
+        self._trial_in_flight = False
+
+
+class EndpointState:
+    def __init__(self, endpoint: LLMEndpoint, settings: Settings):
+        self.endpoint = endpoint
+        self.name = f"{endpoint.model}@{endpoint.base_url or 'openai'}"
+        self.breaker = CircuitBreaker(settings.llm_breaker_failure_threshold, settings.llm_breaker_reset_seconds)
+        self.latency = LatencyTracker()
+        self._client: Optional["AsyncOpenAI"] = None
+        self._settings = settings
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            # The SDK is heavy to import, so it is loaded when the first call needs a client.
+            from openai import AsyncOpenAI
+
+            api_key = self.endpoint.api_key or self._settings.openai_api_key
+            if not api_key:
+                raise LLMUnavailable("OpenAI API key is not configured")
+            self._client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.endpoint.base_url,
+                timeout=self._settings.llm_timeout_seconds,
+                max_retries=0,
+            )
+        return self._client
+
+
+class LLMGateway:
+    def __init__(self, settings: Settings, sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        self.settings = settings
+        self.endpoints = [EndpointState(endpoint, settings) for endpoint in settings.llm_endpoints]
+        self._sleep = sleep
+
+    def hedge_delay(self, state: EndpointState) -> Optional[float]:
+        if not self.settings.llm_hedge_enabled:
+            return None
+        p95 = state.latency.p95()
+        return max(self.settings.llm_hedge_min_delay, p95 or 0.0)
+
+    def backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, base * 2^attempt].
+        return random.uniform(0, self.settings.llm_retry_base_delay * (2 ** attempt))
+
+    async def _call(self, state: EndpointState, messages: List[dict], response_format: Dict[str, Any]) -> dict:
+        started = time.monotonic()
+        completion = await state.client.chat.completions.create(
+            model=state.endpoint.model,
+            messages=messages,
+            response_format=response_format,
+            temperature=0.2,
+        )
+        state.latency.record(time.monotonic() - started)
+        return {
+            "content": completion.choices[0].message.content,
+            "raw": completion.model_dump(),
+            "endpoint": state.name,
+        }
+
+    async def _hedged_call(self, state: EndpointState, messages: List[dict], response_format: Dict[str, Any]) -> dict:
+        primary = asyncio.ensure_future(self._call(state, messages, response_format))
+        delay = self.hedge_delay(state)
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        logger.info("LLM call to %s exceeded %.2fs, sending hedged request", state.name, delay)
+        await metrics.increment_async("llm.hedged_requests")
+        pending = {primary, asyncio.ensure_future(self._call(state, messages, response_format))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def _call_with_retries(self, state: EndpointState, messages: List[dict], response_format: Dict[str, Any]) -> dict:
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged_call(state, messages, response_format)
+            except Exception as exc:
+                if not is_retryable(exc) or attempt >= self.settings.llm_max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                attempt += 1
+                await metrics.increment_async("llm.retries")
+                logger.warning("LLM call to %s failed (%s), retry %s in %.2fs", state.name, exc, attempt, delay)
+                await self._sleep(delay)
+
+    async def complete(self, messages: List[dict], response_format: Optional[Dict[str, Any]] = None) -> dict:
+        response_format = response_format or {"type": "json_object"}
+        last_error: Optional[BaseException] = None
+        for state in self.endpoints:
+            trial = state.breaker.state == "half-open"
+            if not state.breaker.allow():
+                logger.info("Skipping %s: circuit open", state.name)
+                continue
+            try:
+                result = await self._call_with_retries(state, messages, response_format)
+            except LLMUnavailable as exc:
+                last_error = exc
+                continue
+            except Exception as exc:
+                if not is_retryable(exc) and not should_fail_over(exc):
+                    state.breaker.record_success()
+                    raise LLMRequestRejected(f"LLM request rejected by {state.name}: {exc}") from exc
+                state.breaker.record_failure()
+                last_error = exc
+                await metrics.increment_async("llm.fallbacks")
+                logger.warning("LLM endpoint %s failed: %s", state.name, exc)
+                continue
+            finally:
+                # Cancellation (client disconnect, a losing hedge) records nothing; never leave the trial taken.
+                if trial:
+                    state.breaker.end_trial()
+            state.breaker.record_success()
+            return result
+        raise LLMUnavailable(f"No LLM endpoint available: {last_error}") from last_error
+
+
+@lru_cache
+def get_gateway() -> LLMGateway:
+    return LLMGateway(get_settings())
@@ -0,0 +1,129 @@
+"""
+Template-based drafting for normal studies.
+
+Each modality in backend/templates/normal_reports.json declares a normal profile: the fields a
+complete normal study must answer, the values that count as normal for each field and the finding
+sentence it contributes. Answers that are entirely within the profile are rendered locally; anything
+else (an unknown field, an abnormal value, a missing required organ) is left to the LLM.
+"""
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from backend.models import ModalityEnum
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "normal_reports.json")
+
+
+@dataclass(frozen=True)
+class FieldProfile:
+    field: str
+    normal: FrozenSet[str]
+    maximum: Optional[float]
+    minimum: Optional[float]
+    finding: Optional[str]
+
+    def is_normal(self, value: Any) -> bool:
+        if self.maximum is not None or self.minimum is not None:
+            # float(True) is 1.0; a checkbox answer is not a measurement.
+            if isinstance(value, bool):
+                return False
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                return False
+            # NaN fails every comparison, so it would otherwise pass both bounds.
+            if not math.isfinite(number):
+                return False
+            if self.maximum is not None and number > self.maximum:
+                return False
+            if self.minimum is not None and number < self.minimum:
+                return False
+            return True
+        return str(value).strip().lower() in self.normal
+
+
+@dataclass(frozen=True)
+class NormalProfile:
+    technique: str
+    impression: str
+    required: Tuple[str, ...]
+    ignore: FrozenSet[str]
+    fields: Dict[str, FieldProfile]
+    order: Tuple[str, ...]
+
+
+def flatten_answers(answers: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat: Dict[str, Any] = {}
+    for key, value in answers.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_answers(value, f"{name}."))
+        elif value not in (None, "", [], {}):
+            flat[name] = value
+    return flat
+
+
+def _compile_profile(spec: Dict[str, Any]) -> NormalProfile:
+    fields = {}
+    for field_spec in spec.get("fields", []):
+        fields[field_spec["field"]] = FieldProfile(
+            field=field_spec["field"],
+            normal=frozenset(str(v).lower() for v in field_spec.get("normal", [])),
+            maximum=field_spec.get("max"),
+            minimum=field_spec.get("min"),
+            finding=field_spec.get("finding"),
+        )
+    return NormalProfile(
+        technique=spec["technique"],
+        impression=spec["impression"],
+        required=tuple(spec.get("required", [])),
+        ignore=frozenset(spec.get("ignore", [])),
+        fields=fields,
+        order=tuple(fields),
+    )
+
+
+@lru_cache
+def load_profiles(path: str = TEMPLATES_PATH) -> Dict[ModalityEnum, NormalProfile]:
+    with open(path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    return {ModalityEnum(name): _compile_profile(spec) for name, spec in document.get("modalities", {}).items()}
+
+
+def render_normal_draft(modality: ModalityEnum, structured_answers: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Render technique/findings/impression when the answers fit the modality's normal profile, else None.
+    """
+    profile = load_profiles().get(modality)
+    if profile is None:
+        return None
+    answers = {k: v for k, v in flatten_answers(structured_answers).items() if k.split(".", 1)[0] not in profile.ignore}
+
+    for required in profile.required:
+        if not any(key == required or key.startswith(f"{required}.") for key in answers):
+            return None
+    for key, value in answers.items():
+        field = profile.fields.get(key)
+        if field is None or not field.is_normal(value):
+            return None
+
+    findings: List[str] = []
+    for key in profile.order:
+        field = profile.fields[key]
+        if key in answers and field.finding:
+            sentence = field.finding.format(value=answers[key])
+            if sentence not in findings:
+                findings.append(sentence)
+    return {
+        "technique": profile.technique,
+        "findings": "\n".join(findings),
+        "impression": profile.impression,
+        "internal_checks": [],
+    }
@@ -0,0 +1,33 @@
+import asyncio
+from typing import Dict
+
+from backend.services.shared_state import get_shared_state
+
+# Counters live in the shared state backend so every worker reports the same totals.
+PREFIX = "metrics:"
+
+
+def increment(name: str, amount: int = 1) -> None:
+    get_shared_state().incr(f"{PREFIX}{name}", amount)
+
+
+async def increment_async(name: str, amount: int = 1) -> None:
+    """increment() for coroutines: the SQLite and Redis backends block, so the call runs in a worker thread."""
+    await asyncio.to_thread(increment, name, amount)
+
+
+def snapshot() -> Dict[str, int]:
+    return {key[len(PREFIX):]: value for key, value in get_shared_state().counters(PREFIX).items()}
+
+
+def reset() -> None:
+    state = get_shared_state()
+    for key in state.counters(PREFIX):
+        state.delete(key)
+
+
+def draft_source_ratio() -> Dict[str, float]:
+    counts = snapshot()
+    local, llm = counts.get("drafts.local", 0), counts.get("drafts.llm", 0)
+    total = local + llm
+    return {"local": local, "llm": llm, "local_ratio": (local / total) if total else 0.0}
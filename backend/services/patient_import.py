@@ -0,0 +1,233 @@
+import csv
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from backend import models, schemas
+
+logger = logging.getLogger(__name__)
+
+# (source line/message number, raw fields) pairs produced by the readers below.
+SourceRow = Tuple[int, Dict[str, Any]]
+ProgressCallback = Callable[[schemas.PatientImportResult], None]
+
+PATIENT_FIELDS = ("full_name", "nhi", "local_patient_id", "dob", "sex", "contact_email")
+HL7_SEX = {"M": "Male", "F": "Female", "O": "Other", "U": "Unknown"}
+LOCAL_ID_INDEX = "uq_patients_local_patient_id_without_nhi"
+
+
+def iter_csv_rows(stream: TextIO) -> Iterator[SourceRow]:
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+
+
+def _parse_hl7_pid(fields: List[str]) -> Dict[str, Any]:
+    def field(idx: int) -> str:
+        return fields[idx] if len(fields) > idx else ""
+
+    nhi, local_id = None, field(4).split("^")[0] or None
+    for repetition in field(3).split("~"):
+        parts = repetition.split("^")
+        ident = parts[0]
+        authority = parts[3] if len(parts) > 3 else ""
+        id_type = parts[4] if len(parts) > 4 else ""
+        if not ident:
+            continue
+        if "NHI" in (authority.upper(), id_type.upper()) or (nhi is None and not authority and not id_type):
+            nhi = nhi or ident
+        elif local_id is None:
+            local_id = ident
+    name = field(5).split("~")[0].split("^")
+    family = name[0] if name else ""
+    given = " ".join(part for part in name[1:3] if part)
+    dob = field(7)[:8]
+    email = None
+    for repetition in field(13).split("~"):
+        parts = repetition.split("^")
+        if len(parts) > 3 and "@" in parts[3]:
+            email = parts[3]
+            break
+    return {
+        "full_name": " ".join(part for part in (given, family) if part),
+        "nhi": nhi,
+        "local_patient_id": local_id,
+        "dob": datetime.strptime(dob, "%Y%m%d").date() if dob else None,
+        "sex": HL7_SEX.get(field(8).upper(), field(8) or None),
+        "contact_email": email,
+    }
+
+
+def iter_hl7_adt(stream: TextIO) -> Iterator[SourceRow]:
+    """
+    Read ADT messages (one segment per line, or CR-separated) and yield the PID of each message.
+    Messages are numbered in order of their MSH segment.
+    """
+    message_no = 0
+    for line in stream:
+        for segment in line.replace("\r", "\n").split("\n"):
+            segment = segment.strip()
+            if segment.startswith("MSH"):
+                message_no += 1
+            elif segment.startswith("PID"):
+                try:
+                    yield message_no, _parse_hl7_pid(segment.split("|"))
+                except ValueError as exc:
+                    yield message_no, {"_error": f"Malformed PID segment: {exc}"}
+
+
+def ensure_local_id_index(engine) -> bool:
+    """
+    Create the unique local_patient_id index (rows without an NHI) on databases that predate it.
+    Returns False when existing duplicates prevent it; NHI-less rows are then rejected on import.
+    """
+    index = next(ix for ix in models.Patient.__table__.indexes if ix.name == LOCAL_ID_INDEX)
+    try:
+        index.create(bind=engine, checkfirst=True)
+    except IntegrityError:
+        logger.warning("Duplicate local_patient_id values without an NHI; cannot create %s", LOCAL_ID_INDEX)
+        return False
+    return True
+
+
+def _insert_statement(conn: Connection, by_local_id: bool = False):
+    """Upsert keyed on nhi, or on local_patient_id for rows without an NHI."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(models.Patient.__table__)
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(models.Patient.__table__)
+    else:
+        raise RuntimeError(f"Bulk patient upsert is not supported on {dialect}")
+    table = models.Patient.__table__
+    key = "local_patient_id" if by_local_id else "nhi"
+    # Blank fields in the feed never wipe values already on file.
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[key]],
+        index_where=table.c.nhi.is_(None) if by_local_id else None,
+        set_={
+            name: func.coalesce(stmt.excluded[name], table.c[name])
+            for name in PATIENT_FIELDS
+            if name != key
+        },
+    )
+
+
+class _ErrorSink:
+    def __init__(self, stream: Optional[TextIO]):
+        self._writer = csv.writer(stream) if stream is not None else None
+        if self._writer:
+            self._writer.writerow(["source_row", "error", "data"])
+
+    def write(self, source_row: int, error: str, data: Dict[str, Any]) -> None:
+        logger.debug("Patient import row %s rejected: %s", source_row, error)
+        if self._writer:
+            self._writer.writerow([source_row, error, repr(data)])
+
+
+def _validate(data: Dict[str, Any]) -> Dict[str, Any]:
+    cleaned = {k: (v.strip() if isinstance(v, str) else v) for k, v in data.items() if k in PATIENT_FIELDS}
+    cleaned = {k: (v if v != "" else None) for k, v in cleaned.items()}
+    patient = schemas.PatientCreate(**cleaned)
+    return patient.dict()
+
+
+def _flush(conn: Connection, batch: List[Tuple[int, Dict[str, Any]]], errors: _ErrorSink) -> Tuple[int, int]:
+    """
+    Upsert and commit one batch. If the batch as a whole fails it is rolled back and retried
+    row by row so that only the offending rows are rejected.
+    """
+    if not batch:
+        return 0, 0
+    now = datetime.utcnow()
+    values = [dict(row, created_at=now) for _, row in batch]
+    with_nhi = [value for value in values if value["nhi"]]
+    without_nhi = [value for value in values if not value["nhi"]]
+    try:
+        if with_nhi:
+            conn.execute(_insert_statement(conn), with_nhi)
+        if without_nhi:
+            conn.execute(_insert_statement(conn, by_local_id=True), without_nhi)
+        conn.commit()
+        return len(batch), 0
+    except SQLAlchemyError:
+        conn.rollback()
+        logger.warning("Batch upsert failed, retrying %s rows individually", len(batch))
+    upserted = failed = 0
+    for (source_row, row), value in zip(batch, values):
+        try:
+            conn.execute(_insert_statement(conn, by_local_id=not value["nhi"]), [value])
+            conn.commit()
+            upserted += 1
+        except SQLAlchemyError as exc:
+            conn.rollback()
+            failed += 1
+            errors.write(source_row, str(getattr(exc, "orig", None) or exc), row)
+    return upserted, failed
+
+
+def import_patients(
+    conn: Connection,
+    rows: Iterable[SourceRow],
+    batch_size: int = 1000,
+    error_stream: Optional[TextIO] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> schemas.PatientImportResult:
+    """
+    Stream rows into the patients table with batched INSERT ... ON CONFLICT upserts on nhi, or on
+    local_patient_id for rows without one; rows with neither are rejected.
+    Only one batch is held in memory; each batch is committed before the next is read.
+    """
+    result = schemas.PatientImportResult()
+    errors = _ErrorSink(error_stream)
+    # Rows sharing a key inside one statement would conflict with each other, so the last one wins.
+    batch: Dict[Any, Tuple[int, Dict[str, Any]]] = {}
+
+    def flush():
+        upserted, failed = _flush(conn, list(batch.values()), errors)
+        result.upserted += upserted
+        result.failed += failed
+        batch.clear()
+        if on_progress:
+            on_progress(result)
+
+    for source_row, data in rows:
+        result.processed += 1
+        if "_error" in data:
+            result.failed += 1
+            errors.write(source_row, data["_error"], data)
+            continue
+        try:
+            patient = _validate(data)
+        except ValidationError as exc:
+            result.failed += 1
+            errors.write(source_row, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()), data)
+            continue
+        if patient["nhi"]:
+            key = ("nhi", patient["nhi"])
+        elif patient["local_patient_id"]:
+            key = ("local", patient["local_patient_id"])
+        else:
+            result.failed += 1
+            errors.write(source_row, "nhi or local_patient_id is required", data)
+            continue
+        batch[key] = (source_row, patient)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+def open_reader(source_format: str, stream: TextIO) -> Iterator[SourceRow]:
+    if source_format == "csv":
+        return iter_csv_rows(stream)
+    if source_format == "hl7":
+        return iter_hl7_adt(stream)
+    raise ValueError(f"Unknown patient import format: {source_format}")
@@ -1,16 +1,8 @@
-import os
 from datetime import datetime, date
 from io import BytesIO
 
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
-import qrcode
-
-from backend.config import get_settings
 from backend.models import Patient, Study, Report, User, ModalityEnum
-
-settings = get_settings()
+from backend.services.qr_cache import draw_qr
 
 
 def _age(dob: date | None) -> str:
@@ -30,16 +22,17 @@ def _report_title(modality: ModalityEnum) -> str:
     return "Radiology Report"
 
 
-def generate_report_pdf(
+def render_report_pdf(
     patient: Patient,
     study: Study,
     report: Report,
     radiologist: User,
     qr_url: str | None = None,
-) -> str:
-    dest_dir = os.path.join(settings.upload_dir, str(study.id))
-    os.makedirs(dest_dir, exist_ok=True)
-    pdf_path = os.path.join(dest_dir, "report_final.pdf")
+) -> bytes:
+    # reportlab is imported on first use to keep it out of API start-up.
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
 
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
@@ -122,16 +115,8 @@ def generate_report_pdf(
     c.drawString(20 * mm, footer_y - 10 * mm, disclaimer[90:180])
 
     if qr_url:
-        qr_img = qrcode.make(qr_url)
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format="PNG")
-        qr_buffer.seek(0)
-        c.drawInlineImage(qr_buffer, width - 50 * mm, 15 * mm, 30 * mm, 30 * mm)
+        draw_qr(c, qr_url, width - 50 * mm, 15 * mm, 30 * mm)
 
     c.showPage()
     c.save()
-
-    with open(pdf_path, "wb") as f:
-        f.write(buffer.getvalue())
-
-    return pdf_path
+    return buffer.getvalue()
@@ -0,0 +1,149 @@
+"""
+Prior-study comparison context for draft generation.
+
+The most recent finalized reports for the same patient and modality are read in one query on the
+(patient_id, modality, study_datetime) index and kept in the shared state for a few minutes, keyed by
+patient and modality. Each study takes the reports dated up to its own from that list, so the entry is
+deeper than the prompt needs (PRIOR_CACHE_DEPTH); a study older than the whole entry queries its
+priors directly. Opening a study prefetches them in the background, so by the time a draft is
+requested the lookup is a cache hit. Finalizing a report invalidates its patient's entry.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.config import get_settings
+from backend.services import metrics
+from backend.services.shared_state import get_shared_state
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "ix_studies_patient_modality_datetime"
+ENTRY_MAX_CHARS = 400
+
+
+@dataclass
+class PriorReport:
+    study_id: int
+    study_datetime: Optional[datetime]
+    summary: str
+
+    def to_json(self) -> dict:
+        when = self.study_datetime.isoformat() if self.study_datetime else None
+        return {"study_id": self.study_id, "study_datetime": when, "summary": self.summary}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "PriorReport":
+        when = datetime.fromisoformat(data["study_datetime"]) if data["study_datetime"] else None
+        return cls(data["study_id"], when, data["summary"])
+
+
+def _cache_key(patient_id: int, modality: models.ModalityEnum) -> str:
+    return f"priors:{patient_id}:{modality.name}"
+
+
+def ensure_index(engine) -> None:
+    """Create the lookup index on databases whose studies table predates it."""
+    index = next(ix for ix in models.Study.__table__.indexes if ix.name == INDEX_NAME)
+    index.create(bind=engine, checkfirst=True)
+
+
+def load_priors(
+    db: Session,
+    patient_id: int,
+    modality: models.ModalityEnum,
+    limit: int,
+    until: Optional[datetime] = None,
+) -> List[PriorReport]:
+    """The patient's most recent finalized reports for modality (dated until or earlier if given), newest first."""
+    query = db.query(
+        models.Study.id, models.Study.study_datetime, models.Report.impression, models.Report.findings
+    ).join(models.Report, models.Report.study_id == models.Study.id)
+    query = query.filter(
+        models.Study.patient_id == patient_id,
+        models.Study.modality == modality,
+        models.Report.is_finalized.is_(True),
+    )
+    if until is not None:
+        query = query.filter(or_(models.Study.study_datetime <= until, models.Study.study_datetime.is_(None)))
+    rows = query.order_by(models.Study.study_datetime.desc(), models.Study.id.desc()).limit(limit).all()
+    return [
+        PriorReport(study_id, when, " ".join((impression or findings or "").split()))
+        for study_id, when, impression, findings in rows
+    ]
+
+
+def _priors_of(study: models.Study, priors: Sequence[PriorReport]) -> List[PriorReport]:
+    """Drop the study itself and anything dated after it."""
+    return [
+        prior
+        for prior in priors
+        if prior.study_id != study.id
+        and (study.study_datetime is None or prior.study_datetime is None or prior.study_datetime <= study.study_datetime)
+    ]
+
+
+def get_priors(db: Session, study: models.Study) -> List[PriorReport]:
+    """Priors for study from the cache, loading them on a miss. The study itself and later studies are left out."""
+    settings = get_settings()
+    limit = settings.prior_reports_limit
+    if limit <= 0:
+        return []
+    # At least one extra row so the newest study can drop itself and still have limit priors.
+    depth = max(settings.prior_cache_depth, limit + 1)
+    state = get_shared_state()
+    key = _cache_key(study.patient_id, study.modality)
+    cached = state.get(key)
+    if cached is None:
+        metrics.increment("priors.cache_miss")
+        priors = load_priors(db, study.patient_id, study.modality, depth)
+        state.set(key, [prior.to_json() for prior in priors], ttl=settings.prior_cache_seconds)
+    else:
+        metrics.increment("priors.cache_hit")
+        priors = [PriorReport.from_json(entry) for entry in cached]
+    eligible = _priors_of(study, priors)
+    if len(eligible) < limit and len(priors) >= depth:
+        # The entry is full and the study is older than most of it: its remaining priors lie past the entry.
+        metrics.increment("priors.deep_load")
+        eligible = _priors_of(study, load_priors(db, study.patient_id, study.modality, limit + 1, study.study_datetime))
+    return eligible[:limit]
+
+
+def prefetch(bind, study_id: int) -> None:
+    """Warm the cache for a study; meant to run as a background task after the study is read."""
+    try:
+        with Session(bind=bind) as session:
+            study = session.get(models.Study, study_id)
+            if study is not None:
+                get_priors(session, study)
+    except Exception:
+        logger.exception("Prefetching prior studies failed for study %s", study_id)
+
+
+def invalidate(patient_id: int, modality: models.ModalityEnum) -> None:
+    get_shared_state().delete(_cache_key(patient_id, modality))
+
+
+def summarize(priors: Sequence[PriorReport], max_chars: int) -> str:
+    """One line per prior ("- YYYY-MM-DD: impression"), truncated so the whole block fits in max_chars."""
+    lines: List[str] = []
+    used = 0
+    for prior in priors:
+        when = prior.study_datetime.date().isoformat() if prior.study_datetime else "undated"
+        text = prior.summary or "No impression recorded."
+        if len(text) > ENTRY_MAX_CHARS:
+            text = text[: ENTRY_MAX_CHARS - 1].rstrip() + "…"
+        line = f"- {when}: {text}"
+        if used + len(line) > max_chars:
+            room = max_chars - used
+            if room > len(when) + 8:
+                lines.append(line[: room - 1].rstrip() + "…")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from backend.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# A QR code is cached as its module matrix: one string of "0"/"1" per row, quiet zone included.
+QRMatrix = Tuple[str, ...]
+
+
+def encode_matrix(url: str) -> QRMatrix:
+    import qrcode
+
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return tuple("".join("1" if cell else "0" for cell in row) for row in qr.get_matrix())
+
+
+class QRCache:
+    """
+    LRU cache of QR module matrices keyed by URL, with an optional on-disk tier.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        self._entries: "OrderedDict[str, QRMatrix]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _disk_path(self, url: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".qr")
+
+    def _load_from_disk(self, url: str) -> Optional[QRMatrix]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(url)
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                rows = tuple(line for line in f.read().split("\n") if line)
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            logger.warning("Failed to read QR cache entry %s: %s", path, exc)
+            return None
+        return rows or None
+
+    def _store_on_disk(self, url: str, matrix: QRMatrix) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(url)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="ascii") as f:
+                f.write("\n".join(matrix))
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("Failed to write QR cache entry %s: %s", path, exc)
+
+    def _remember(self, url: str, matrix: QRMatrix) -> None:
+        with self._lock:
+            self._entries[url] = matrix
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, url: str) -> QRMatrix:
+        with self._lock:
+            matrix = self._entries.get(url)
+            if matrix is not None:
+                self._entries.move_to_end(url)
+                return matrix
+
+        matrix = self._load_from_disk(url)
+        if matrix is None:
+            matrix = encode_matrix(url)
+            self._store_on_disk(url, matrix)
+        self._remember(url, matrix)
+        return matrix
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+@lru_cache
+def get_qr_cache() -> QRCache:
+    settings = get_settings()
+    return QRCache(max_entries=settings.qr_cache_size, disk_dir=settings.qr_cache_dir)
+
+
+def draw_qr(c, url: str, x: float, y: float, size: float) -> None:
+    """
+    Draw the QR code for url as filled vector rectangles with its lower-left corner at (x, y).
+    Adjacent dark modules in a row are merged into a single rectangle.
+    """
+    matrix = get_qr_cache().get(url)
+    modules = len(matrix)
+    cell = size / modules
+    path = c.beginPath()
+    for row_idx, row in enumerate(matrix):
+        row_y = y + (modules - row_idx - 1) * cell
+        col = 0
+        while col < modules:
+            if row[col] != "1":
+                col += 1
+                continue
+            start = col
+            while col < modules and row[col] == "1":
+                col += 1
+            path.rect(x + start * cell, row_y, (col - start) * cell, cell)
+    c.saveState()
+    c.setFillColorRGB(0, 0, 0)
+    c.drawPath(path, stroke=0, fill=1)
+    c.restoreState()
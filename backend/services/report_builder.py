@@ -1,8 +1,14 @@
+import asyncio
 import json
 import logging
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, List, Sequence
 
+from backend.config import get_settings
 from backend.models import Study, ModalityEnum, Patient
+from backend.services import metrics, prior_studies, token_budget
+from backend.services.consistency_rules import get_rule_engine
+from backend.services.local_drafts import render_normal_draft
 from backend.services.openai_client import generate_chat_completion
 
 logger = logging.getLogger(__name__)
@@ -27,61 +33,88 @@ def modality_prompt(modality: ModalityEnum) -> str:
     return ""
 
 
+# Shared by every modality and kept first so provider-side prompt caching can reuse it.
+SYSTEM_PROMPT_PREFIX = (
+    "You are an expert radiologist report writer. You will receive structured inputs and must ONLY: "
+    "convert them into concise radiology report language and flag internal contradictions. "
+    "Do not invent findings or diagnoses beyond the provided data. "
+    "Do not alter demographics. If data is missing, omit rather than guess. "
+    "Output strictly in JSON with keys: technique, findings, impression, internal_checks (array of strings). "
+    "If no inconsistency is detected, return ['No inconsistencies detected.'] in internal_checks."
+)
+
+
+@lru_cache
+def system_prompt_for(modality: ModalityEnum) -> str:
+    return f"{SYSTEM_PROMPT_PREFIX} Modality context: {modality_prompt(modality)}"
+
+
 def build_system_prompt(study: Study) -> str:
-    return (
-        "You are an expert radiologist report writer. You will receive structured inputs and must ONLY: "
-        "convert them into concise radiology report language and flag internal contradictions. "
-        "Do not invent findings or diagnoses beyond the provided data. "
-        "Do not alter demographics. If data is missing, omit rather than guess. "
-        f"Modality context: {modality_prompt(study.modality)} "
-        "Output strictly in JSON with keys: technique, findings, impression, internal_checks (array of strings). "
-        "If no inconsistency is detected, return ['No inconsistencies detected.'] in internal_checks."
-    )
-
-
-def build_user_prompt(study: Study, patient: Patient | None, structured_answers: Dict[str, Any]) -> str:
-    patient_info = f"Patient: {patient.full_name if patient else 'Unknown'}, Sex: {patient.sex}, DOB: {patient.dob}" if patient else "Patient: Unknown"
-    return (
-        f"{patient_info}\n"
-        f"Study modality: {study.modality}\n"
-        f"Clinical indication: {study.clinical_indication}\n"
-        f"Structured answers JSON:\n{json.dumps(structured_answers, indent=2)}\n"
-        "Generate JSON: {\"technique\":..., \"findings\":..., \"impression\":..., \"internal_checks\":[...]} only."
-    )
-
-
-def validate_answers(structured_answers: Dict[str, Any], patient: Patient | None) -> List[str]:
-    warnings: List[str] = []
-    sex = (patient.sex or "").lower() if patient else ""
-    # Simple examples
-    if sex == "male":
-        for key in structured_answers.keys():
-            if "ovary" in key.lower() or "uterus" in key.lower():
-                warnings.append("Patient sex is male but gynecologic findings provided.")
-                break
-    gallbladder_status = structured_answers.get("gallbladder_status")
-    gallstones = structured_answers.get("gallstones")
-    if gallbladder_status and str(gallbladder_status).lower() in {"absent", "surgically absent"}:
-        if gallstones and str(gallstones).lower() not in {"no", "absent", "none"}:
-            warnings.append("Gallbladder marked absent but stones flagged present.")
-    impression = structured_answers.get("impression_hint", "").lower()
-    appendix_visibility = structured_answers.get("appendix_visualized")
-    if appendix_visibility and str(appendix_visibility).lower() in {"not visualized", "not seen"}:
-        if "appendicitis" in impression:
-            warnings.append("Appendix not visualized but impression suggests appendicitis.")
-    return warnings
-
-
-async def build_and_call_llm(study: Study, patient: Patient | None, structured_answers: Dict[str, Any]) -> Dict[str, Any]:
+    return system_prompt_for(study.modality)
+
+
+def compact_answers(value: Any) -> Any:
+    """Drop null and empty answers, recursing into nested sections."""
+    if isinstance(value, dict):
+        compacted = {k: compact_answers(v) for k, v in value.items()}
+        return {k: v for k, v in compacted.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [v for v in (compact_answers(item) for item in value) if v not in (None, "", [], {})]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def build_user_prompt(
+    study: Study,
+    patient: Patient | None,
+    structured_answers: Dict[str, Any],
+    priors: Sequence[prior_studies.PriorReport] = (),
+) -> str:
+    lines = []
+    if patient:
+        lines.append(f"Patient: {patient.full_name}, Sex: {patient.sex or 'Unknown'}, DOB: {patient.dob or 'Unknown'}")
+    else:
+        lines.append("Patient: Unknown")
+    lines.append(f"Study modality: {study.modality.value}")
+    if study.clinical_indication:
+        lines.append(f"Clinical indication: {study.clinical_indication}")
+    answers = json.dumps(compact_answers(structured_answers), separators=(",", ":"), ensure_ascii=False, default=str)
+    lines.append(f"Structured answers JSON: {answers}")
+    summary = prior_studies.summarize(priors, get_settings().prior_summary_chars)
+    if summary:
+        lines.append("Prior reports for comparison only, most recent first (do not copy findings from them):")
+        lines.append(summary)
+    return "\n".join(lines)
+
+
+def validate_answers(
+    structured_answers: Dict[str, Any],
+    patient: Patient | None,
+    modality: ModalityEnum | None = None,
+) -> List[str]:
+    # Rules are declared in backend/rules (see services/consistency_rules.py).
+    return get_rule_engine().evaluate(structured_answers, patient, modality)
+
+
+async def build_and_call_llm(
+    study: Study,
+    patient: Patient | None,
+    structured_answers: Dict[str, Any],
+    priors: Sequence[prior_studies.PriorReport] = (),
+) -> Dict[str, Any]:
     system_prompt = build_system_prompt(study)
-    user_prompt = build_user_prompt(study, patient, structured_answers)
+    user_prompt = build_user_prompt(study, patient, structured_answers, priors)
 
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
+    estimated_tokens = token_budget.enforce_budget(messages, get_settings().llm_max_prompt_tokens)
     result = await generate_chat_completion(messages, response_format={"type": "json_object"})
+    # Counters may live in shared state (sqlite/redis); keep those writes off the event loop.
+    await asyncio.to_thread(token_budget.record_usage, result.get("raw"), estimated_tokens)
 
     try:
         parsed = json.loads(result["content"])
@@ -93,7 +126,7 @@ async def build_and_call_llm(study: Study, patient: Patient | None, structured_a
     for key in ["technique", "findings", "impression", "internal_checks"]:
         parsed.setdefault(key, "" if key != "internal_checks" else [])
 
-    warnings = validate_answers(structured_answers, patient)
+    warnings = validate_answers(structured_answers, patient, study.modality)
     parsed_checks = parsed.get("internal_checks") or []
     if warnings:
         parsed_checks.extend(warnings)
@@ -102,3 +135,38 @@ async def build_and_call_llm(study: Study, patient: Patient | None, structured_a
     parsed["internal_checks"] = parsed_checks
     parsed["raw_llm_response"] = result.get("raw")
     return parsed
+
+
+class LocalDraftUnavailable(ValueError):
+    pass
+
+
+async def build_draft(
+    study: Study,
+    patient: Patient | None,
+    structured_answers: Dict[str, Any],
+    mode: str = "auto",
+    priors: Sequence[prior_studies.PriorReport] = (),
+) -> Dict[str, Any]:
+    """
+    Draft a report locally from the modality's normal template when the answers allow it, otherwise via the LLM.
+    mode is "auto" (local with LLM fallback), "local" (never call the LLM) or "llm" (always call the LLM).
+    priors only reach the LLM prompt; local templates ignore them.
+    """
+    if mode != "llm":
+        warnings = validate_answers(structured_answers, patient, study.modality)
+        local = None if warnings else render_normal_draft(study.modality, structured_answers)
+        if local is not None:
+            local["internal_checks"] = ["No inconsistencies detected."]
+            local["source"] = "local"
+            await metrics.increment_async("drafts.local")
+            return local
+        if mode == "local":
+            raise LocalDraftUnavailable(
+                "; ".join(warnings) if warnings else "Structured answers do not match a normal template for this modality"
+            )
+
+    parsed = await build_and_call_llm(study, patient, structured_answers, priors)
+    parsed["source"] = "llm"
+    await metrics.increment_async("drafts.llm")
+    return parsed
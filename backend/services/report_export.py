@@ -0,0 +1,326 @@
+"""
+Bulk export of finalized reports with their study and patient metadata, for QA and model training.
+
+Rows are read from reports JOIN studies JOIN patients with a server-side cursor, chunk by chunk, in
+(finalized_at, report id) order, and written as gzipped JSON lines or Parquet (needs pyarrow) without
+holding the export in memory. Each export stops at the newest report finalized at least
+EXPORT_WATERMARK_LAG_SECONDS before it started; that position is the watermark, and passing it back as
+`since` exports only what was finalized after it. finalized_at is stamped just before the finalize
+commits, so the lag only has to cover a commit that lands after a later-stamped one; reports inside the
+lag wait for the next export instead of being skipped by a watermark that has already moved past them.
+A report that is edited and finalized again is exported again, so consumers should keep the latest row
+per report_id.
+
+Patient fields are de-identified per field: keep, drop, hash (keyed HMAC-SHA256, a stable pseudonym
+that needs EXPORT_PSEUDONYM_KEY) or year (dob only). Free-text findings are exported as written.
+"""
+import hashlib
+import hmac
+import io
+import logging
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import orjson
+from sqlalchemy import and_, or_, select
+from sqlalchemy.engine import Connection
+
+from backend import models
+from backend.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "ix_reports_finalized_at_id"
+FORMATS = ("jsonl", "parquet")
+MEDIA_TYPES = {"jsonl": "application/gzip", "parquet": "application/vnd.apache.parquet"}
+EXTENSIONS = {"jsonl": "jsonl.gz", "parquet": "parquet"}
+
+EXPORT_COLUMNS = (
+    models.Report.id.label("report_id"),
+    models.Report.study_id,
+    models.Report.technique,
+    models.Report.findings,
+    models.Report.impression,
+    models.Report.finalized_at,
+    models.Study.modality,
+    models.Study.region,
+    models.Study.clinical_indication,
+    models.Study.study_datetime,
+    models.Study.radiologist_id,
+    models.Patient.id.label("patient_id"),
+    models.Patient.full_name,
+    models.Patient.nhi,
+    models.Patient.local_patient_id,
+    models.Patient.dob,
+    models.Patient.sex,
+    models.Patient.contact_email,
+)
+# Arrow type names for the Parquet schema; hashed fields become strings and dob becomes a year.
+ARROW_TYPES = {
+    "report_id": "int64",
+    "study_id": "int64",
+    "technique": "string",
+    "findings": "string",
+    "impression": "string",
+    "finalized_at": "timestamp",
+    "modality": "string",
+    "region": "string",
+    "clinical_indication": "string",
+    "study_datetime": "timestamp",
+    "radiologist_id": "int64",
+    "patient_id": "int64",
+    "full_name": "string",
+    "nhi": "string",
+    "local_patient_id": "string",
+    "dob": "date",
+    "sex": "string",
+    "contact_email": "string",
+}
+
+POLICIES = ("keep", "drop", "hash", "year")
+DEFAULT_DEID = {
+    "patient_id": "hash",
+    "full_name": "drop",
+    "nhi": "hash",
+    "local_patient_id": "hash",
+    "dob": "year",
+    "sex": "keep",
+    "contact_email": "drop",
+}
+
+
+class ExportUnavailable(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Watermark:
+    finalized_at: datetime
+    report_id: int
+
+    def to_json(self) -> dict:
+        return {"finalized_at": self.finalized_at.isoformat(), "report_id": self.report_id}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Watermark":
+        return cls(datetime.fromisoformat(data["finalized_at"]), int(data["report_id"]))
+
+
+def parse_deid(spec: Optional[str]) -> Dict[str, str]:
+    """
+    Start from DEFAULT_DEID and apply "field=policy" overrides, e.g. "nhi=keep,dob=drop".
+    "none" keeps every field. Raises ValueError for unknown fields or policies.
+    """
+    policy = dict(DEFAULT_DEID)
+    if not spec:
+        return policy
+    if spec.strip() == "none":
+        return dict.fromkeys(DEFAULT_DEID, "keep")
+    for item in spec.split(","):
+        field, _, action = item.strip().partition("=")
+        if field not in DEFAULT_DEID:
+            raise ValueError(f"Unknown patient field {field!r}; expected one of {', '.join(DEFAULT_DEID)}")
+        if action not in POLICIES or (action == "year" and field != "dob"):
+            raise ValueError(f"Invalid policy {action!r} for {field}")
+        policy[field] = action
+    return policy
+
+
+class Deidentifier:
+    def __init__(self, policy: Dict[str, str], key: Optional[str] = None):
+        key = get_settings().export_pseudonym_key if key is None else key
+        if "hash" in policy.values() and not key:
+            raise ExportUnavailable("EXPORT_PSEUDONYM_KEY must be set to hash patient fields")
+        self.policy = policy
+        self._key = key.encode("utf-8")
+
+    def pseudonym(self, value) -> str:
+        return hmac.new(self._key, str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def apply(self, row: dict) -> dict:
+        for field, action in self.policy.items():
+            value = row.get(field)
+            if action == "drop":
+                row.pop(field, None)
+            elif action == "hash":
+                row[field] = None if value is None else self.pseudonym(value)
+            elif action == "year":
+                row[field] = value.year if value is not None else None
+        modality = row.get("modality")
+        if modality is not None:
+            row["modality"] = modality.value
+        return row
+
+    def fields(self) -> List[str]:
+        return [col.key for col in EXPORT_COLUMNS if self.policy.get(col.key) != "drop"]
+
+
+def ensure_index(engine) -> None:
+    """Create the export cursor index on databases whose reports table predates it."""
+    index = next(ix for ix in models.Report.__table__.indexes if ix.name == INDEX_NAME)
+    index.create(bind=engine, checkfirst=True)
+
+
+def current_watermark(conn: Connection, lag: Optional[float] = None) -> Optional[Watermark]:
+    """
+    Position of the newest report finalized at least lag seconds ago (default EXPORT_WATERMARK_LAG_SECONDS),
+    i.e. where an export started now will stop.
+    """
+    lag = get_settings().export_watermark_lag_seconds if lag is None else lag
+    settled = datetime.utcnow() - timedelta(seconds=lag)
+    row = conn.execute(
+        select(models.Report.finalized_at, models.Report.id)
+        .where(
+            models.Report.is_finalized.is_(True),
+            models.Report.finalized_at.isnot(None),
+            models.Report.finalized_at <= settled,
+        )
+        .order_by(models.Report.finalized_at.desc(), models.Report.id.desc())
+        .limit(1)
+    ).first()
+    return Watermark(row[0], row[1]) if row else None
+
+
+def _after(mark: Watermark):
+    return or_(
+        models.Report.finalized_at > mark.finalized_at,
+        and_(models.Report.finalized_at == mark.finalized_at, models.Report.id > mark.report_id),
+    )
+
+
+def iter_chunks(
+    conn: Connection,
+    deidentifier: Deidentifier,
+    since: Optional[Watermark],
+    until: Optional[Watermark],
+    chunk_size: int,
+) -> Iterator[List[dict]]:
+    """De-identified rows finalized after since and up to until, chunk_size at a time."""
+    if until is None:
+        return
+    stmt = (
+        select(*EXPORT_COLUMNS)
+        .select_from(models.Report)
+        .join(models.Study, models.Study.id == models.Report.study_id)
+        .join(models.Patient, models.Patient.id == models.Study.patient_id)
+        .where(models.Report.is_finalized.is_(True), models.Report.finalized_at.isnot(None), ~_after(until))
+        .order_by(models.Report.finalized_at, models.Report.id)
+    )
+    if since is not None:
+        stmt = stmt.where(_after(since))
+    result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+    for partition in result.mappings().partitions():
+        yield [deidentifier.apply(dict(row)) for row in partition]
+
+
+def iter_jsonl_gz(chunks: Iterable[List[dict]]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for rows in chunks:
+        data = compressor.compress(b"".join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE) for row in rows))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Sink(io.RawIOBase):
+    """Append-only write target that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ExportUnavailable("Parquet export needs the pyarrow package; use jsonl or install pyarrow") from exc
+    return pyarrow, pyarrow.parquet
+
+
+def _arrow_schema(pa, deidentifier: Deidentifier):
+    types = {
+        "int64": pa.int64(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us"),
+        "date": pa.date32(),
+    }
+    fields = []
+    for name in deidentifier.fields():
+        action = deidentifier.policy.get(name)
+        type_name = "string" if action == "hash" else "int64" if action == "year" else ARROW_TYPES[name]
+        fields.append(pa.field(name, types[type_name]))
+    return pa.schema(fields)
+
+
+def iter_parquet(chunks: Iterable[List[dict]], deidentifier: Deidentifier) -> Iterator[bytes]:
+    """One row group per chunk; the file footer follows the last chunk."""
+    pa, pq = _require_pyarrow()
+    schema = _arrow_schema(pa, deidentifier)
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+@dataclass
+class Export:
+    # Where this export stops; pass it back as since for the next incremental export.
+    watermark: Optional[Watermark]
+    body: Iterator[bytes] = iter(())
+    rows: int = 0
+
+
+def export(
+    conn: Connection,
+    fmt: str,
+    deidentifier: Deidentifier,
+    since: Optional[Watermark] = None,
+    chunk_size: Optional[int] = None,
+    lag: Optional[float] = None,
+) -> Export:
+    """
+    Start an export. Its body reads from conn lazily, so keep the connection open until the body
+    is exhausted; rows counts the rows written so far. lag overrides EXPORT_WATERMARK_LAG_SECONDS.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    if fmt == "parquet":
+        _require_pyarrow()
+    until = current_watermark(conn, lag)
+    if until is not None and since is not None and (until.finalized_at, until.report_id) <= (
+        since.finalized_at,
+        since.report_id,
+    ):
+        until = None  # nothing new since the last export
+    result = Export(watermark=until or since)
+
+    def counted() -> Iterator[List[dict]]:
+        for rows in iter_chunks(conn, deidentifier, since, until, chunk_size or get_settings().export_chunk_size):
+            result.rows += len(rows)
+            yield rows
+
+    result.body = iter_parquet(counted(), deidentifier) if fmt == "parquet" else iter_jsonl_gz(counted())
+    return result
@@ -0,0 +1,194 @@
+"""
+Full-text search over finalized reports.
+
+The index (created with the schema, see models.py) holds each finalized report's findings and
+impression: an FTS5 table on SQLite, a GIN-indexed tsvector column on Postgres. finalize_report
+re-indexes its report in the same transaction, so search never sees a half-written finalize.
+Matches in the impression rank above matches in the findings.
+"""
+import html
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import column, func, literal_column, table, text
+from sqlalchemy.orm import Query, Session
+
+from backend import models
+
+logger = logging.getLogger(__name__)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# Snippets are cut from report text as written, so the database marks matches with private-use
+# characters; highlight() escapes the text and only then swaps them for the <mark> tags.
+SNIPPET_START = "\ue000"
+SNIPPET_END = "\ue001"
+SNIPPET_TOKENS = 16
+# bm25 weights for the FTS5 columns (findings, impression)
+FINDINGS_WEIGHT = 1.0
+IMPRESSION_WEIGHT = 2.0
+TS_CONFIG = "english"
+PG_VECTOR_SQL = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(impression, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(findings, '')), 'B')"
+)
+
+fts_table = table("report_search", column("rowid"))
+
+
+class SearchUnavailable(RuntimeError):
+    pass
+
+
+@dataclass
+class SearchFilters:
+    modality: Optional[models.ModalityEnum] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    radiologist_id: Optional[int] = None
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+def fts5_query(q: str) -> str:
+    """Turn free text into an FTS5 query that ANDs every word; FTS5 operators in the input are treated as text."""
+    terms = re.findall(r"\w+", q, flags=re.UNICODE)
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def index_report(db: Session, report_id: int, findings: Optional[str], impression: Optional[str]) -> None:
+    """(Re)index one report. The caller owns the transaction."""
+    dialect = _dialect(db.get_bind())
+    if dialect == "sqlite":
+        db.execute(text("DELETE FROM report_search WHERE rowid = :id"), {"id": report_id})
+        db.execute(
+            text("INSERT INTO report_search (rowid, findings, impression) VALUES (:id, :findings, :impression)"),
+            {"id": report_id, "findings": findings or "", "impression": impression or ""},
+        )
+    elif dialect == "postgresql":
+        # Flush first so the vector is computed from the text being committed.
+        db.flush()
+        db.execute(text(f"UPDATE reports SET search_vector = {PG_VECTOR_SQL} WHERE id = :id"), {"id": report_id})
+
+
+def rebuild_index(engine, only_if_empty: bool = False) -> int:
+    """Index every finalized report from scratch. Returns the number of reports indexed."""
+    dialect = _dialect(engine)
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            if only_if_empty and conn.execute(text("SELECT 1 FROM report_search LIMIT 1")).first():
+                return 0
+            conn.execute(text("DELETE FROM report_search"))
+            result = conn.execute(
+                text(
+                    "INSERT INTO report_search (rowid, findings, impression) "
+                    "SELECT id, coalesce(findings, ''), coalesce(impression, '') FROM reports WHERE is_finalized"
+                )
+            )
+        elif dialect == "postgresql":
+            if only_if_empty and conn.execute(text("SELECT 1 FROM reports WHERE search_vector IS NOT NULL LIMIT 1")).first():
+                return 0
+            result = conn.execute(text(f"UPDATE reports SET search_vector = {PG_VECTOR_SQL} WHERE is_finalized"))
+        else:
+            return 0
+    if result.rowcount:
+        logger.info("Indexed %s finalized reports for search", result.rowcount)
+    return result.rowcount
+
+
+def _base_query(db: Session, *extra) -> Query:
+    return db.query(
+        models.Report.id.label("report_id"),
+        models.Study.id.label("study_id"),
+        models.Study.patient_id,
+        models.Study.modality,
+        models.Study.study_datetime,
+        models.Study.radiologist_id,
+        models.Report.finalized_at,
+        *extra,
+    )
+
+
+def _apply_filters(query: Query, filters: SearchFilters) -> Query:
+    query = query.filter(models.Report.is_finalized.is_(True))
+    if filters.modality is not None:
+        query = query.filter(models.Study.modality == filters.modality)
+    if filters.radiologist_id is not None:
+        query = query.filter(models.Study.radiologist_id == filters.radiologist_id)
+    if filters.date_from is not None:
+        query = query.filter(models.Study.study_datetime >= datetime.combine(filters.date_from, time.min))
+    if filters.date_to is not None:
+        query = query.filter(models.Study.study_datetime <= datetime.combine(filters.date_to, time.max))
+    return query
+
+
+def _sqlite_query(db: Session, q: str) -> Optional[Query]:
+    match = fts5_query(q)
+    if not match:
+        return None
+    search = literal_column("report_search")
+    rank = func.bm25(search, FINDINGS_WEIGHT, IMPRESSION_WEIGHT)
+    snippet = func.snippet(search, -1, SNIPPET_START, SNIPPET_END, "…", SNIPPET_TOKENS)
+    return (
+        _base_query(db, (-rank).label("rank"), snippet.label("snippet"))
+        .select_from(fts_table)
+        .join(models.Report, models.Report.id == fts_table.c.rowid)
+        .join(models.Study, models.Study.id == models.Report.study_id)
+        .filter(text("report_search MATCH :match").bindparams(match=match))
+        .order_by(rank)
+    )
+
+
+def _postgres_query(db: Session, q: str) -> Query:
+    tsquery = func.websearch_to_tsquery(TS_CONFIG, q)
+    vector = literal_column("reports.search_vector")
+    rank = func.ts_rank_cd(vector, tsquery)
+    document = func.coalesce(models.Report.impression, "") + " " + func.coalesce(models.Report.findings, "")
+    snippet = func.ts_headline(
+        TS_CONFIG,
+        document,
+        tsquery,
+        f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MaxWords={SNIPPET_TOKENS * 2}, MinWords={SNIPPET_TOKENS // 2}",
+    )
+    return (
+        _base_query(db, rank.label("rank"), snippet.label("snippet"))
+        .select_from(models.Report)
+        .join(models.Study, models.Study.id == models.Report.study_id)
+        .filter(vector.op("@@")(tsquery))
+        .order_by(rank.desc(), models.Report.id.desc())
+    )
+
+
+def highlight(snippet: Optional[str]) -> Optional[str]:
+    """HTML-escape a database snippet and turn its match delimiters into <mark> tags."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_START, HIGHLIGHT_START).replace(SNIPPET_END, HIGHLIGHT_END)
+
+
+def search_reports(
+    db: Session, q: str, filters: SearchFilters, page: int = 1, page_size: int = 20
+) -> Tuple[List[dict], bool]:
+    """
+    Return one page of ranked hits and whether another page follows. No total is computed:
+    counting every match of a common term over millions of reports would cost more than the page itself.
+    """
+    dialect = _dialect(db.get_bind())
+    if dialect == "sqlite":
+        query = _sqlite_query(db, q)
+    elif dialect == "postgresql":
+        query = _postgres_query(db, q)
+    else:
+        raise SearchUnavailable(f"Report search is not supported on {dialect}")
+    if query is None:
+        return [], False
+    rows = _apply_filters(query, filters).offset((page - 1) * page_size).limit(page_size + 1).all()
+    hits = [dict(row._mapping) for row in rows[:page_size]]
+    for hit in hits:
+        hit["snippet"] = highlight(hit["snippet"])
+    return hits, len(rows) > page_size
@@ -0,0 +1,265 @@
+"""
+State shared between API workers: small cached values, counters, single-flight locks and rate limits.
+
+The backend is chosen by SHARED_STATE_URL:
+    memory://                 this process only (default; fine for a single worker)
+    sqlite:///path/state.db   all workers on one host
+    redis://host:6379/0       any number of hosts (requires the redis package)
+"""
+import abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from backend.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class SharedState(abc.ABC):
+    """Interface implemented by every backend. Values must be JSON-serialisable."""
+
+    shared_across_processes = False
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter; ttl applies when the counter is created."""
+
+    @abc.abstractmethod
+    def counters(self, prefix: str) -> Dict[str, int]:
+        ...
+
+    @abc.abstractmethod
+    def acquire(self, name: str, ttl: float) -> Optional[str]:
+        """Take a lock for at most ttl seconds. Returns a token for release(), or None if held elsewhere."""
+
+    @abc.abstractmethod
+    def release(self, name: str, token: str) -> None:
+        ...
+
+    def hit(self, key: str, limit: int, window: float) -> bool:
+        """Fixed-window rate limit: count one hit and return False once limit is exceeded in the window."""
+        bucket = int(time.time() // window)
+        return self.incr(f"ratelimit:{key}:{bucket}", ttl=window * 2) <= limit
+
+
+class MemoryState(SharedState):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._values[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                entry = (0, time.time() + ttl if ttl else None)
+            value = entry[0] + amount
+            self._values[key] = (value, entry[1])
+            return value
+
+    def counters(self, prefix):
+        with self._lock:
+            return {
+                key: entry[0]
+                for key in list(self._values)
+                if key.startswith(prefix) and (entry := self._live(key)) is not None
+            }
+
+    def acquire(self, name, ttl):
+        with self._lock:
+            if self._live(f"lock:{name}") is not None:
+                return None
+            token = uuid.uuid4().hex
+            self._values[f"lock:{name}"] = (token, time.time() + ttl)
+            return token
+
+    def release(self, name, token):
+        with self._lock:
+            entry = self._live(f"lock:{name}")
+            if entry is not None and entry[0] == token:
+                del self._values[f"lock:{name}"]
+
+
+class SQLiteState(SharedState):
+    """Shared by every process that opens the same file; each call is a single short transaction."""
+
+    shared_across_processes = True
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS shared_state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        # Counters are stored as plain integers, everything else as JSON text.
+        return json.loads(row[0]) if isinstance(row[0], str) else row[0]
+
+    def set(self, key, value, ttl=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None),
+            )
+
+    def delete(self, key):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                (key, amount, time.time() + ttl if ttl else None),
+            )
+            return int(conn.execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()[0])
+
+    def counters(self, prefix):
+        rows = self._connect().execute(
+            "SELECT key, value FROM shared_state WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "\uffff", time.time()),
+        ).fetchall()
+        return {key: int(value) for key, value in rows}
+
+    def acquire(self, name, ttl):
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (f"lock:{name}", json.dumps(token), time.time() + ttl),
+            )
+            return token if cursor.rowcount == 1 else None
+
+    def release(self, name, token):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM shared_state WHERE key = ? AND value = ?", (f"lock:{name}", json.dumps(token)))
+
+
+class RedisState(SharedState):
+    """Works with Redis and wire-compatible servers (Valkey, KeyDB, Dragonfly)."""
+
+    shared_across_processes = True
+
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    _INCR = (
+        "local v = redis.call('incrby', KEYS[1], ARGV[1]) "
+        "if v == tonumber(ARGV[1]) and tonumber(ARGV[2]) > 0 then redis.call('pexpire', KEYS[1], ARGV[2]) end "
+        "return v"
+    )
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("SHARED_STATE_URL points at Redis but the redis package is not installed") from exc
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._release = self._redis.register_script(self._RELEASE)
+        self._incr = self._redis.register_script(self._INCR)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        return int(self._incr(keys=[key], args=[amount, int(ttl * 1000) if ttl else 0]))
+
+    def counters(self, prefix):
+        keys = list(self._redis.scan_iter(match=f"{prefix}*"))
+        values = self._redis.mget(keys) if keys else []
+        return {key: int(value) for key, value in zip(keys, values) if value is not None}
+
+    def acquire(self, name, ttl):
+        token = uuid.uuid4().hex
+        return token if self._redis.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000)) else None
+
+    def release(self, name, token):
+        self._release(keys=[f"lock:{name}"], args=[token])
+
+
+def create_state(url: str) -> SharedState:
+    if url.startswith("memory://"):
+        return MemoryState()
+    if url.startswith("sqlite:///"):
+        return SQLiteState(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url)
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+@lru_cache
+def get_shared_state() -> SharedState:
+    return create_state(get_settings().shared_state_url)
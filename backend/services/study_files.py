@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import BinaryIO, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.services.upload_store import CHUNK_SIZE, UploadStore, shard_key
+
+logger = logging.getLogger(__name__)
+
+
+def file_type_for(filename: str) -> str:
+    if filename.lower().endswith((".dcm", ".dicom")):
+        return "dicom"
+    return os.path.splitext(filename)[1].lstrip(".")
+
+
+def _digest(source: BinaryIO) -> Tuple[str, int]:
+    sha256 = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        sha256.update(chunk)
+        size += len(chunk)
+    source.seek(0)
+    return sha256.hexdigest(), size
+
+
+async def store_upload(db: Session, store: UploadStore, study_id: int, upload: UploadFile) -> models.StudyFile:
+    """
+    Save an uploaded file and append its study_files row. The caller owns the transaction.
+    Every upload gets its own object, so re-uploading or concurrently uploading a name never overwrites
+    the bytes another row's size and checksum describe. Raises ValueError for unusable file names.
+    """
+    name = shard_key(study_id, upload.filename or "").rsplit("/", 1)[-1]
+    stem, ext = os.path.splitext(name)
+    key = shard_key(study_id, f"{stem}_{uuid.uuid4().hex[:12]}{ext}")
+    digest, size = await asyncio.to_thread(_digest, upload.file)
+    location = await store.save(key, upload.file)
+    entry = models.StudyFile(
+        study_id=study_id,
+        filename=name,
+        location=location,
+        file_type=file_type_for(name),
+        content_type=upload.content_type,
+        size_bytes=size,
+        sha256=digest,
+    )
+    db.add(entry)
+    return entry
+
+
+def migrate_image_paths_column(engine, batch_size: int = 500) -> int:
+    """
+    Copy paths left in the legacy studies.image_paths JSON column into study_files and clear them.
+    Returns the number of studies migrated; a no-op once the column is empty or gone.
+    """
+    columns = {col["name"] for col in inspect(engine).get_columns("studies")}
+    if "image_paths" not in columns:
+        return 0
+    migrated = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(
+                text("SELECT id, image_paths FROM studies WHERE image_paths IS NOT NULL LIMIT :limit"),
+                {"limit": batch_size},
+            ).all()
+            if not rows:
+                break
+            entries = []
+            for study_id, raw in rows:
+                paths: Optional[list] = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+                for path in paths or []:
+                    name = os.path.basename(path)
+                    entries.append(
+                        {"study_id": study_id, "filename": name, "location": path, "file_type": file_type_for(name)}
+                    )
+            if entries:
+                conn.execute(models.StudyFile.__table__.insert(), entries)
+            conn.execute(
+                text("UPDATE studies SET image_paths = NULL WHERE id IN ({})".format(",".join(str(r[0]) for r in rows)))
+            )
+            migrated += len(rows)
+    if migrated:
+        logger.info("Moved image paths of %s studies into study_files", migrated)
+    return migrated
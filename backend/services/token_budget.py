@@ -0,0 +1,57 @@
+"""
+Rough prompt token accounting. Estimates use ~4 characters per token plus the chat format's
+per-message overhead, which is close enough to enforce a budget before a request is sent.
+"""
+import logging
+import math
+from typing import Any, Dict, List, Optional
+
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+class PromptBudgetExceeded(ValueError):
+    def __init__(self, estimated: int, budget: int):
+        super().__init__(f"Prompt is about {estimated} tokens, over the {budget} token budget")
+        self.estimated = estimated
+        self.budget = budget
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return TOKENS_PER_REPLY + sum(TOKENS_PER_MESSAGE + estimate_tokens(m.get("content") or "") for m in messages)
+
+
+def enforce_budget(messages: List[Dict[str, str]], budget: int) -> int:
+    estimated = estimate_message_tokens(messages)
+    if budget and estimated > budget:
+        raise PromptBudgetExceeded(estimated, budget)
+    return estimated
+
+
+def record_usage(raw: Optional[Dict[str, Any]], estimated: int) -> None:
+    """Log and count the token usage reported in a raw completion."""
+    usage = (raw or {}).get("usage") or {}
+    if not usage:
+        return
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    metrics.increment("llm.prompt_tokens", prompt_tokens)
+    metrics.increment("llm.completion_tokens", completion_tokens)
+    metrics.increment("llm.cached_prompt_tokens", cached_tokens)
+    logger.info(
+        "LLM usage: prompt=%s (estimated %s, cached %s) completion=%s",
+        prompt_tokens,
+        estimated,
+        cached_tokens,
+        completion_tokens,
+    )
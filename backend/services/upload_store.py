@@ -0,0 +1,430 @@
+"""
+Storage for uploaded study files and report PDFs.
+
+Objects are addressed by keys of the form "ab/cd/<study_id>/<filename>", where "ab/cd" are the first
+hex digits of a hash of the study id, so no directory (or listing prefix) holds more than 256 children
+however many studies exist. A store turns a key into the location string kept in the database: a
+filesystem path for LocalUploadStore, "s3://bucket/key" for S3UploadStore.
+
+Blocking file I/O runs in worker threads so uploads and downloads never stall the event loop.
+File uploads to S3 larger than one part go up as multipart uploads, so at most two parts are in memory.
+"""
+import abc
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Union
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+from sqlalchemy.orm import Session
+
+from backend import models
+from backend.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# S3 requires every part but the last to be at least 5 MiB.
+PART_SIZE = 8 * 1024 * 1024
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+Source = Union[bytes, BinaryIO]
+
+
+def shard_key(study_id: int, filename: str) -> str:
+    name = os.path.basename(filename.replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid file name: {filename!r}")
+    digest = hashlib.sha1(str(study_id).encode()).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{study_id}/{name}"
+
+
+def is_local(location: str) -> bool:
+    return not location.startswith("s3://")
+
+
+async def _iter_local(path: str) -> AsyncIterator[bytes]:
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+def _remove_local(path: str) -> None:
+    with suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class UploadStore(abc.ABC):
+    """
+    Interface implemented by every backend. Locations written before a backend switch keep working:
+    filesystem paths are always read from disk.
+    """
+
+    @abc.abstractmethod
+    def location_for(self, key: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    async def save(self, key: str, source: Source) -> str:
+        """Write bytes or a readable binary file under key and return its location."""
+
+    def iter_chunks(self, location: str) -> AsyncIterator[bytes]:
+        """Stream a stored object; raises FileNotFoundError when it does not exist."""
+        return _iter_local(location)
+
+    async def read(self, location: str) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks(location)])
+
+    async def delete(self, location: str) -> None:
+        await asyncio.to_thread(_remove_local, location)
+
+    def local_path(self, location: str) -> Optional[str]:
+        return location if is_local(location) else None
+
+
+class LocalUploadStore(UploadStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def location_for(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    async def save(self, key: str, source: Source) -> str:
+        path = self.location_for(key)
+        await asyncio.to_thread(self._write, path, source)
+        return path
+
+    @staticmethod
+    def _write(path: str, source: Source) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed so readers never see a partial file.
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(partial, "wb") as f:
+                if isinstance(source, bytes):
+                    f.write(source)
+                else:
+                    shutil.copyfileobj(source, f, CHUNK_SIZE)
+            os.replace(partial, path)
+        except BaseException:
+            _remove_local(partial)
+            raise
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def sign_v4(
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    payload_hash: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    now: Optional[datetime] = None,
+    service: str = "s3",
+) -> Dict[str, str]:
+    """Return headers with an AWS Signature Version 4 Authorization added."""
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    day = amz_date[:8]
+    parts = urlsplit(url)
+    signed = {k.lower(): str(v).strip() for k, v in headers.items()}
+    signed["host"] = parts.netloc
+    signed["x-amz-date"] = amz_date
+    signed["x-amz-content-sha256"] = payload_hash
+    names = sorted(signed)
+    query = "&".join(
+        sorted(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+            for k, _, v in (pair.partition("=") for pair in parts.query.split("&") if pair)
+        )
+    )
+    canonical_request = "\n".join(
+        [
+            method,
+            parts.path or "/",
+            query,
+            "".join(f"{name}:{signed[name]}\n" for name in names),
+            ";".join(names),
+            payload_hash,
+        ]
+    )
+    scope = f"{day}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join(
+        ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+    )
+    key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode(), day), region), service), "aws4_request")
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    signed["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={';'.join(names)}, Signature={signature}"
+    )
+    signed.pop("host")
+    return signed
+
+
+@dataclass
+class StoredObject:
+    """A GET from the object store: status (200, 206, 304, 412 or 416), response headers and the body."""
+
+    status_code: int
+    headers: Dict[str, str]
+    body: AsyncIterator[bytes]
+
+
+async def _no_body() -> AsyncIterator[bytes]:
+    return
+    yield
+
+
+def _xml_text(document: bytes, tag: str) -> Optional[str]:
+    for element in ElementTree.fromstring(document).iter():
+        if element.tag.rsplit("}", 1)[-1] == tag:
+            return element.text
+    return None
+
+
+class S3UploadStore(UploadStore):
+    """S3-compatible object storage (AWS S3, MinIO, Ceph RGW, ...) over path-style HTTP requests."""
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str = "https://s3.amazonaws.com",
+        region: str = "us-east-1",
+        access_key: str = "",
+        secret_key: str = "",
+        part_size: int = PART_SIZE,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.part_size = part_size
+
+    @staticmethod
+    def _client():
+        # A client per operation: requests may run on different event loops (workers, test clients).
+        import httpx
+
+        return httpx.AsyncClient(timeout=60)
+
+    def location_for(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+    def _url(self, location: str) -> str:
+        object_key = location[len(f"s3://{self.bucket}/"):]
+        return f"{self.endpoint_url}/{self.bucket}/{quote(object_key, safe='/-_.~')}"
+
+    def _headers(self, method: str, url: str, payload_hash: str, extra: Optional[Dict[str, str]] = None):
+        return sign_v4(method, url, extra or {}, payload_hash, self.access_key, self.secret_key, self.region)
+
+    async def _send(self, client, method: str, url: str, data: bytes = b""):
+        headers = self._headers(method, url, hashlib.sha256(data).hexdigest(), {"content-length": str(len(data))})
+        response = await client.request(method, url, content=data, headers=headers)
+        response.raise_for_status()
+        return response
+
+    async def save(self, key: str, source: Source) -> str:
+        location = self.location_for(key)
+        url = self._url(location)
+        if isinstance(source, bytes):
+            parts = [source]
+        else:
+            parts = [await asyncio.to_thread(source.read, self.part_size)]
+            if len(parts[0]) == self.part_size:
+                parts.append(await asyncio.to_thread(source.read, self.part_size))
+        async with self._client() as client:
+            if len(parts) == 1 or not parts[1]:
+                await self._send(client, "PUT", url, parts[0])
+            else:
+                await self._multipart_upload(client, url, parts, source)
+        return location
+
+    async def _multipart_upload(self, client, url: str, parts: List[bytes], source: BinaryIO) -> None:
+        created = await self._send(client, "POST", f"{url}?uploads=")
+        upload_id = _xml_text(created.content, "UploadId")
+        if not upload_id:
+            raise RuntimeError(f"S3 did not return an UploadId for {url}")
+        upload = f"uploadId={quote(upload_id, safe='-_.~')}"
+        etags = []
+        try:
+            number = 0
+            while parts[0]:
+                number += 1
+                response = await self._send(client, "PUT", f"{url}?partNumber={number}&{upload}", parts.pop(0))
+                etags.append(response.headers["etag"])
+                if not parts:
+                    parts.append(await asyncio.to_thread(source.read, self.part_size))
+            manifest = "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for number, etag in enumerate(etags, start=1)
+            )
+            body = f"<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>".encode()
+            completed = await self._send(client, "POST", f"{url}?{upload}", body)
+            # S3 can report a failed completion in the body of a 200 response.
+            if _xml_text(completed.content, "Code"):
+                raise RuntimeError(f"S3 multipart upload failed: {completed.text}")
+        except BaseException:
+            with suppress(Exception):
+                await client.delete(f"{url}?{upload}", headers=self._headers("DELETE", f"{url}?{upload}", EMPTY_SHA256))
+            raise
+
+    async def get_object(self, location: str, headers: Optional[Dict[str, str]] = None) -> StoredObject:
+        """
+        GET an object, passing on conditional and Range request headers (If-None-Match, Range, ...), so
+        304, 206, 412 and 416 come back from the store as they would from serve_file.
+        Raises FileNotFoundError when the object does not exist.
+        """
+        url = self._url(location)
+        client = self._client()
+        try:
+            request = client.build_request("GET", url, headers=self._headers("GET", url, EMPTY_SHA256, headers))
+            response = await client.send(request, stream=True)
+        except BaseException:
+            await client.aclose()
+            raise
+
+        async def close():
+            await response.aclose()
+            await client.aclose()
+
+        if response.status_code in (200, 206):
+
+            async def body() -> AsyncIterator[bytes]:
+                try:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        yield chunk
+                finally:
+                    await close()
+
+            return StoredObject(response.status_code, dict(response.headers), body())
+        await close()
+        if response.status_code == 404:
+            raise FileNotFoundError(location)
+        if response.status_code in (304, 412, 416):
+            return StoredObject(response.status_code, dict(response.headers), _no_body())
+        response.raise_for_status()
+        raise RuntimeError(f"Unexpected S3 response {response.status_code} for {location}")
+
+    async def iter_chunks(self, location: str) -> AsyncIterator[bytes]:
+        if is_local(location):
+            async for chunk in _iter_local(location):
+                yield chunk
+            return
+        stored = await self.get_object(location)
+        async for chunk in stored.body:
+            yield chunk
+
+    async def delete(self, location: str) -> None:
+        if is_local(location):
+            await super().delete(location)
+            return
+        url = self._url(location)
+        async with self._client() as client:
+            response = await client.delete(url, headers=self._headers("DELETE", url, EMPTY_SHA256))
+        if response.status_code != 404:
+            response.raise_for_status()
+
+
+@lru_cache
+def _create_store(url: str, upload_dir: str) -> UploadStore:
+    if not url:
+        return LocalUploadStore(upload_dir)
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        settings = get_settings()
+        return S3UploadStore(
+            bucket,
+            prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            region=settings.s3_region,
+            access_key=settings.s3_access_key,
+            secret_key=settings.s3_secret_key,
+        )
+    raise ValueError(f"Unsupported UPLOAD_STORE_URL: {url}")
+
+
+def get_upload_store() -> UploadStore:
+    settings = get_settings()
+    return _create_store(settings.upload_store_url, settings.upload_dir)
+
+
+@dataclass
+class MigrationResult:
+    moved: int = 0
+    skipped: int = 0
+    missing: int = 0
+
+
+async def _migrate_location(
+    store: UploadStore, study_id: int, location: str, result: MigrationResult, dry_run: bool, copied: List[str]
+) -> str:
+    """Copy a legacy file into store and return its new location; its path is added to copied for removal."""
+    target = store.location_for(shard_key(study_id, location))
+    if location == target:
+        result.skipped += 1
+        return location
+    if not os.path.exists(location):
+        logger.warning("Cannot migrate missing upload %s", location)
+        result.missing += 1
+        return location
+    result.moved += 1
+    if dry_run:
+        return location
+    with open(location, "rb") as source:
+        new_location = await store.save(shard_key(study_id, location), source)
+    copied.append(location)
+    return new_location
+
+
+def _remove_legacy(paths: List[str]) -> None:
+    for path in paths:
+        _remove_local(path)
+        with suppress(OSError):
+            os.rmdir(os.path.dirname(path))
+
+
+async def migrate_legacy_uploads(db: Session, store: UploadStore, dry_run: bool = False) -> MigrationResult:
+    """
+    Move files written in the flat upload_dir/<study_id>/ layout into store and rewrite their locations.
+    Safe to re-run: files already at their sharded location are skipped, and the legacy copies are only
+    removed once the new locations are committed, so an interrupted run leaves every row readable.
+    """
+    result = MigrationResult()
+    study_ids = [study_id for (study_id,) in db.query(models.Study.id).order_by(models.Study.id)]
+    for study_id in study_ids:
+        copied: List[str] = []
+        for entry in db.query(models.StudyFile).filter(models.StudyFile.study_id == study_id).order_by(models.StudyFile.id):
+            location = await _migrate_location(store, study_id, entry.location, result, dry_run, copied)
+            if not dry_run:
+                entry.location = location
+        report = db.query(models.Report).filter(models.Report.study_id == study_id).first()
+        if report and report.pdf_path:
+            location = await _migrate_location(store, study_id, report.pdf_path, result, dry_run, copied)
+            if not dry_run:
+                report.pdf_path = location
+        if not dry_run:
+            db.commit()
+            await asyncio.to_thread(_remove_legacy, copied)
+    return result
@@ -0,0 +1,43 @@
+"""
+Optimistic concurrency for Report and Study.
+
+Both tables carry a version column registered as the mapper's version_id_col, so SQLAlchemy turns
+every UPDATE into a compare-and-swap on (id, version) and raises StaleDataError when another writer
+got there first. Clients may also send the version they last read to reject stale edits up front.
+"""
+import logging
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+VERSIONED_TABLES = ("reports", "studies")
+
+
+def expect_version(entity, expected: Optional[int]) -> None:
+    if expected is not None and entity.version != expected:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{type(entity).__name__} was modified (version {entity.version}, expected {expected}); reload and retry",
+        )
+
+
+def conflict(entity_name: str) -> HTTPException:
+    return HTTPException(status_code=409, detail=f"{entity_name} was modified concurrently; reload and retry")
+
+
+def add_version_columns(engine) -> int:
+    """Add the version column to tables created before it existed. Returns the number of tables changed."""
+    inspector = inspect(engine)
+    added = 0
+    with engine.begin() as conn:
+        for table in VERSIONED_TABLES:
+            if "version" in {col["name"] for col in inspector.get_columns(table)}:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+            added += 1
+    if added:
+        logger.info("Added version columns to %s tables", added)
+    return added
@@ -0,0 +1,119 @@
+"""
+Minimal OpenAI-compatible chat completions server for exercising LLM failure modes.
+
+Behaviour is scripted per model through POST /_control, e.g.
+    {"model": "gpt-4o-mini", "script": [{"status": 500}, {"delay": 2.0}, {}]}
+Each request for the model consumes the next step; once the script is exhausted requests succeed.
+A step may set "status" (error response), "delay" (seconds before responding) and "content".
+
+Run standalone with: python -m backend.tests.fake_openai --port 8089
+"""
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DEFAULT_CONTENT = json.dumps(
+    {
+        "technique": "Fake technique",
+        "findings": "Fake findings",
+        "impression": "Fake impression",
+        "internal_checks": ["No inconsistencies detected."],
+    }
+)
+
+app = FastAPI(title="Fake OpenAI")
+scripts: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+requests_seen: List[str] = []
+
+
+@app.post("/_control")
+async def control(payload: Dict[str, Any]):
+    scripts[payload["model"]] = deque(payload.get("script", []))
+    return {"ok": True}
+
+
+@app.post("/_reset")
+async def reset():
+    scripts.clear()
+    requests_seen.clear()
+    return {"ok": True}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "")
+    requests_seen.append(model)
+    step = scripts[model].popleft() if scripts[model] else {}
+    if step.get("delay"):
+        await asyncio.sleep(step["delay"])
+    if step.get("status"):
+        return JSONResponse(
+            status_code=step["status"],
+            content={"error": {"message": f"scripted {step['status']}", "type": "fake_error", "code": None}},
+        )
+    return {
+        "id": f"chatcmpl-fake-{len(requests_seen)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": step.get("content", DEFAULT_CONTENT)},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }
+
+
+class BackgroundServer:
+    """Runs an ASGI app on a free local port in a background thread."""
+
+    def __init__(self, asgi_app):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+class FakeOpenAIServer(BackgroundServer):
+    def __init__(self):
+        super().__init__(app)
+        self.base_url = f"{self.url}/v1"
+
+    def script(self, model: str, steps: List[Dict[str, Any]]) -> None:
+        scripts[model] = deque(steps)
+
+    @property
+    def requests(self) -> List[str]:
+        return requests_seen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
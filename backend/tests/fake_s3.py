@@ -0,0 +1,133 @@
+"""
+In-memory stand-in for an S3-compatible object store (MinIO, AWS S3) covering PUT/GET/HEAD/DELETE
+of single objects and multipart uploads with path-style addressing; GET honours If-None-Match and
+single byte ranges. Every request must carry a valid Signature V4 for ACCESS_KEY/SECRET_KEY.
+
+Run standalone with: python -m backend.tests.fake_s3 --port 9009
+"""
+import argparse
+import hashlib
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from backend.services.upload_store import sign_v4
+from backend.tests.fake_openai import BackgroundServer
+
+ACCESS_KEY = "minioadmin"
+SECRET_KEY = "minioadmin-secret"
+REGION = "us-east-1"
+
+app = FastAPI(title="Fake S3")
+objects: Dict[str, bytes] = {}
+uploads: Dict[str, Dict[int, bytes]] = {}
+# Every request as (method, query string), for asserting how a client talked to the store.
+requests: List[tuple] = []
+
+
+def _error(status: int, code: str) -> Response:
+    return Response(status_code=status, content=f"<Error><Code>{code}</Code></Error>", media_type="application/xml")
+
+
+def _signature_valid(request: Request, body: bytes) -> bool:
+    amz_date = request.headers.get("x-amz-date", "")
+    payload_hash = request.headers.get("x-amz-content-sha256", "")
+    authorization = request.headers.get("authorization", "")
+    if payload_hash != hashlib.sha256(body).hexdigest():
+        return False
+    try:
+        now = datetime.strptime(amz_date, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        signed_names = authorization.split("SignedHeaders=")[1].split(",")[0].split(";")
+    except (ValueError, IndexError):
+        return False
+    headers = {name: request.headers[name] for name in signed_names if name not in ("host", "x-amz-date", "x-amz-content-sha256")}
+    # Signatures cover the path exactly as sent, so use the raw (still percent-encoded) path.
+    url = f"{request.url.scheme}://{request.headers['host']}{request.scope['raw_path'].decode()}"
+    if request.url.query:
+        url += f"?{request.url.query}"
+    expected = sign_v4(request.method, url, headers, payload_hash, ACCESS_KEY, SECRET_KEY, REGION, now)
+    return expected["authorization"] == authorization
+
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def _multipart(request: Request, name: str, body: bytes) -> Response:
+    params = request.query_params
+    if request.method == "POST" and "uploads" in params:
+        upload_id = uuid.uuid4().hex
+        uploads[upload_id] = {}
+        return Response(f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+    parts = uploads.get(params.get("uploadId", ""))
+    if parts is None:
+        return _error(404, "NoSuchUpload")
+    if request.method == "PUT":
+        parts[int(params["partNumber"])] = body
+        return Response(status_code=200, headers={"ETag": _etag(body)})
+    if request.method == "DELETE":
+        del uploads[params["uploadId"]]
+        return Response(status_code=204)
+    numbers = [int(number) for number in re.findall(r"<PartNumber>(\d+)</PartNumber>", body.decode())]
+    objects[name] = b"".join(parts[number] for number in numbers)
+    del uploads[params["uploadId"]]
+    return Response("<CompleteMultipartUploadResult></CompleteMultipartUploadResult>")
+
+
+@app.api_route("/{bucket}/{key:path}", methods=["PUT", "GET", "HEAD", "DELETE", "POST"])
+async def object_api(bucket: str, key: str, request: Request):
+    body = await request.body()
+    requests.append((request.method, request.url.query))
+    if not _signature_valid(request, body):
+        return _error(403, "SignatureDoesNotMatch")
+    name = f"{bucket}/{key}"
+    if "uploads" in request.query_params or "uploadId" in request.query_params:
+        return _multipart(request, name, body)
+    if request.method == "PUT":
+        objects[name] = body
+        return Response(status_code=200, headers={"ETag": _etag(body)})
+    if name not in objects:
+        return _error(404, "NoSuchKey")
+    if request.method == "DELETE":
+        del objects[name]
+        return Response(status_code=204)
+    data = objects[name]
+    headers = {"ETag": _etag(data), "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    match = re.fullmatch(r"bytes=(\d+)-(\d*)", request.headers.get("range", ""))
+    if match:
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(data) - 1), len(data) - 1)
+        if start >= len(data):
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{len(data)}"})
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(data[start : end + 1], status_code=206, headers=headers, media_type="application/octet-stream")
+    return Response(data if request.method == "GET" else b"", headers=headers, media_type="application/octet-stream")
+
+
+class FakeS3Server(BackgroundServer):
+    def __init__(self):
+        super().__init__(app)
+        objects.clear()
+        uploads.clear()
+        requests.clear()
+
+    @property
+    def objects(self) -> Dict[str, bytes]:
+        return objects
+
+    @property
+    def requests(self) -> List[tuple]:
+        return requests
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9009)
+    args = parser.parse_args()
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,102 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+from backend.database import Base
+from backend.services import analytics
+
+
+def _finalize(db, study, report, when):
+    report.is_finalized = True
+    report.finalized_at = when
+    study.status = models.StudyStatus.finalized
+    return analytics.record_finalized(db, study, report)
+
+
+def _reopen(report):
+    # What a new draft does to a finalized report; the study keeps its finalized status.
+    report.is_finalized = False
+    report.finalized_at = None
+
+
+def test_incremental_aggregates_match_rebuild():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    start = datetime(2024, 3, 4, 8, 0)
+    with Session() as db:
+        user = models.User(email="a@example.com", full_name="A", hashed_password="x", role="radiologist")
+        patient = models.Patient(full_name="P", nhi="ANA0001")
+        db.add_all([user, patient])
+        db.flush()
+        reports = []
+        for n, modality in enumerate([models.ModalityEnum.CHEST_XRAY] * 2 + [models.ModalityEnum.ABDOMINAL_CT]):
+            study = models.Study(patient_id=patient.id, radiologist_id=user.id, modality=modality, created_at=start)
+            db.add(study)
+            db.flush()
+            analytics.record_study_created(db, study)
+            drafted_at = start + timedelta(minutes=10 * (n + 1))
+            report = models.Report(study_id=study.id, created_at=drafted_at)
+            db.add(report)
+            reports.append((study, report))
+            analytics.record_drafted(db, study, drafted_at)
+            if modality == models.ModalityEnum.CHEST_XRAY:
+                _finalize(db, study, report, start + timedelta(minutes=60 * (n + 1)))
+        db.commit()
+
+        # Re-finalizing the first report days later, and reopening the second, keep the first finalize.
+        (first_study, first_report), (_, second_report) = reports[:2]
+        _reopen(second_report)
+        _reopen(first_report)
+        assert not _finalize(db, first_study, first_report, start + timedelta(days=3))
+        db.commit()
+
+        incremental = analytics.turnaround(db, ["modality"])
+        assert incremental == [
+            {
+                "modality": models.ModalityEnum.ABDOMINAL_CT,
+                "studies_created": 1,
+                "drafted": 1,
+                "finalized": 0,
+                "avg_create_to_draft_minutes": 30.0,
+                "avg_draft_to_final_minutes": None,
+                "avg_turnaround_minutes": None,
+                "max_turnaround_minutes": None,
+            },
+            {
+                "modality": models.ModalityEnum.CHEST_XRAY,
+                "studies_created": 2,
+                "drafted": 2,
+                "finalized": 2,
+                "avg_create_to_draft_minutes": 15.0,
+                "avg_draft_to_final_minutes": 75.0,
+                "avg_turnaround_minutes": 90.0,
+                "max_turnaround_minutes": 120.0,
+            },
+        ]
+        by_day = analytics.turnaround(db, ["day", "radiologist_id"], date_from=date(2024, 3, 4))
+        assert [(row["day"], row["studies_created"], row["finalized"]) for row in by_day] == [(date(2024, 3, 4), 3, 2)]
+
+    assert analytics.rebuild(engine, only_if_empty=True) == 0
+    assert analytics.rebuild(engine) == 2
+    with Session() as db:
+        assert analytics.turnaround(db, ["modality"]) == incremental
+        assert analytics.turnaround(db, [], date_from=date(2025, 1, 1)) == []
+
+
+def test_first_finalized_column_is_added_and_backfilled():
+    from sqlalchemy import text
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    assert analytics.add_first_finalized_column(engine) is False
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE reports DROP COLUMN first_finalized_at"))
+        conn.execute(text("INSERT INTO reports (id, study_id, finalized_at) VALUES (1, 1, '2024-03-04 09:00:00.000000'), (2, 2, NULL)"))
+    assert analytics.add_first_finalized_column(engine) is True
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, first_finalized_at FROM reports ORDER BY id")).all()
+    assert rows == [(1, "2024-03-04 09:00:00.000000"), (2, None)]
@@ -0,0 +1,65 @@
+import json
+import os
+
+from backend import models
+from backend.services.consistency_rules import RuleEngine, DEFAULT_RULES_PATH
+from backend.services.report_builder import validate_answers
+
+
+def _write_rules(path, rules, modality="*"):
+    with open(path, "w") as f:
+        json.dump({"version": 1, "modalities": {modality: rules}}, f)
+
+
+def test_default_rules_match_legacy_checks():
+    male = models.Patient(full_name="A", sex="Male")
+    answers = {
+        "left_ovary": "Normal",
+        "gallbladder_status": "Surgically absent",
+        "gallstones": "Multiple",
+        "appendix_visualized": "Not seen",
+        "impression_hint": "Possible appendicitis",
+    }
+    assert validate_answers(answers, male, models.ModalityEnum.ABDOMINAL_ULTRASOUND) == [
+        "Patient sex is male but gynecologic findings provided.",
+        "Gallbladder marked absent but stones flagged present.",
+        "Appendix not visualized but impression suggests appendicitis.",
+    ]
+    female = models.Patient(full_name="B", sex="Female")
+    assert validate_answers({"uterus": "Normal", "gallstones": "No", "gallbladder_status": "Absent"}, female) == []
+
+
+def test_only_rules_for_present_fields_are_evaluated(tmp_path):
+    path = tmp_path / "rules.json"
+    rules = [{"id": f"r{i}", "message": f"m{i}", "when": [{"field": f"field_{i}", "in": ["bad"]}]} for i in range(500)]
+    _write_rules(path, rules)
+    engine = RuleEngine(str(path), reload_interval=0)
+    index = engine.index_for(None)
+    answers = {"field_7": "BAD", "field_9": "fine"}
+    assert [rule.rule_id for rule in index.candidates(answers)] == ["r7", "r9"]
+    assert engine.evaluate(answers, None) == ["m7"]
+
+
+def test_modality_specific_rules_and_hot_reload(tmp_path):
+    path = tmp_path / "rules.json"
+    rule = {"id": "cxr", "message": "Effusion without side", "when": [{"field": "effusion", "in": ["yes"]}]}
+    _write_rules(path, [rule], modality="CHEST_XRAY")
+    engine = RuleEngine(str(tmp_path), reload_interval=0)
+    assert engine.evaluate({"effusion": "Yes"}, None, models.ModalityEnum.CHEST_XRAY) == ["Effusion without side"]
+    assert engine.evaluate({"effusion": "Yes"}, None, models.ModalityEnum.ABDOMINAL_CT) == []
+
+    rule["message"] = "Effusion laterality missing"
+    _write_rules(path, [rule], modality="CHEST_XRAY")
+    os.utime(path, ns=(1, os.stat(path).st_mtime_ns + 1_000_000_000))
+    assert engine.reload() is True
+    assert engine.evaluate({"effusion": "Yes"}, None, models.ModalityEnum.CHEST_XRAY) == ["Effusion laterality missing"]
+
+    path.write_text("{not json")
+    os.utime(path, ns=(1, os.stat(path).st_mtime_ns + 2_000_000_000))
+    assert engine.reload() is False
+    assert engine.evaluate({"effusion": "Yes"}, None, models.ModalityEnum.CHEST_XRAY) == ["Effusion laterality missing"]
+
+
+def test_packaged_rules_compile():
+    engine = RuleEngine(DEFAULT_RULES_PATH, reload_interval=0)
+    assert len(engine.index_for(None).rules) >= 3
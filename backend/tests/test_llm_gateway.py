@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from backend.config import LLMEndpoint, Settings
+from backend.services.llm_gateway import CircuitBreaker, LLMGateway, LLMRequestRejected, LLMUnavailable
+from backend.tests.fake_openai import FakeOpenAIServer, reset
+
+
+@pytest.fixture(scope="module")
+def fake_server():
+    with FakeOpenAIServer() as server:
+        yield server
+
+
+@pytest.fixture
+def server(fake_server):
+    asyncio.run(reset())
+    return fake_server
+
+
+def _gateway(server, models=("primary",), **overrides):
+    options = dict(llm_retry_base_delay=0.001, llm_hedge_min_delay=5.0)
+    options.update(overrides)
+    settings = Settings(
+        openai_api_key="test-key",
+        llm_endpoints=[LLMEndpoint(model=model, base_url=server.base_url) for model in models],
+        **options,
+    )
+    return LLMGateway(settings)
+
+
+def _complete(gateway):
+    return asyncio.run(gateway.complete([{"role": "user", "content": "hi"}]))
+
+
+def test_retries_transient_errors(server):
+    server.script("primary", [{"status": 500}, {"status": 429}])
+    result = _complete(_gateway(server))
+    assert "Fake findings" in result["content"]
+    assert server.requests == ["primary"] * 3
+
+
+def test_falls_back_to_next_model_and_opens_circuit(server):
+    server.script("primary", [{"status": 503}] * 10)
+    gateway = _gateway(server, models=("primary", "fallback"), llm_max_retries=1, llm_breaker_failure_threshold=1)
+    assert _complete(gateway)["endpoint"].startswith("fallback@")
+    assert server.requests == ["primary", "primary", "fallback"]
+
+    assert _complete(gateway)["endpoint"].startswith("fallback@")
+    assert server.requests[3:] == ["fallback"]
+
+
+def test_hedges_slow_requests(server):
+    server.script("primary", [{"delay": 3.0}])
+    gateway = _gateway(server, llm_hedge_min_delay=0.1)
+    started = time.monotonic()
+    result = _complete(gateway)
+    assert time.monotonic() - started < 2.0
+    assert result["content"]
+    assert server.requests == ["primary", "primary"]
+
+
+def test_client_errors_are_not_retried_or_failed_over(server):
+    server.script("primary", [{"status": 400}])
+    gateway = _gateway(server, models=("primary", "fallback"))
+    with pytest.raises(LLMRequestRejected) as caught:
+        _complete(gateway)
+    assert isinstance(caught.value.__cause__, openai.BadRequestError)
+    assert server.requests == ["primary"]
+
+
+@pytest.mark.parametrize("status", [401, 403, 404])
+def test_auth_and_not_found_errors_fail_over_without_retrying(server, status):
+    server.script("primary", [{"status": status}] * 10)
+    gateway = _gateway(server, models=("primary", "fallback"))
+    assert _complete(gateway)["endpoint"].startswith("fallback@")
+    assert server.requests == ["primary", "fallback"]
+
+
+def test_cancelled_half_open_trial_is_released(server):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 11.0
+
+    server.script("primary", [{"delay": 3.0}])
+    gateway = _gateway(server)
+    gateway.endpoints[0].breaker = breaker
+
+    async def cancel_mid_call():
+        task = asyncio.create_task(gateway.complete([{"role": "user", "content": "hi"}]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_mid_call())
+    assert breaker.allow()
+
+
+def test_all_endpoints_down(server):
+    server.script("primary", [{"status": 502}] * 10)
+    with pytest.raises(LLMUnavailable):
+        _complete(_gateway(server, llm_max_retries=0))
@@ -0,0 +1,29 @@
+import json
+import os
+
+from backend.models import ModalityEnum
+from backend.services.local_drafts import render_normal_draft
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "us_abdomen_sample.json")
+
+
+def test_sample_normal_ultrasound_renders_from_template():
+    with open(SAMPLE_PATH) as f:
+        answers = json.load(f)
+    draft = render_normal_draft(ModalityEnum.ABDOMINAL_ULTRASOUND, answers)
+    assert draft is not None
+    assert draft["impression"] == "Normal abdominal ultrasound."
+    assert "measuring 4 mm" in draft["findings"]
+    assert "No gallstones." in draft["findings"]
+
+
+def test_abnormal_incomplete_or_unknown_answers_fall_back():
+    with open(SAMPLE_PATH) as f:
+        answers = json.load(f)
+    assert render_normal_draft(ModalityEnum.ABDOMINAL_ULTRASOUND, dict(answers, gallstones="Multiple")) is None
+    assert render_normal_draft(ModalityEnum.ABDOMINAL_ULTRASOUND, dict(answers, cbd_diameter_mm=9)) is None
+    for not_a_number in ("nan", "NaN", "inf", float("nan"), True, False, -1, "-0.5"):
+        assert render_normal_draft(ModalityEnum.ABDOMINAL_ULTRASOUND, dict(answers, cbd_diameter_mm=not_a_number)) is None
+    assert render_normal_draft(ModalityEnum.ABDOMINAL_ULTRASOUND, dict(answers, portal_vein="Thrombosed")) is None
+    assert render_normal_draft(ModalityEnum.ABDOMINAL_ULTRASOUND, {"liver": "Normal", "gallstones": "No"}) is None
+    assert render_normal_draft(ModalityEnum.ABDOMINAL_CT, answers) is None
@@ -0,0 +1,88 @@
+import io
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+from backend.database import Base
+from backend.services import patient_import
+
+
+def _engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def test_csv_import_upserts_on_nhi_and_reports_bad_rows():
+    engine = _engine()
+    with Session(engine) as db:
+        db.add(models.Patient(full_name="Old Name", nhi="AAA1111", contact_email="keep@example.com"))
+        db.commit()
+
+    feed = io.StringIO(
+        "full_name,nhi,local_patient_id,dob,sex,contact_email\n"
+        "Alice Smith,AAA1111,L-1,1980-02-03,Female,\n"
+        "Bob Jones,BBB2222,L-2,not-a-date,Male,\n"
+        "Carol White,CCC3333,L-3,1975-07-08,Female,carol@example.com\n"
+        "Carol White-Updated,CCC3333,L-3,1975-07-08,Female,\n"
+        "No Nhi,,L-4,,,\n"
+    )
+    errors = io.StringIO()
+    progress = []
+    with engine.connect() as conn:
+        result = patient_import.import_patients(
+            conn,
+            patient_import.iter_csv_rows(feed),
+            batch_size=2,
+            error_stream=errors,
+            on_progress=lambda r: progress.append(r.processed),
+        )
+
+    assert (result.processed, result.upserted, result.failed) == (5, 4, 1)
+    assert progress == [3, 5]
+    assert "3," in errors.getvalue().splitlines()[1] and "dob" in errors.getvalue()
+    with Session(engine) as db:
+        alice = db.query(models.Patient).filter(models.Patient.nhi == "AAA1111").one()
+        assert alice.full_name == "Alice Smith"
+        assert alice.contact_email == "keep@example.com"
+        carol = db.query(models.Patient).filter(models.Patient.nhi == "CCC3333").one()
+        assert carol.full_name == "Carol White-Updated"
+        assert db.query(models.Patient).count() == 3
+
+
+def test_hl7_adt_pid_parsing():
+    feed = io.StringIO(
+        "MSH|^~\\&|PAS|HOSP|RADIOMED|HOSP|20240101120000||ADT^A04|1|P|2.4\r"
+        "PID|1||ZZZ9999^^^NHI^NH~MRN-42^^^HOSP^MR||Doe^Jane^Q||19900115|F|||||^NET^Internet^jane@example.com\r"
+        "MSH|^~\\&|PAS|HOSP|RADIOMED|HOSP|20240101120100||ADT^A08|2|P|2.4\r"
+        "PID|1||YYY8888||Roe^Richard||1960|M\r"
+    )
+    rows = list(patient_import.iter_hl7_adt(feed))
+    assert rows[0] == (
+        1,
+        {
+            "full_name": "Jane Q Doe",
+            "nhi": "ZZZ9999",
+            "local_patient_id": "MRN-42",
+            "dob": rows[0][1]["dob"],
+            "sex": "Female",
+            "contact_email": "jane@example.com",
+        },
+    )
+    assert str(rows[0][1]["dob"]) == "1990-01-15"
+    assert rows[1][0] == 2 and "_error" in rows[1][1]
+
+
+def test_reimport_matches_rows_without_nhi_on_local_id():
+    engine = _engine()
+    feed = "full_name,nhi,local_patient_id\nNo Nhi,,L-9\nNobody,,\n"
+    for name in ("first", "second"):
+        errors = io.StringIO()
+        with engine.connect() as conn:
+            result = patient_import.import_patients(conn, patient_import.iter_csv_rows(io.StringIO(feed)), error_stream=errors)
+        assert (result.upserted, result.failed) == (1, 1), name
+        assert "nhi or local_patient_id is required" in errors.getvalue()
+    with Session(engine) as db:
+        assert db.query(models.Patient).count() == 1
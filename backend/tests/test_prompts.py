@@ -0,0 +1,54 @@
+import pytest
+
+from backend import models
+from backend.services import report_builder, token_budget
+
+
+def _study(modality=models.ModalityEnum.ABDOMINAL_ULTRASOUND):
+    return models.Study(modality=modality, clinical_indication="RUQ pain")
+
+
+def test_user_prompt_is_compact_and_drops_empty_answers():
+    patient = models.Patient(full_name="John Doe", sex="Male")
+    prompt = report_builder.build_user_prompt(
+        _study(),
+        patient,
+        {"liver": {"size": "Normal", "lesions": None}, "gallstones": "", "spleen": " Normal ", "notes": []},
+    )
+    assert "Study modality: ABDOMINAL_ULTRASOUND" in prompt
+    assert 'Structured answers JSON: {"liver":{"size":"Normal"},"spleen":"Normal"}' in prompt
+    assert "ModalityEnum" not in prompt
+
+
+def test_system_prompts_share_a_stable_prefix():
+    us = report_builder.build_system_prompt(_study())
+    cxr = report_builder.build_system_prompt(_study(models.ModalityEnum.CHEST_XRAY))
+    assert us.startswith(report_builder.SYSTEM_PROMPT_PREFIX)
+    assert cxr.startswith(report_builder.SYSTEM_PROMPT_PREFIX)
+    assert us is report_builder.build_system_prompt(_study())
+
+
+def test_prompt_budget_is_enforced():
+    messages = [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 400}]
+    assert token_budget.estimate_message_tokens(messages) == 3 + 2 * (3 + 100)
+    assert token_budget.enforce_budget(messages, 0) == 209
+    with pytest.raises(token_budget.PromptBudgetExceeded):
+        token_budget.enforce_budget(messages, 200)
+
+
+def test_prior_summary_is_size_bounded():
+    from datetime import datetime
+
+    from backend.services import prior_studies
+
+    priors = [
+        prior_studies.PriorReport(n, datetime(2024, 1, 10 - n), f"Impression {n}. " + "x" * 500) for n in range(5)
+    ]
+    summary = prior_studies.summarize(priors, 600)
+    assert len(summary) <= 600
+    assert summary.startswith("- 2024-01-10: Impression 0.")
+    assert all(len(line) <= prior_studies.ENTRY_MAX_CHARS + 14 for line in summary.splitlines())
+
+    prompt = report_builder.build_user_prompt(_study(), None, {}, priors[:1])
+    assert "Prior reports for comparison only" in prompt
+    assert "Prior reports" not in report_builder.build_user_prompt(_study(), None, {})
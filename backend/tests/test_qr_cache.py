@@ -0,0 +1,54 @@
+from io import BytesIO
+
+from reportlab.pdfgen import canvas
+
+from backend.services import qr_cache
+from backend.services.qr_cache import QRCache, draw_qr
+
+
+def test_qr_cache_evicts_least_recently_used(monkeypatch):
+    calls = []
+    real_encode = qr_cache.encode_matrix
+
+    def counting_encode(url):
+        calls.append(url)
+        return real_encode(url)
+
+    monkeypatch.setattr(qr_cache, "encode_matrix", counting_encode)
+    cache = QRCache(max_entries=2)
+    cache.get("https://example.com/a")
+    cache.get("https://example.com/b")
+    cache.get("https://example.com/a")
+    cache.get("https://example.com/c")
+    assert len(cache) == 2
+    cache.get("https://example.com/a")
+    cache.get("https://example.com/b")
+    assert calls == [
+        "https://example.com/a",
+        "https://example.com/b",
+        "https://example.com/c",
+        "https://example.com/b",
+    ]
+
+
+def test_qr_cache_disk_tier_survives_memory_eviction(tmp_path):
+    url = "https://example.com/reports/1/download"
+    first = QRCache(max_entries=1, disk_dir=str(tmp_path))
+    matrix = first.get(url)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    second = QRCache(max_entries=1, disk_dir=str(tmp_path))
+    assert second._load_from_disk(url) == matrix
+    assert second.get(url) == matrix
+
+
+def test_draw_qr_emits_vector_path_without_images():
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pageCompression=0)
+    draw_qr(c, "https://example.com/reports/2/download", 100, 100, 80)
+    c.showPage()
+    c.save()
+    pdf = buffer.getvalue()
+    assert b"/Subtype /Image" not in pdf
+    assert b"\nBI" not in pdf
+    assert b" re" in pdf
@@ -0,0 +1,137 @@
+import gzip
+import io
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import cli, models
+from backend.database import Base
+from backend.services import report_export
+
+KEY = "test-pseudonym-key"
+
+
+def _engine(reports: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        user = models.User(email="e@example.com", full_name="E", hashed_password="x", role="radiologist")
+        patient = models.Patient(full_name="Jane Roe", nhi="EXP0001", dob=date(1980, 5, 5), sex="Female")
+        db.add_all([user, patient])
+        db.flush()
+        for n in range(reports):
+            study = models.Study(patient_id=patient.id, radiologist_id=user.id, modality=models.ModalityEnum.CHEST_XRAY)
+            db.add(study)
+            db.flush()
+            db.add(
+                models.Report(
+                    study_id=study.id,
+                    findings=f"Findings {n}",
+                    impression=f"Impression {n}",
+                    is_finalized=n != 1,  # one draft that must not be exported
+                    finalized_at=datetime(2024, 1, 1) + timedelta(hours=n),
+                )
+            )
+        db.commit()
+    return engine
+
+
+def _jsonl(result) -> list:
+    return [json.loads(line) for line in gzip.decompress(b"".join(result.body)).splitlines()]
+
+
+def test_export_deidentifies_and_resumes_from_watermark():
+    engine = _engine(4)
+    deid = report_export.Deidentifier(report_export.parse_deid(None), key=KEY)
+    with engine.connect() as conn:
+        result = report_export.export(conn, "jsonl", deid, chunk_size=2)
+        rows = _jsonl(result)
+    assert [row["findings"] for row in rows] == ["Findings 0", "Findings 2", "Findings 3"]
+    assert result.rows == 3
+    assert result.watermark == report_export.Watermark(datetime(2024, 1, 1, 3), rows[-1]["report_id"])
+    first = rows[0]
+    assert "full_name" not in first and "contact_email" not in first
+    assert first["dob"] == 1980 and first["sex"] == "Female" and first["modality"] == "CHEST_XRAY"
+    assert first["nhi"] == deid.pseudonym("EXP0001") != "EXP0001"
+    assert len({row["patient_id"] for row in rows}) == 1
+
+    with sessionmaker(bind=engine)() as db:
+        db.query(models.Report).filter(models.Report.findings == "Findings 1").update(
+            {"is_finalized": True, "finalized_at": datetime(2024, 2, 1)}
+        )
+        db.commit()
+    with engine.connect() as conn:
+        newer = report_export.export(conn, "jsonl", deid, since=result.watermark)
+        assert [row["findings"] for row in _jsonl(newer)] == ["Findings 1"]
+        unchanged = report_export.export(conn, "jsonl", deid, since=newer.watermark)
+        assert _jsonl(unchanged) == [] and unchanged.watermark == newer.watermark
+
+
+def test_watermark_lags_so_a_late_commit_is_not_skipped():
+    engine = _engine(0)
+    deid = report_export.Deidentifier(report_export.parse_deid(None), key=KEY)
+    now = datetime.utcnow()
+    with sessionmaker(bind=engine)() as db:
+        studies = [
+            models.Study(patient_id=1, radiologist_id=1, modality=models.ModalityEnum.CHEST_XRAY) for _ in range(2)
+        ]
+        db.add_all(studies)
+        db.flush()
+        # The later-stamped finalize commits first; the earlier one is still rendering its PDF.
+        db.add(models.Report(study_id=studies[1].id, findings="Committed first", is_finalized=True, finalized_at=now))
+        db.commit()
+        late_study_id = studies[0].id
+    with engine.connect() as conn:
+        early = report_export.export(conn, "jsonl", deid, lag=60)
+        assert _jsonl(early) == [] and early.watermark is None
+
+    with sessionmaker(bind=engine)() as db:
+        late = models.Report(
+            study_id=late_study_id, findings="Committed late", is_finalized=True, finalized_at=now - timedelta(seconds=1)
+        )
+        db.add(late)
+        db.commit()
+    with engine.connect() as conn:
+        settled = report_export.export(conn, "jsonl", deid, since=early.watermark, lag=0)
+        assert [row["findings"] for row in _jsonl(settled)] == ["Committed late", "Committed first"]
+
+
+def test_deid_policy_parsing_and_key_requirement():
+    assert report_export.parse_deid("nhi=keep,dob=drop")["nhi"] == "keep"
+    assert set(report_export.parse_deid("none").values()) == {"keep"}
+    with pytest.raises(ValueError):
+        report_export.parse_deid("nhi=year")
+    with pytest.raises(ValueError):
+        report_export.parse_deid("address=drop")
+    with pytest.raises(report_export.ExportUnavailable):
+        report_export.Deidentifier(report_export.parse_deid(None), key="")
+    assert report_export.Deidentifier(report_export.parse_deid("none"), key="").apply({"nhi": "X"}) == {"nhi": "X"}
+
+
+def test_parquet_export_writes_one_row_group_per_chunk():
+    pq = pytest.importorskip("pyarrow.parquet")
+    engine = _engine(5)
+    deid = report_export.Deidentifier(report_export.parse_deid("nhi=drop"), key=KEY)
+    with engine.connect() as conn:
+        data = b"".join(report_export.export(conn, "parquet", deid, chunk_size=2).body)
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_rows == 4 and parquet.metadata.num_row_groups == 2
+    table = parquet.read()
+    assert "nhi" not in table.column_names and table.schema.field("dob").type == "int64"
+    assert table.column("impression").to_pylist() == ["Impression 0", "Impression 2", "Impression 3", "Impression 4"]
+
+
+def test_cli_export_advances_watermark_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(cli, "engine", _engine(3))
+    out, state = tmp_path / "reports.jsonl.gz", tmp_path / "state.json"
+    argv = ["export-reports", str(out), "--watermark", str(state), "--deid", "none"]
+    assert cli.main(argv) == 0
+    assert len(gzip.decompress(out.read_bytes()).splitlines()) == 2
+    assert json.loads(state.read_text())["finalized_at"] == "2024-01-01T02:00:00"
+    assert cli.main(argv) == 0
+    assert gzip.decompress(out.read_bytes()) == b""
+    assert cli.main(["export-reports", str(out), "--deid", "nhi=year"]) == 2
@@ -1,6 +1,14 @@
+import hashlib
+import io
+import json
+import os
+import re
+import zipfile
+
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from datetime import datetime, date
 
 from backend.database import Base
@@ -8,10 +16,11 @@ from backend.main import app
 from backend import models
 from backend.auth import get_password_hash, get_current_user
 from backend.database import get_db
+from backend.config import get_settings
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base.metadata.create_all(bind=engine)
 
@@ -93,3 +102,532 @@ def test_draft_report(monkeypatch):
     assert report is not None
     assert report.findings == "Test findings"
     db.close()
+
+
+def _create_study(nhi: str) -> models.Study:
+    db = TestingSessionLocal()
+    user = override_current_user()
+    patient = models.Patient(full_name="Jane Roe", nhi=nhi, dob=date(1980, 5, 5), sex="Female")
+    db.add(patient)
+    db.commit()
+    db.refresh(patient)
+    study = models.Study(
+        patient_id=patient.id,
+        radiologist_id=user.id,
+        modality=models.ModalityEnum.CHEST_XRAY,
+        region="Chest",
+        study_datetime=datetime.utcnow(),
+    )
+    db.add(study)
+    db.commit()
+    db.refresh(study)
+    db.expunge(study)
+    db.close()
+    return study
+
+
+def _finalize(study: models.Study, monkeypatch, tmp_path) -> dict:
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    db = TestingSessionLocal()
+    db.add(models.Report(study_id=study.id, technique="PA view", findings="Clear lungs", impression="Normal"))
+    db.commit()
+    db.close()
+    response = client.post(
+        f"/api/studies/{study.id}/report/finalize",
+        json={"findings": "Clear lungs.", "impression": "Normal chest."},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_download_report_conditional_and_range(monkeypatch, tmp_path):
+    study = _create_study("DLD0001")
+    pdf_url = _finalize(study, monkeypatch, tmp_path)["pdf_url"]
+
+    full = client.get(pdf_url)
+    assert full.status_code == 200
+    assert full.content.startswith(b"%PDF")
+    etag = full.headers["etag"]
+
+    not_modified = client.get(pdf_url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    partial = client.get(pdf_url, headers={"Range": "bytes=0-99"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 0-99/{len(full.content)}"
+    assert partial.content == full.content[:100]
+
+    unsatisfiable = client.get(pdf_url, headers={"Range": f"bytes={len(full.content)}-"})
+    assert unsatisfiable.status_code == 416
+
+
+def test_download_reports_archive_streams_zip(monkeypatch, tmp_path):
+    study = _create_study("ZIP0001")
+    _finalize(study, monkeypatch, tmp_path)
+
+    response = client.get("/api/reports/archive", params={"patient_id": study.patient_id})
+    assert response.status_code == 200, response.text
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        names = archive.namelist()
+        assert len(names) == 1
+        assert archive.read(names[0]).startswith(b"%PDF")
+
+    assert client.get("/api/reports/archive").status_code == 400
+
+
+def test_raw_llm_response_is_stored_compressed_outside_reports(monkeypatch):
+    study = _create_study("RAW0001")
+    raw = {"id": "cmpl-test", "model": "gpt-4o-mini", "usage": {"total_tokens": 42}}
+
+    async def fake_generate(_messages, response_format=None):
+        return {
+            "content": '{"technique":"T","findings":"F","impression":"I","internal_checks":[]}',
+            "raw": raw,
+        }
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", fake_generate)
+    response = client.post(f"/api/studies/{study.id}/report/draft", json={"structured_answers": {"lungs": "Clear"}})
+    assert response.status_code == 200, response.text
+
+    assert "raw_llm_response" not in models.Report.__table__.columns
+    db = TestingSessionLocal()
+    report = db.query(models.Report).filter(models.Report.study_id == study.id).first()
+    stored = db.query(models.ReportLLMResponse).filter(models.ReportLLMResponse.report_id == report.id).one()
+    assert stored.codec == "gzip"
+    db.close()
+
+    audit = client.get(f"/api/reports/{report.id}/llm-response")
+    assert audit.status_code == 200
+    assert audit.json() == raw
+
+
+def test_normal_study_is_drafted_locally_without_llm(monkeypatch):
+    study = _create_study("LOC0001")
+
+    async def failing_generate(_messages, response_format=None):
+        raise AssertionError("LLM should not be called for a normal study")
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", failing_generate)
+    before = client.get("/api/metrics").json()["drafts"]
+    answers = {"lungs": "Clear", "pleura": "No effusion", "heart": "Normal", "mediastinum": "Normal"}
+    response = client.post(f"/api/studies/{study.id}/report/draft", json={"structured_answers": answers})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["source"] == "local"
+    assert data["impression"] == "No acute cardiopulmonary abnormality."
+    assert "The lungs are clear" in data["findings"]
+    after = client.get("/api/metrics").json()["drafts"]
+    assert after["local"] == before["local"] + 1
+
+    abnormal = {"lungs": "Right lower lobe consolidation", "pleura": "Normal", "heart": "Normal", "mediastinum": "Normal"}
+    forced = client.post(
+        f"/api/studies/{study.id}/report/draft", json={"structured_answers": abnormal, "mode": "local"}
+    )
+    assert forced.status_code == 422
+
+
+def test_batch_draft_streams_results_and_saves_all_reports(monkeypatch):
+    studies = [_create_study("BAT0001"), _create_study("BAT0002")]
+
+    async def fake_generate(messages, response_format=None):
+        return {
+            "content": '{"technique":"T","findings":"Batch findings","impression":"I","internal_checks":[]}',
+            "raw": {"id": "cmpl-batch"},
+        }
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", fake_generate)
+    items = [{"study_id": study.id, "structured_answers": {"lungs": "Hazy"}} for study in studies]
+    items.append({"study_id": 999999, "structured_answers": {}})
+    response = client.post("/api/reports/drafts/batch", json={"items": items})
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    by_study = {line["study_id"]: line for line in lines[:-1]}
+    assert {by_study[study.id]["status"] for study in studies} == {"ok"}
+    assert by_study[999999] == {"study_id": 999999, "status": "error", "detail": "Study not found"}
+    assert lines[-1] == {"status": "complete", "saved": 2, "failed": 1}
+
+    db = TestingSessionLocal()
+    saved = db.query(models.Report).filter(models.Report.study_id.in_([s.id for s in studies])).all()
+    assert sorted(r.findings for r in saved) == ["Batch findings", "Batch findings"]
+    db.close()
+
+    duplicate = client.post("/api/reports/drafts/batch", json={"items": items[:1] * 2})
+    assert duplicate.status_code == 400
+
+
+def test_batch_draft_commits_each_study_and_reports_conflicts_per_study(monkeypatch):
+    from sqlalchemy import update
+
+    from backend.routers import reports
+    from backend.services.shared_state import get_shared_state
+
+    studies = [_create_study("BAT0003"), _create_study("BAT0004")]
+
+    async def fake_generate(messages, response_format=None):
+        return {
+            "content": '{"technique":"T","findings":"Batch findings","impression":"I","internal_checks":[]}',
+            "raw": {"id": "cmpl-batch"},
+        }
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", fake_generate)
+    items = [{"study_id": study.id, "structured_answers": {"lungs": "Hazy"}} for study in studies]
+    first = client.post("/api/reports/drafts/batch", json={"items": items[:1]})
+    assert [json.loads(line)["status"] for line in first.text.splitlines()] == ["ok", "complete"]
+
+    save_draft = reports._save_draft
+
+    def concurrent_edit(db, study_id, report, output):
+        if study_id == studies[0].id:
+            # Another writer bumps the version between this session's read and its commit.
+            bump = update(models.Report).where(models.Report.study_id == study_id).values(version=models.Report.version + 1)
+            db.execute(bump.execution_options(synchronize_session=False))
+        return save_draft(db, study_id, report, output)
+
+    monkeypatch.setattr(reports, "_save_draft", concurrent_edit)
+    response = client.post("/api/reports/drafts/batch", json={"items": items})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_study = {line["study_id"]: line for line in lines[:-1]}
+    assert by_study[studies[0].id]["status"] == "error" and "modified concurrently" in by_study[studies[0].id]["detail"]
+    assert by_study[studies[1].id]["status"] == "ok" and by_study[studies[1].id]["draft"]["version"] == 1
+    assert lines[-1] == {"status": "complete", "saved": 1, "failed": 1}
+
+    db = TestingSessionLocal()
+    assert db.query(models.Report).filter(models.Report.study_id == studies[1].id).one().findings == "Batch findings"
+    db.close()
+    state = get_shared_state()
+    for study in studies:
+        token = state.acquire(f"draft:{study.id}", ttl=30)
+        assert token is not None
+        state.release(f"draft:{study.id}", token)
+
+
+def test_draft_is_single_flight_and_rate_limited(monkeypatch):
+    from backend.routers import reports
+    from backend.services.shared_state import get_shared_state
+
+    study = _create_study("LCK0001")
+    answers = {"lungs": "Clear", "pleura": "No effusion", "heart": "Normal", "mediastinum": "Normal"}
+    state = get_shared_state()
+    token = state.acquire(f"draft:{study.id}", ttl=30)
+    try:
+        held = client.post(f"/api/studies/{study.id}/report/draft", json={"structured_answers": answers})
+        assert held.status_code == 409
+    finally:
+        state.release(f"draft:{study.id}", token)
+
+    monkeypatch.setattr(reports.settings, "draft_rate_limit_per_minute", 1)
+    monkeypatch.setattr(state, "hit", lambda key, limit, window: False)
+    limited = client.post(f"/api/studies/{study.id}/report/draft", json={"structured_answers": answers})
+    assert limited.status_code == 429
+
+
+def test_upload_files_use_sharded_layout(monkeypatch, tmp_path):
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    study = _create_study("UPL0001")
+    response = client.post(
+        f"/api/uploads/{study.id}",
+        files=[("files", ("scan.dcm", b"DICM", "application/dicom")), ("files", ("../key.jpg", b"JPG", "image/jpeg"))],
+    )
+    assert response.status_code == 200, response.text
+    stored = response.json()["files"]
+    relative = os.path.relpath(stored[0]["stored_path"], tmp_path).split(os.sep)
+    assert len(relative[0]) == 2 and len(relative[1]) == 2 and relative[2] == str(study.id)
+    assert re.fullmatch(r"scan_[0-9a-f]{12}\.dcm", relative[3])
+    assert os.path.dirname(stored[1]["stored_path"]) == os.path.dirname(stored[0]["stored_path"])
+    with open(stored[1]["stored_path"], "rb") as f:
+        assert f.read() == b"JPG"
+
+    second = client.post(f"/api/uploads/{study.id}", files=[("files", ("later.dcm", b"DICM2", "application/dicom"))])
+    assert second.status_code == 200, second.text
+    paths = [entry["stored_path"] for entry in stored + second.json()["files"]]
+    assert client.get(f"/api/studies/{study.id}").json()["image_paths"] == paths
+
+    listed = client.get(f"/api/uploads/{study.id}").json()
+    assert [(f["filename"], f["file_type"], f["size_bytes"]) for f in listed] == [
+        ("scan.dcm", "dicom", 4),
+        ("key.jpg", "jpg", 3),
+        ("later.dcm", "dicom", 5),
+    ]
+    assert listed[0]["sha256"] == hashlib.sha256(b"DICM").hexdigest()
+
+
+def test_same_file_name_uploads_keep_their_own_objects(monkeypatch, tmp_path):
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    study = _create_study("UPL0002")
+    both = client.post(
+        f"/api/uploads/{study.id}",
+        files=[("files", ("scan.dcm", b"ONE", "application/dicom")), ("files", ("scan.dcm", b"TWO!", "application/dicom"))],
+    )
+    assert both.status_code == 200, both.text
+    again = client.post(f"/api/uploads/{study.id}", files=[("files", ("scan.dcm", b"THREE", "application/dicom"))])
+    assert again.status_code == 200, again.text
+
+    stored = both.json()["files"] + again.json()["files"]
+    assert len({entry["stored_path"] for entry in stored}) == 3
+    for entry, content in zip(stored, (b"ONE", b"TWO!", b"THREE")):
+        with open(entry["stored_path"], "rb") as f:
+            assert f.read() == content
+        assert entry["sha256"] == hashlib.sha256(content).hexdigest()
+    listed = client.get(f"/api/uploads/{study.id}").json()
+    assert [(f["filename"], f["size_bytes"]) for f in listed] == [("scan.dcm", 3), ("scan.dcm", 4), ("scan.dcm", 5)]
+
+
+def test_finalize_is_idempotent_and_version_checked(monkeypatch, tmp_path):
+    from backend.services import pdf_generator
+
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    renders = []
+    real_render = pdf_generator.render_report_pdf
+
+    def counting_render(*args):
+        renders.append(args)
+        return real_render(*args)
+
+    monkeypatch.setattr(pdf_generator, "render_report_pdf", counting_render)
+    study = _create_study("IDM0001")
+    db = TestingSessionLocal()
+    db.add(models.Report(study_id=study.id, technique="PA view", findings="Draft", impression="Draft"))
+    db.commit()
+    db.close()
+    version = client.get(f"/api/studies/{study.id}/report").json()["version"]
+
+    url = f"/api/studies/{study.id}/report/finalize"
+    body = {"findings": "Clear lungs.", "impression": "Normal chest.", "version": version}
+    first = client.post(url, json=body, headers={"Idempotency-Key": "fin-1"})
+    assert first.status_code == 200, first.text
+    retry = client.post(url, json=body, headers={"Idempotency-Key": "fin-1"})
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(renders) == 1
+
+    reused = client.post(url, json={**body, "impression": "Other"}, headers={"Idempotency-Key": "fin-1"})
+    assert reused.status_code == 422
+
+    stale = client.post(url, json={**body, "impression": "Changed"})
+    assert stale.status_code == 409
+    assert first.json()["version"] == version + 1
+
+    unchanged = client.post(url, json={**body, "version": version + 1})
+    assert unchanged.json() == first.json()
+    assert len(renders) == 1
+
+
+def test_search_finalized_reports(monkeypatch, tmp_path):
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    studies = [_create_study(f"FTS000{n}") for n in range(3)]
+    texts = [
+        ("Small pneumothorax zebrafinding at the right apex <img src=x onerror=alert(1)>.", "Right apical pneumothorax."),
+        ("Lungs clear.", "No pneumothorax. Zebrafinding excluded."),
+        ("Zebrafinding draft only.", "Draft."),
+    ]
+    db = TestingSessionLocal()
+    for study, (findings, impression) in zip(studies, texts):
+        db.add(models.Report(study_id=study.id, findings="draft", impression="draft"))
+    db.commit()
+    db.close()
+    for study, (findings, impression) in list(zip(studies, texts))[:2]:
+        response = client.post(
+            f"/api/studies/{study.id}/report/finalize", json={"findings": findings, "impression": impression}
+        )
+        assert response.status_code == 200, response.text
+
+    page = client.get("/api/reports/search", params={"q": "zebrafinding pneumothorax"}).json()
+    assert {hit["study_id"] for hit in page["items"]} == {studies[0].id, studies[1].id}
+    ranks = [hit["rank"] for hit in page["items"]]
+    assert ranks == sorted(ranks, reverse=True)
+    assert "<mark>" in page["items"][0]["snippet"]
+    snippets = {hit["study_id"]: hit["snippet"] for hit in page["items"]}
+    assert "<img" not in snippets[studies[0].id] and "&lt;img src=x" in snippets[studies[0].id]
+    assert page["has_more"] is False
+
+    first = client.get("/api/reports/search", params={"q": "zebrafinding", "page_size": 1}).json()
+    assert len(first["items"]) == 1 and first["has_more"] is True
+
+    assert client.get("/api/reports/search", params={"q": "zebrafinding", "modality": "ABDOMINAL_CT"}).json()["items"] == []
+    later = client.get("/api/reports/search", params={"q": "zebrafinding", "date_from": "2999-01-01"}).json()
+    assert later["items"] == []
+    assert client.get("/api/reports/search", params={"q": 'zebrafinding" OR *'}).status_code == 200
+
+
+def test_draft_prompt_includes_prefetched_prior_reports(monkeypatch, tmp_path):
+    from backend.services import metrics, prior_studies
+    from backend.services.shared_state import get_shared_state
+
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    older = _create_study("PRI0001")
+    db = TestingSessionLocal()
+    current = models.Study(
+        patient_id=older.patient_id,
+        radiologist_id=older.radiologist_id,
+        modality=models.ModalityEnum.CHEST_XRAY,
+        study_datetime=datetime(2999, 1, 1),
+    )
+    db.add(current)
+    db.add(models.Report(study_id=older.id, findings="draft", impression="draft"))
+    db.commit()
+    db.refresh(current)
+    db.close()
+    client.post(f"/api/studies/{older.id}/report/finalize", json={"findings": "Clear.", "impression": "Stable 4 mm nodule."})
+
+    key = f"priors:{older.patient_id}:CHEST_XRAY"
+    assert get_shared_state().get(key) is None
+    assert client.get(f"/api/studies/{current.id}").status_code == 200
+    assert [entry["study_id"] for entry in get_shared_state().get(key)] == [older.id]
+
+    prompts = []
+
+    async def fake_generate(messages, response_format=None):
+        prompts.append(messages[1]["content"])
+        return {"content": '{"technique":"PA","findings":"Clear.","impression":"Nodule unchanged."}', "raw": {}}
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", fake_generate)
+    hits = metrics.snapshot().get("priors.cache_hit", 0)
+    payload = {"structured_answers": {"lungs": "Nodule"}, "mode": "llm"}
+    assert client.post(f"/api/studies/{current.id}/report/draft", json=payload).status_code == 200
+    assert metrics.snapshot()["priors.cache_hit"] == hits + 1
+    assert f"- {older.study_datetime.date().isoformat()}: Stable 4 mm nodule." in prompts[0]
+
+    client.post(f"/api/studies/{current.id}/report/finalize", json={"findings": "Clear.", "impression": "Unchanged."})
+    assert get_shared_state().get(key) is None
+    with TestingSessionLocal() as session:
+        assert prior_studies.get_priors(session, older) == []
+
+
+def test_older_study_gets_priors_beyond_the_cached_entry(monkeypatch):
+    from backend.services import metrics, prior_studies
+
+    monkeypatch.setattr(get_settings(), "prior_reports_limit", 1)
+    monkeypatch.setattr(get_settings(), "prior_cache_depth", 2)
+    first = _create_study("PRI0002")
+    db = TestingSessionLocal()
+    studies = [db.get(models.Study, first.id)]
+    studies[0].study_datetime = datetime(2020, 1, 1)
+    for year in (2021, 2022, 2023):
+        study = models.Study(
+            patient_id=first.patient_id,
+            radiologist_id=first.radiologist_id,
+            modality=models.ModalityEnum.CHEST_XRAY,
+            study_datetime=datetime(year, 1, 1),
+        )
+        db.add(study)
+        db.flush()
+        studies.append(study)
+    for study in studies:
+        db.add(models.Report(study_id=study.id, impression=f"Impression {study.study_datetime.year}", is_finalized=True))
+    db.commit()
+    _, older, newer, newest = studies
+
+    assert [p.study_id for p in prior_studies.get_priors(db, newest)] == [newer.id]
+    # The cached entry now holds 2023 and 2022 only; drafting 2021 must still find 2020.
+    loads = metrics.snapshot().get("priors.deep_load", 0)
+    prompts = []
+
+    async def fake_generate(messages, response_format=None):
+        prompts.append(messages[1]["content"])
+        return {"content": '{"technique":"PA","findings":"Clear.","impression":"Stable."}', "raw": {}}
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", fake_generate)
+    payload = {"structured_answers": {"lungs": "Nodule"}, "mode": "llm"}
+    assert client.post(f"/api/studies/{older.id}/report/draft", json=payload).status_code == 200
+    assert "- 2020-01-01: Impression 2020" in prompts[0] and "2022" not in prompts[0]
+    assert metrics.snapshot()["priors.deep_load"] == loads + 1
+    db.close()
+
+
+def test_lean_list_endpoints_match_read_schemas():
+    from fastapi.encoders import jsonable_encoder
+
+    from backend import queries, schemas
+
+    study = _create_study("LEAN001")
+    db = TestingSessionLocal()
+    db.add_all(
+        models.StudyFile(study_id=study.id, filename=f"{n}.dcm", location=f"ab/cd/{study.id}/{n}.dcm", size_bytes=n)
+        for n in range(3)
+    )
+    db.commit()
+    expected_studies = [
+        jsonable_encoder(schemas.StudyRead.from_orm(s))
+        for s in queries.study_read_query(db).filter(models.Study.patient_id == study.patient_id)
+    ]
+    expected_files = [
+        jsonable_encoder(schemas.StudyFileRead.from_orm(f))
+        for f in db.query(models.StudyFile).filter(models.StudyFile.study_id == study.id).order_by(models.StudyFile.id)
+    ]
+    expected_patient = jsonable_encoder(schemas.PatientRead.from_orm(db.get(models.Patient, study.patient_id)))
+    db.close()
+
+    studies = client.get("/api/studies", params={"patient_id": study.patient_id})
+    assert studies.headers["content-type"] == "application/json"
+    assert studies.json() == expected_studies
+    assert studies.json()[0]["image_paths"] == [f"ab/cd/{study.id}/{n}.dcm" for n in range(3)]
+    assert client.get(f"/api/uploads/{study.id}").json() == expected_files
+    assert client.get("/api/patients", params={"search": "LEAN001"}).json() == [expected_patient]
+
+
+def test_turnaround_analytics_follow_the_report_workflow(monkeypatch, tmp_path):
+    monkeypatch.setattr(get_settings(), "upload_dir", str(tmp_path))
+    params = {"group_by": ["modality", "radiologist_id"], "modality": "ABDOMINAL_CT"}
+
+    def totals():
+        rows = client.get("/api/analytics/turnaround", params=params)
+        assert rows.status_code == 200, rows.text
+        return {key: sum(row[key] for row in rows.json()) for key in ("studies_created", "drafted", "finalized")}
+
+    before = totals()
+    patient = client.post("/api/patients", json={"full_name": "Ana Lytics", "nhi": "ANA0002"}).json()
+    study = client.post("/api/studies", json={"patient_id": patient["id"], "modality": "ABDOMINAL_CT"}).json()
+
+    async def fake_generate(_messages, response_format=None):
+        return {"content": '{"technique":"CT","findings":"Normal.","impression":"Normal."}', "raw": {}}
+
+    monkeypatch.setattr("backend.services.report_builder.generate_chat_completion", fake_generate)
+    draft = {"structured_answers": {"liver": "Normal"}, "mode": "llm"}
+    assert client.post(f"/api/studies/{study['id']}/report/draft", json=draft).status_code == 200
+    assert client.post(f"/api/studies/{study['id']}/report/draft", json=draft).status_code == 200
+    finalize = {"findings": "Normal.", "impression": "Normal."}
+    assert client.post(f"/api/studies/{study['id']}/report/finalize", json=finalize).status_code == 200
+    assert client.post(f"/api/studies/{study['id']}/report/finalize", json={**finalize, "impression": "Edited."}).status_code == 200
+
+    after = totals()
+    assert {key: after[key] - before[key] for key in after} == {"studies_created": 1, "drafted": 1, "finalized": 1}
+    rows = client.get("/api/analytics/turnaround", params={**params, "group_by": "day"}).json()
+    assert all(row["modality"] is None and row["day"] for row in rows)
+    assert client.get("/api/analytics/turnaround", params={"group_by": "patient_id"}).status_code == 422
+
+
+def test_export_endpoint_streams_gzipped_jsonl_with_watermark(monkeypatch, tmp_path):
+    import gzip
+
+    study = _create_study("EXPAPI1")
+    _finalize(study, monkeypatch, tmp_path)
+    monkeypatch.setattr(get_settings(), "export_pseudonym_key", "")
+    assert client.get("/api/reports/export").status_code == 501
+
+    monkeypatch.setattr(get_settings(), "export_pseudonym_key", "k")
+    assert client.get("/api/reports/export", params={"deid": "none"}).status_code == 403
+    # Just finalized, so inside the watermark lag until it is switched off.
+    assert gzip.decompress(client.get("/api/reports/export").content) == b""
+    monkeypatch.setattr(get_settings(), "export_watermark_lag_seconds", 0)
+    response = client.get("/api/reports/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    rows = [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+    assert rows[-1]["study_id"] == study.id and "full_name" not in rows[-1]
+    mark = {"since": response.headers["x-export-watermark"], "since_report_id": response.headers["x-export-watermark-report-id"]}
+    assert int(mark["since_report_id"]) == rows[-1]["report_id"]
+    assert gzip.decompress(client.get("/api/reports/export", params=mark).content) == b""
+
+
+def test_patient_import_returns_error_file_url(monkeypatch, tmp_path):
+    monkeypatch.setattr("backend.routers.patients.settings.upload_dir", str(tmp_path))
+    feed = b"full_name,nhi,dob\nGood Row,IMP0001,1980-01-01\nBad Row,IMP0002,not-a-date\n"
+    result = client.post("/api/patients/import", files={"file": ("patients.csv", feed, "text/csv")}).json()
+    assert (result["upserted"], result["failed"]) == (1, 1)
+    assert result["error_file"].startswith("/api/patients/import/errors/")
+    assert str(tmp_path) not in result["error_file"]
+    download = client.get(result["error_file"])
+    assert download.status_code == 200 and "Bad Row" in download.text
+    assert client.get("/api/patients/import/errors/..%2F..%2Fetc").status_code in (404, 422)
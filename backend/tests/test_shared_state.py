@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from backend.services.shared_state import MemoryState, SQLiteState, create_state
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    if request.param == "memory":
+        return MemoryState()
+    return SQLiteState(str(tmp_path / "state.db"))
+
+
+def test_values_and_counters(state):
+    state.set("cache:a", {"x": 1})
+    assert state.get("cache:a") == {"x": 1}
+    state.delete("cache:a")
+    assert state.get("cache:a") is None
+
+    assert state.incr("metrics:drafts") == 1
+    assert state.incr("metrics:drafts", 2) == 3
+    state.incr("other:count")
+    assert state.counters("metrics:") == {"metrics:drafts": 3}
+
+
+def test_ttl_expires_values(state):
+    state.set("short", "v", ttl=0.05)
+    state.incr("counter", ttl=0.05)
+    time.sleep(0.1)
+    assert state.get("short") is None
+    assert state.incr("counter") == 1
+
+
+def test_lock_is_exclusive_until_released(state):
+    token = state.acquire("draft:1", ttl=30)
+    assert token
+    assert state.acquire("draft:1", ttl=30) is None
+    state.release("draft:1", "not-the-owner")
+    assert state.acquire("draft:1", ttl=30) is None
+    state.release("draft:1", token)
+    assert state.acquire("draft:1", ttl=30)
+
+
+def test_lock_expires(state):
+    assert state.acquire("draft:2", ttl=0.05)
+    time.sleep(0.1)
+    assert state.acquire("draft:2", ttl=30)
+
+
+def test_rate_limit(state):
+    assert [state.hit("drafts:7", limit=2, window=60) for _ in range(3)] == [True, True, False]
+    assert state.hit("drafts:8", limit=2, window=60)
+
+
+def test_sqlite_state_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = SQLiteState(path), SQLiteState(path)
+    assert first.acquire("draft:1", ttl=30)
+    assert second.acquire("draft:1", ttl=30) is None
+    first.incr("metrics:x")
+    assert second.counters("metrics:") == {"metrics:x": 1}
+
+
+def test_create_state_rejects_unknown_scheme():
+    assert create_state("memory://").shared_across_processes is False
+    with pytest.raises(ValueError):
+        create_state("memcached://localhost")
+
+
+def test_backends_must_implement_the_whole_interface():
+    from backend.services.shared_state import SharedState
+
+    class Partial(SharedState):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
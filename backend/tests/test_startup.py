@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from backend import main
+from backend.benchmarks.import_time import LAZY_MODULES
+
+client = TestClient(main.app)
+
+
+def test_heavy_modules_are_not_imported_at_startup():
+    probe = "import sys, backend.main; print(' '.join(m for m in %r if m in sys.modules))" % (LAZY_MODULES,)
+    output = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == ""
+
+
+def test_liveness_and_readiness(monkeypatch):
+    monkeypatch.setattr(main, "engine", create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool))
+    assert client.get("/api/health/live").json() == {"status": "ok"}
+
+    monkeypatch.setattr(main.app.state, "ready", False)
+    not_ready = client.get("/api/health/ready")
+    assert not_ready.status_code == 503
+    assert not_ready.json()["checks"] == {"startup": False, "database": True, "shared_state": True}
+
+    monkeypatch.setattr(main.app.state, "ready", True)
+    assert client.get("/api/health/ready").status_code == 200
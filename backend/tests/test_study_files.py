@@ -0,0 +1,38 @@
+import json
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import queries
+from backend.database import Base
+from backend.services.study_files import migrate_image_paths_column
+
+
+def test_legacy_image_paths_column_is_moved_into_study_files():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    assert migrate_image_paths_column(engine) == 0
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE studies ADD COLUMN image_paths JSON"))
+        conn.execute(text("INSERT INTO users (id, email, full_name, hashed_password, role) VALUES (1, 'u@x', 'U', 'x', 'radiologist')"))
+        conn.execute(text("INSERT INTO patients (id, full_name, nhi) VALUES (1, 'P', 'SF00001')"))
+        for study_id, paths in ((1, ["./uploads/1/a.dcm", "./uploads/1/b.png"]), (2, []), (3, None)):
+            conn.execute(
+                text(
+                    "INSERT INTO studies (id, patient_id, radiologist_id, modality, image_paths) "
+                    "VALUES (:id, 1, 1, 'CHEST_XRAY', :paths)"
+                ),
+                {"id": study_id, "paths": json.dumps(paths) if paths is not None else None},
+            )
+
+    assert migrate_image_paths_column(engine, batch_size=1) == 2
+    assert migrate_image_paths_column(engine) == 0
+
+    db = sessionmaker(bind=engine)()
+    studies = {study.id: study for study in queries.study_read_query(db).all()}
+    assert studies[1].image_paths == ["./uploads/1/a.dcm", "./uploads/1/b.png"]
+    assert [f.file_type for f in studies[1].files] == ["dicom", "png"]
+    assert studies[2].image_paths == [] and studies[3].image_paths == []
+    db.close()
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import StaticPool
+
+from backend import models
+from backend.database import Base
+from backend.services.versioning import add_version_columns
+
+
+def _engine():
+    return create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+
+def test_concurrent_report_updates_compare_and_swap():
+    engine = _engine()
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as setup:
+        user = models.User(email="v@example.com", full_name="V", hashed_password="x", role="radiologist")
+        patient = models.Patient(full_name="P", nhi="VER0001")
+        setup.add_all([user, patient])
+        setup.flush()
+        study = models.Study(patient_id=patient.id, radiologist_id=user.id, modality=models.ModalityEnum.CHEST_XRAY)
+        setup.add(study)
+        setup.flush()
+        setup.add(models.Report(study_id=study.id, findings="v1"))
+        setup.commit()
+
+    first, second = Session(), Session()
+    mine, theirs = first.query(models.Report).one(), second.query(models.Report).one()
+    assert mine.version == theirs.version == 1
+    mine.findings = "first writer"
+    first.commit()
+    theirs.findings = "second writer"
+    with pytest.raises(StaleDataError):
+        second.commit()
+    second.rollback()
+    assert second.query(models.Report).one().findings == "first writer"
+    assert second.query(models.Report).one().version == 2
+    first.close()
+    second.close()
+
+
+def test_add_version_columns_upgrades_existing_tables():
+    engine = _engine()
+    Base.metadata.create_all(bind=engine)
+    assert add_version_columns(engine) == 0
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE reports DROP COLUMN version"))
+    assert add_version_columns(engine) == 1
+    assert "version" in {col["name"] for col in inspect(engine).get_columns("reports")}